@@ -9,9 +9,18 @@ from typing import Dict, Optional
 from urllib.parse import urlparse
 
 from .error import UpgradeError
+from .estimate import Estimator, format_estimates
+from .fleet import DbpwFleetStrategy
+from .metrics import Metrics
+from .progress import ProgressTracker
+from .scheduling import parse_deadline
 from .pg_connection import PgConnection
+from .pools import ConnectionPools
 from .sqlite_connection import SqliteConnection
+from .sqlite_ranges import DbpwRangesStrategy
 from .strategies import DbpwStrategy, MwstAsProfilesStrategy, MwstAsStoresStrategy
+from .tuning import AutoTuner
+from .work_queue import WorkQueue
 
 
 def config():
@@ -20,7 +29,7 @@ def config():
     parser.add_argument(
         "--strategy",
         required=True,
-        choices=["dbpw", "mwst-as-profiles", "mwst-as-stores"],
+        choices=["dbpw", "dbpw-fleet", "mwst-as-profiles", "mwst-as-stores"],
         help=(
             "Specify migration strategy depending on database type, wallet "
             "management mode, and agent type."
@@ -83,12 +92,237 @@ def config():
             "as stores (mwst-as-stores) strategy."
         ),
     )
+    parser.add_argument(
+        "--fleet-workers",
+        type=int,
+        help=(
+            "Specify the number of processes migrating wallets concurrently "
+            "with the dbpw-fleet strategy. Defaults to the number of CPUs."
+        ),
+    )
     parser.add_argument(
         "--batch-size",
         type=int,
         default=50,
         help=("Specify number of items to process in each batch."),
     )
+    parser.add_argument(
+        "--max-batch-bytes",
+        type=int,
+        help=(
+            "Specify the largest total size in bytes of item values to process "
+            "in each batch, in addition to the --batch-size row limit. A batch "
+            "always holds at least one item."
+        ),
+    )
+    parser.add_argument(
+        "--auto-tune",
+        action="store_true",
+        help=(
+            "Adjust the batch size and crypto concurrency during the migration "
+            "based on measured batch latency, starting from --batch-size."
+        ),
+    )
+    parser.add_argument(
+        "--min-batch-size",
+        type=int,
+        default=10,
+        help=("Specify the smallest batch size the auto-tuner may choose."),
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=1000,
+        help=("Specify the largest batch size the auto-tuner may choose."),
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        help=(
+            "Specify the largest number of crypto worker threads the "
+            "auto-tuner may use. Defaults to the number of CPUs."
+        ),
+    )
+    parser.add_argument(
+        "--cursor-prefetch",
+        type=int,
+        help=(
+            "Stream items from a Postgres source through a single server-side "
+            "cursor per wallet, prefetching this many rows at a time, instead "
+            "of re-running the fetch query for every batch."
+        ),
+    )
+    parser.add_argument(
+        "--readers",
+        type=int,
+        default=1,
+        help=(
+            "Specify the number of ranges of item ids of a dbpw wallet to "
+            "migrate in parallel. Postgres ranges are read from one exported "
+            "snapshot, each over its own connections. SQLite ranges are "
+            "converted by worker processes from the read-only wallet, then "
+            "merged."
+        ),
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help=(
+            "Rewrite each migrated SQLite wallet into a defragmented copy "
+            "without the pages freed by the migration, with VACUUM INTO, and "
+            "swap it in. Only valid for the dbpw and dbpw-fleet strategies."
+        ),
+    )
+    parser.add_argument(
+        "--optimize-layout",
+        action="store_true",
+        help=(
+            "Once each Postgres database is migrated, cluster its items by "
+            "profile, kind and category and its tags by item, and analyze "
+            "them, then report the table and index sizes."
+        ),
+    )
+    parser.add_argument(
+        "--vacuum-source",
+        action="store_true",
+        help=(
+            "Vacuum the MultiWalletSingleTable Indy database once its wallets "
+            "are migrated, unless it is deleted, and report its sizes."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help=(
+            "Write a JSON report of row, byte and timing metrics per stage, "
+            "wallet and Askar category to this file when the migration ends."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help=(
+            "Serve metrics in the Prometheus text format on "
+            "http://127.0.0.1:<port>/metrics while the migration runs."
+        ),
+    )
+    parser.add_argument(
+        "--progress",
+        choices=["text", "ndjson"],
+        help=(
+            "Report progress on stderr with item totals, rolling items per "
+            "second and ETA per wallet and overall, either as text or as one "
+            "JSON object per line."
+        ),
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=1.0,
+        help=("Specify the least number of seconds between progress reports."),
+    )
+    parser.add_argument(
+        "--wallet-workers",
+        type=int,
+        default=1,
+        help=(
+            "Specify the number of wallets migrated concurrently by the "
+            "MultiWalletSingleTable strategies. Wallets are started largest "
+            "first, by item and byte counts."
+        ),
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help=(
+            "Specify the maximum number of connections kept open to each "
+            "database by the MultiWalletSingleTable strategies, shared by "
+            "every wallet and phase, and by Askar. Defaults to twice "
+            "--wallet-workers plus one."
+        ),
+    )
+    parser.add_argument(
+        "--preflight-workers",
+        type=int,
+        help=(
+            "Specify the number of wallet keys checked concurrently before the "
+            "migration starts. Defaults to the number of CPUs. Each check uses "
+            "up to 256 MiB of memory for key derivation."
+        ),
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help=(
+            "Do not migrate. Count the items, tags and bytes of each wallet, "
+            "time key derivation, crypto and writes on a sample of items, and "
+            "report the projected duration, target disk space and peak memory "
+            "per strategy. Nothing is modified."
+        ),
+    )
+    parser.add_argument(
+        "--estimate-sample",
+        type=int,
+        default=200,
+        help=("Specify the number of items per wallet sampled by --dry-run."),
+    )
+    parser.add_argument(
+        "--deadline",
+        help=(
+            "Specify when the MultiWalletSingleTable strategies must be done, "
+            "as HH:MM (next occurrence, local time) or an ISO 8601 date and "
+            "time. Only wallets expected to finish by then are started; the "
+            "others are left untouched for a later run."
+        ),
+    )
+    parser.add_argument(
+        "--deferred-file",
+        help=(
+            "Specify a file to write the keys of the wallets left by "
+            "--deadline to, for use with --wallet-keys-file and "
+            "--allow-missing-wallet in the next run. Only valid for the "
+            "mwst-as-stores strategy."
+        ),
+    )
+    parser.add_argument(
+        "--live",
+        choices=["copy", "sync", "cutover"],
+        help=(
+            "Migrate in phases while the agent keeps running, with the "
+            "mwst-as-stores strategy. copy records changes to the Indy wallets "
+            "and copies every wallet without modifying them, sync applies the "
+            "changes recorded since, and cutover, run with the agent stopped, "
+            "applies the last changes and completes the migration."
+        ),
+    )
+    parser.add_argument(
+        "--work-queue",
+        help=(
+            "Specify the URI of a Postgres database, created if missing, "
+            "holding a work queue shared by any number of processes migrating "
+            "the same MultiWalletSingleTable database, on any hosts. Each "
+            "claims wallets from the queue, and wallets of processes that stop "
+            "are claimed again by the others."
+        ),
+    )
+    parser.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        default=10.0,
+        help=(
+            "Specify the number of seconds between the heartbeats a "
+            "--work-queue worker records for the wallets it holds."
+        ),
+    )
+    parser.add_argument(
+        "--claim-timeout",
+        type=float,
+        default=60.0,
+        help=(
+            "Specify the number of seconds without a heartbeat after which "
+            "a wallet in the --work-queue is claimed by another worker."
+        ),
+    )
     parser.add_argument(
         "--allow-missing-wallet",
         action="store_true",
@@ -135,10 +369,76 @@ def config():
         if not args.wallet_keys and not args.wallet_keys_file:
             raise ValueError("Wallet keys required for mwst-as-stores strategy")
 
+    if args.strategy == "dbpw-fleet":
+        if not args.wallet_keys and not args.wallet_keys_file:
+            raise ValueError("Wallet keys required for dbpw-fleet strategy")
+        if args.dry_run or args.metrics_file or args.metrics_port:
+            raise ValueError("Dry run and metrics not supported by dbpw-fleet strategy")
+        if args.wallet_workers != 1 or args.preflight_workers:
+            raise ValueError(
+                "Wallet and preflight workers not supported by dbpw-fleet strategy, "
+                "use fleet workers"
+            )
+        if args.cursor_prefetch:
+            raise ValueError("Cursor prefetch not supported by dbpw-fleet strategy")
+
     parsed = urlparse(args.uri)
     if parsed.scheme not in ("sqlite", "postgres"):
         raise ValueError("URI scheme must be one of: sqlite, postgres")
 
+    if args.deadline:
+        if args.strategy in ("dbpw", "dbpw-fleet"):
+            raise ValueError("Deadline only valid for MultiWalletSingleTable")
+        if args.work_queue:
+            raise ValueError("Deadline not supported with a work queue")
+        parse_deadline(args.deadline)
+    if args.deferred_file and args.strategy != "mwst-as-stores":
+        raise ValueError("Deferred file only valid for mwst-as-stores strategy")
+
+    if args.live:
+        if args.strategy != "mwst-as-stores":
+            raise ValueError("Live migration only valid for mwst-as-stores strategy")
+        if args.work_queue or args.deadline:
+            raise ValueError(
+                "Live migration not supported with a work queue or a deadline"
+            )
+
+    if args.readers > 1:
+        if args.strategy != "dbpw":
+            raise ValueError("Parallel readers only valid for dbpw strategy")
+        if parsed.scheme == "sqlite" and (
+            args.dry_run or args.metrics_file or args.metrics_port
+        ):
+            raise ValueError(
+                "Dry run and metrics not supported by parallel SQLite readers"
+            )
+
+    if args.compact and (
+        args.strategy not in ("dbpw", "dbpw-fleet") or parsed.scheme != "sqlite"
+    ):
+        raise ValueError("Compact only valid for dbpw and dbpw-fleet on SQLite")
+
+    if args.optimize_layout and parsed.scheme != "postgres":
+        raise ValueError("Layout optimization only valid for Postgres")
+    if args.vacuum_source and args.strategy not in (
+        "mwst-as-profiles",
+        "mwst-as-stores",
+    ):
+        raise ValueError("Vacuum of the source only valid for MultiWalletSingleTable")
+
+    if args.pool_size is not None:
+        if args.strategy not in ("mwst-as-profiles", "mwst-as-stores"):
+            raise ValueError("Pool size only valid for MultiWalletSingleTable")
+        # Each wallet worker holds up to two source connections at once
+        if args.pool_size < 2 * args.wallet_workers:
+            raise ValueError("Pool size must be at least twice the wallet workers")
+
+    if args.work_queue:
+        if args.strategy in ("dbpw", "dbpw-fleet"):
+            raise ValueError("Work queue only valid for MultiWalletSingleTable")
+        if urlparse(args.work_queue).scheme != "postgres":
+            raise ValueError("Work queue URI scheme must be postgres")
+
     return args
 
 
@@ -155,9 +455,52 @@ async def main(
     allow_missing_wallet: Optional[bool] = False,
     delete_indy_wallets: Optional[bool] = False,
     skip_confirmation: Optional[bool] = False,
+    cursor_prefetch: Optional[int] = None,
+    auto_tune: Optional[bool] = False,
+    min_batch_size: int = 10,
+    max_batch_size: int = 1000,
+    max_concurrency: Optional[int] = None,
+    max_batch_bytes: Optional[int] = None,
+    metrics_file: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    progress: Optional[str] = None,
+    progress_interval: float = 1.0,
+    preflight_workers: Optional[int] = None,
+    wallet_workers: int = 1,
+    dry_run: Optional[bool] = False,
+    estimate_sample: int = 200,
+    work_queue: Optional[str] = None,
+    heartbeat_interval: float = 10.0,
+    claim_timeout: float = 60.0,
+    deadline: Optional[str] = None,
+    deferred_file: Optional[str] = None,
+    live: Optional[str] = None,
+    fleet_workers: Optional[int] = None,
+    readers: int = 1,
+    compact: Optional[bool] = False,
+    optimize_layout: Optional[bool] = False,
+    vacuum_source: Optional[bool] = False,
+    pool_size: Optional[int] = None,
 ):
     logging.basicConfig(level=logging.WARN)
     parsed = urlparse(uri)
+    queue = (
+        WorkQueue(work_queue, heartbeat_interval, claim_timeout) if work_queue else None
+    )
+    deadline_ts = parse_deadline(deadline) if deadline else None
+    metrics = Metrics() if metrics_file or metrics_port else None
+    tracker = ProgressTracker(progress, progress_interval) if progress else None
+    pools = (
+        ConnectionPools(pool_size or 2 * wallet_workers + 1)
+        if strategy in ("mwst-as-profiles", "mwst-as-stores") and not dry_run
+        else None
+    )
+
+    tuner = (
+        AutoTuner(batch_size, min_batch_size, max_batch_size, max_concurrency)
+        if auto_tune
+        else None
+    )
 
     if strategy == "dbpw":
         if parsed.scheme == "sqlite":
@@ -170,8 +513,55 @@ async def main(
             raise ValueError("Wallet name required for dbpw strategy")
         if not wallet_key:
             raise ValueError("Wallet key required for dbpw strategy")
+        if queue:
+            raise ValueError("Work queue only valid for MultiWalletSingleTable")
+
+        strategy_class = (
+            DbpwRangesStrategy
+            if readers > 1 and parsed.scheme == "sqlite"
+            else DbpwStrategy
+        )
+        strategy_inst = strategy_class(
+            conn,
+            wallet_name,
+            wallet_key,
+            batch_size,
+            readers,
+            compact,
+            cursor_prefetch=cursor_prefetch,
+            tuner=tuner,
+            max_batch_bytes=max_batch_bytes,
+            metrics=metrics,
+            progress=tracker,
+            preflight_workers=preflight_workers,
+            optimize_layout=optimize_layout,
+        )
+
+    elif strategy == "dbpw-fleet":
+        if parsed.scheme != "sqlite":
+            raise ValueError("dbpw-fleet strategy only valid for SQLite")
+        if wallet_keys_file:
+            with open(wallet_keys_file, "r") as wkf:
+                wallet_keys = json.load(wkf)
 
-        strategy_inst = DbpwStrategy(conn, wallet_name, wallet_key, batch_size)
+        if not wallet_keys:
+            raise ValueError("Wallet keys required for dbpw-fleet strategy")
+        if queue or deadline_ts:
+            raise ValueError(
+                "Work queue and deadline only valid for MultiWalletSingleTable"
+            )
+
+        strategy_inst = DbpwFleetStrategy(
+            uri,
+            wallet_keys,
+            batch_size,
+            fleet_workers,
+            allow_missing_wallet,
+            compact,
+            tuner=tuner,
+            max_batch_bytes=max_batch_bytes,
+            progress=tracker,
+        )
 
     elif strategy == "mwst-as-profiles":
         if parsed.scheme != "postgres":
@@ -189,6 +579,18 @@ async def main(
             batch_size,
             delete_indy_wallets,
             skip_confirmation,
+            cursor_prefetch=cursor_prefetch,
+            tuner=tuner,
+            max_batch_bytes=max_batch_bytes,
+            metrics=metrics,
+            progress=tracker,
+            preflight_workers=preflight_workers,
+            wallet_workers=wallet_workers,
+            work_queue=queue,
+            deadline=deadline_ts,
+            optimize_layout=optimize_layout,
+            vacuum_source=vacuum_source,
+            pools=pools,
         )
 
     elif strategy == "mwst-as-stores":
@@ -208,12 +610,43 @@ async def main(
             allow_missing_wallet,
             delete_indy_wallets,
             skip_confirmation,
+            cursor_prefetch=cursor_prefetch,
+            tuner=tuner,
+            max_batch_bytes=max_batch_bytes,
+            metrics=metrics,
+            progress=tracker,
+            preflight_workers=preflight_workers,
+            wallet_workers=wallet_workers,
+            work_queue=queue,
+            deadline=deadline_ts,
+            deferred_file=deferred_file,
+            live=live,
+            optimize_layout=optimize_layout,
+            vacuum_source=vacuum_source,
+            pools=pools,
         )
 
     else:
         raise UpgradeError("Invalid strategy")
 
-    await strategy_inst.run()
+    if dry_run:
+        timings, estimates = await Estimator(strategy_inst, estimate_sample).run()
+        print(format_estimates(timings, estimates))
+        return
+
+    try:
+        if metrics_port:
+            async with metrics.serve(metrics_port):
+                await strategy_inst.run()
+        else:
+            await strategy_inst.run()
+    finally:
+        if pools:
+            await pools.close()
+        if tracker:
+            tracker.finish()
+        if metrics_file:
+            metrics.write_json(metrics_file)
 
 
 def entrypoint():
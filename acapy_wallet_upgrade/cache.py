@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with hit and miss counters."""
+
+    def __init__(self, max_size: int = 4096):
+        """Initialize an LRUCache instance."""
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Return the cached value for key, counting the lookup."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: bytes):
+        """Cache a value, evicting the least recently used entry if full."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import AsyncIterator, Optional, Sequence, Tuple, Union
+from typing import AsyncGenerator, Optional, Sequence, Tuple, Union
+
+from .records import AskarRow
 
 
 class DbConnection(ABC):
@@ -47,9 +49,21 @@ class Wallet(ABC):
         """Fetch metadata value from the database."""
 
     @abstractmethod
-    def fetch_pending_items(self, batch_size: int) -> AsyncIterator[Sequence[Tuple]]:
-        """Fetch un-updated items."""
+    async def count_pending_items(self) -> int:
+        """Count the items that have not been updated yet."""
+
+    @abstractmethod
+    def fetch_pending_items(
+        self, batch_size: int, max_bytes: Optional[int] = None
+    ) -> AsyncGenerator[Sequence[Tuple], Optional[int]]:
+        """Fetch un-updated items.
+
+        Batches hold at most `batch_size` rows and, if `max_bytes` is given,
+        no more than `max_bytes` of item values (but always at least one row).
+        A new batch size may be sent into the generator with `asend`; it
+        applies from the next batch on.
+        """
 
     @abstractmethod
-    async def update_items(self, items):
+    async def update_items(self, items: Sequence[AskarRow]):
         """Update items in the database."""
@@ -0,0 +1,649 @@
+"""Dry-run census and duration estimate of a migration."""
+
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import aiosqlite
+from aries_askar import Store
+import asyncpg
+
+from .db_connection import Wallet
+from .error import UpgradeError
+from .pg_connection import PgWallet
+from .progress import format_bytes, format_duration
+from .records import AskarRow, DecryptedItem
+from .sqlite_connection import SqliteWallet
+from .strategies import (
+    ASKAR_CATEGORIES,
+    AskarCipher,
+    DbpwStrategy,
+    IndyCipher,
+    MwstAsProfilesStrategy,
+    MwstAsStoresStrategy,
+    Strategy,
+)
+
+# Size of an empty Postgres database, added for each target database created
+PG_DATABASE_SIZE = 8 * 1024 * 1024
+# Copies of a batch held in memory at once: the fetched rows, the decrypted
+# items, the encrypted rows and the driver's buffers
+BATCH_COPIES = 4
+# Number of wallets, largest first, whose keys are derived to take samples
+SAMPLED_WALLETS = 3
+
+# One row per wallet and encrypted item type, with item and tag counts and
+# bytes. Wallets without items have a single row with a NULL type.
+SQLITE_CENSUS = """
+    SELECT NULL, i.type, COUNT(i.id),
+        COALESCE(SUM(LENGTH(CAST(i.type AS BLOB)) + LENGTH(CAST(i.name AS BLOB))
+            + LENGTH(CAST(i.value AS BLOB)) + LENGTH(CAST(i.key AS BLOB))), 0),
+        COALESCE(SUM(t.tags), 0), COALESCE(SUM(t.bytes), 0)
+    FROM metadata m
+    LEFT JOIN {items} i ON 1
+    LEFT JOIN (
+        SELECT item_id, COUNT(*) AS tags,
+            SUM(LENGTH(CAST(name AS BLOB)) + LENGTH(CAST(value AS BLOB))) AS bytes
+        FROM (
+            SELECT item_id, name, value FROM tags_encrypted
+            UNION ALL SELECT item_id, name, value FROM tags_plaintext
+        )
+        GROUP BY item_id
+    ) t ON t.item_id = i.id
+    GROUP BY i.type
+"""
+
+PG_CENSUS = """
+    SELECT {wallet}, i.type, COUNT(i.id),
+        COALESCE(SUM(octet_length(i.type) + octet_length(i.name)
+            + octet_length(i.value) + octet_length(i.key)), 0)::bigint,
+        COALESCE(SUM(t.tags), 0)::bigint, COALESCE(SUM(t.bytes), 0)::bigint
+    FROM metadata m
+    LEFT JOIN {items} i ON {join}
+    LEFT JOIN (
+        SELECT item_id, COUNT(*) AS tags,
+            SUM(octet_length(name) + octet_length(value)) AS bytes
+        FROM (
+            SELECT item_id, name, value FROM tags_encrypted
+            UNION ALL
+            SELECT item_id, name, convert_to(value, 'UTF8') FROM tags_plaintext
+        ) tags
+        GROUP BY item_id
+    ) t ON t.item_id = i.id
+    GROUP BY {group}
+"""
+
+# Askar tables written to in a scratch database to time writes, with an
+# empty items_old table for the wallet's deletes
+SQLITE_SCRATCH_SCHEMA = """
+    CREATE TABLE items_old (id INTEGER NOT NULL, PRIMARY KEY (id));
+    CREATE TABLE items (
+        id INTEGER NOT NULL,
+        profile_id INTEGER NOT NULL,
+        kind INTEGER NOT NULL,
+        category BLOB NOT NULL,
+        name BLOB NOT NULL,
+        value BLOB NOT NULL,
+        expiry DATETIME NULL,
+        PRIMARY KEY (id)
+    );
+    CREATE UNIQUE INDEX ix_items_uniq ON items (profile_id, kind, category, name);
+    CREATE TABLE items_tags (
+        id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        name BLOB NOT NULL,
+        value BLOB NOT NULL,
+        plaintext BOOLEAN NOT NULL,
+        PRIMARY KEY (id)
+    );
+    CREATE INDEX ix_items_tags_item_id ON items_tags (item_id);
+    CREATE INDEX ix_items_tags_name_enc ON items_tags
+        (name, SUBSTR(value, 1, 12)) WHERE plaintext=0;
+    CREATE INDEX ix_items_tags_name_plain ON items_tags
+        (name, value) WHERE plaintext=1;
+"""
+
+# Temporary tables shadow the wallet's own tables for the session, and are
+# dropped when the enclosing transaction is rolled back
+PG_SCRATCH_SCHEMA = """
+    CREATE TEMP TABLE items_old (id BIGINT PRIMARY KEY);
+    CREATE TEMP TABLE items (
+        id BIGSERIAL PRIMARY KEY,
+        profile_id BIGINT NOT NULL,
+        kind SMALLINT NOT NULL,
+        category BYTEA NOT NULL,
+        name BYTEA NOT NULL,
+        value BYTEA NOT NULL,
+        expiry TIMESTAMP NULL
+    );
+    CREATE UNIQUE INDEX ON items (profile_id, kind, category, name);
+    CREATE TEMP TABLE items_tags (
+        id BIGSERIAL PRIMARY KEY,
+        item_id BIGINT NOT NULL,
+        name BYTEA NOT NULL,
+        value BYTEA NOT NULL,
+        plaintext SMALLINT NOT NULL
+    );
+    CREATE INDEX ON items_tags(item_id);
+    CREATE INDEX ON items_tags(name, SUBSTR(value, 1, 12)) include (item_id)
+        WHERE plaintext=0;
+    CREATE INDEX ON items_tags(name, value) include (item_id) WHERE plaintext=1;
+"""
+
+PG_SCRATCH_SIZE = """
+    SELECT pg_total_relation_size('pg_temp.items')
+        + pg_total_relation_size('pg_temp.items_tags')
+"""
+
+
+class WalletCensus(NamedTuple):
+    """Item, tag and byte counts of one Indy wallet."""
+
+    wallet: str
+    items: int
+    tags: int
+    item_bytes: int
+    tag_bytes: int
+    # Item counts by encrypted item type
+    types: Dict[bytes, int]
+
+    @property
+    def bytes(self) -> int:
+        return self.item_bytes + self.tag_bytes
+
+
+class HostTimings(NamedTuple):
+    """Costs measured on this host, in seconds per operation."""
+
+    indy_kdf: float
+    askar_kdf: float
+    read: float
+    crypto: float
+    write: float
+    askar: float
+    # Target bytes on disk per byte of Indy item and tag data
+    disk_ratio: float
+    # Peak resident memory of this process while measuring, in bytes
+    peak_memory: int
+
+    @property
+    def item(self) -> float:
+        return self.read + self.crypto + self.write
+
+
+class Sample(NamedTuple):
+    """Items read and converted from one wallet, with the time taken."""
+
+    kdf: float
+    # Items of the wallet converted in the Askar phase
+    askar_items: int
+    rows: List[tuple]
+    read: float
+    items: List[DecryptedItem]
+    converted: List[AskarRow]
+    crypto: float
+
+
+class WalletEstimate(NamedTuple):
+    """Projected migration of one wallet."""
+
+    wallet: str
+    items: int
+    tags: int
+    askar_items: int
+    seconds: float
+    target_bytes: int
+
+
+class StrategyEstimate(NamedTuple):
+    """Projected migration of all wallets with one strategy."""
+
+    strategy: str
+    wallets: List[WalletEstimate]
+    seconds: float
+    target_bytes: int
+    peak_disk_bytes: int
+    peak_memory_bytes: int
+
+
+def peak_memory() -> int:
+    """Peak resident memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def row_bytes(row: tuple) -> int:
+    """Size of a fetched Indy row, counting its tags like the census does."""
+    size = sum(len(col) for col in row[1:5])
+    for tags in row[5:7]:
+        if tags:
+            size += len(tags.replace(",", "").replace(":", "")) // 2
+    return size
+
+
+def chunks(rows: Sequence, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]  # noqa: E203
+
+
+class Estimator:
+    """Dry run of a migration strategy.
+
+    Counts the items, tags and bytes of every wallet with a single grouped
+    query, then times key derivation, reads, crypto, writes and the Askar
+    phase on a sample of real items, and projects the duration, disk space
+    and peak memory of each strategy that applies to the database.
+
+    Nothing is written to the wallets. The census and samples are read over
+    read-only connections, and writes are timed against scratch tables that
+    are discarded afterwards.
+    """
+
+    def __init__(self, strategy: Strategy, sample_size: int = 200):
+        """Initialize an Estimator instance."""
+        self.strategy = strategy
+        self.sample_size = sample_size
+        if isinstance(strategy, DbpwStrategy):
+            self.uri = strategy.conn.uri
+            self.wallet_keys = {strategy.wallet_name: strategy.wallet_key}
+            self.mwst = False
+        elif isinstance(strategy, MwstAsProfilesStrategy):
+            self.uri = strategy.uri
+            self.wallet_keys = {strategy.base_wallet_name: strategy.base_wallet_key}
+            self.mwst = True
+        elif isinstance(strategy, MwstAsStoresStrategy):
+            self.uri = strategy.uri
+            self.wallet_keys = dict(strategy.wallet_keys)
+            self.mwst = True
+        else:
+            raise UpgradeError("Invalid strategy")
+        self.sqlite = urlparse(self.uri).scheme == "sqlite"
+        # Indy stores Postgres item types and names base64 encoded
+        self.b64 = not self.sqlite
+        self.items_table = "items"
+
+    async def _connect(self):
+        if self.sqlite:
+            path = urlparse(self.uri).path
+            if not os.path.exists(path):
+                raise UpgradeError(f"Wallet database not found: {path}")
+            return await aiosqlite.connect(f"file:{path}?mode=ro", uri=True)
+        return await asyncpg.connect(
+            self.uri, server_settings={"default_transaction_read_only": "on"}
+        )
+
+    async def _fetch(self, conn, query: str) -> List[tuple]:
+        if self.sqlite:
+            return list(await (await conn.execute(query)).fetchall())
+        return [tuple(row) for row in await conn.fetch(query)]
+
+    async def census(self, conn) -> List[WalletCensus]:
+        """Count items, tags and bytes of all wallets with one grouped query."""
+        # Items already moved to items_old by an interrupted upgrade are the
+        # ones still to be migrated
+        if not self.mwst:
+            if self.sqlite:
+                query = (
+                    "SELECT COUNT(*) FROM sqlite_master "
+                    "WHERE type='table' AND name='items_old'"
+                )
+            else:
+                query = "SELECT to_regclass('items_old') IS NOT NULL"
+            if (await self._fetch(conn, query))[0][0]:
+                self.items_table = "items_old"
+        if self.sqlite:
+            query = SQLITE_CENSUS.format(items=self.items_table)
+        elif self.mwst:
+            query = PG_CENSUS.format(
+                wallet="m.wallet_id",
+                items="items",
+                join="i.wallet_id = m.wallet_id",
+                group="m.wallet_id, i.type",
+            )
+        else:
+            query = PG_CENSUS.format(
+                wallet="NULL", items=self.items_table, join="TRUE", group="i.type"
+            )
+
+        wallets: Dict[str, list] = {}
+        for wallet_id, item_type, items, item_bytes, tags, tag_bytes in await (
+            self._fetch(conn, query)
+        ):
+            wallet = wallet_id or self.strategy.wallet_name
+            counts = wallets.setdefault(wallet, [0, 0, 0, 0, {}])
+            counts[0] += items
+            counts[1] += tags
+            counts[2] += item_bytes
+            counts[3] += tag_bytes
+            if item_type is not None:
+                counts[4][bytes(item_type)] = items
+        return [
+            WalletCensus(wallet, items, tags, item_bytes, tag_bytes, types)
+            for wallet, (items, tags, item_bytes, tag_bytes, types) in wallets.items()
+        ]
+
+    def _wallet(self, conn, wallet_id: str) -> Wallet:
+        if self.sqlite:
+            return SqliteWallet(conn, self.items_table)
+        return PgWallet(conn, None, self.items_table, wallet_id if self.mwst else None)
+
+    async def _source_size(self, conn) -> int:
+        if self.sqlite:
+            path = urlparse(self.uri).path
+            return sum(
+                os.path.getsize(file)
+                for file in (path, path + "-wal")
+                if os.path.exists(file)
+            )
+        return await conn.fetchval("SELECT pg_database_size(current_database())")
+
+    async def _sample(self, conn, census: WalletCensus, wallet_key: str) -> Sample:
+        """Derive a wallet's key, then read and convert a sample of its items."""
+        wallet = self._wallet(conn, census.wallet)
+        start = time.perf_counter()
+        indy_key = await self.strategy.fetch_indy_key(wallet, wallet_key)
+        kdf = time.perf_counter() - start
+
+        askar_types = {category.encode() for category in ASKAR_CATEGORIES}
+        askar_items = sum(
+            count
+            for item_type, count in census.types.items()
+            if self.strategy.decrypt_merged(item_type, indy_key["type"], self.b64)
+            in askar_types
+        )
+
+        start = time.perf_counter()
+        batches = wallet.fetch_pending_items(self.sample_size)
+        try:
+            rows = list(await batches.__anext__())
+        except StopAsyncIteration:
+            rows = []
+        finally:
+            await batches.aclose()
+        read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        items = IndyCipher(indy_key, self.b64).decrypt_rows(rows)
+        converted = AskarCipher(self.strategy.profile_key(indy_key)).encrypt_items(
+            items
+        )
+        crypto = time.perf_counter() - start
+        return Sample(kdf, askar_items, rows, read, items, converted, crypto)
+
+    async def _measure_writes(self, rows: List[AskarRow]) -> Tuple[float, int]:
+        """Time writing rows to scratch Askar tables, and their size on disk."""
+        batch_size = self.strategy.batch_size
+        if self.sqlite:
+            directory = os.path.dirname(os.path.abspath(urlparse(self.uri).path))
+            try:
+                scratch = tempfile.TemporaryDirectory(dir=directory)
+            except OSError:
+                scratch = tempfile.TemporaryDirectory()
+            with scratch:
+                async with aiosqlite.connect(
+                    os.path.join(scratch.name, "estimate.db")
+                ) as conn:
+                    await conn.executescript(SQLITE_SCRATCH_SCHEMA)
+                    await conn.commit()
+                    size = "SELECT (page_count - freelist_count) * page_size FROM "
+                    size += "pragma_page_count(), pragma_freelist_count(), "
+                    size += "pragma_page_size()"
+                    before = (await (await conn.execute(size)).fetchone())[0]
+                    wallet = SqliteWallet(conn)
+                    start = time.perf_counter()
+                    for batch in chunks(rows, batch_size):
+                        await wallet.update_items(batch)
+                    elapsed = time.perf_counter() - start
+                    after = (await (await conn.execute(size)).fetchone())[0]
+            return elapsed, after - before
+
+        conn = await asyncpg.connect(self.uri)
+        try:
+            txn = conn.transaction()
+            await txn.start()
+            try:
+                await conn.execute(PG_SCRATCH_SCHEMA)
+                before = await conn.fetchval(PG_SCRATCH_SIZE)
+                wallet = PgWallet(conn, conn, "items_old", None)
+                start = time.perf_counter()
+                for batch in chunks(rows, batch_size):
+                    await wallet.update_items(batch)
+                elapsed = time.perf_counter() - start
+                after = await conn.fetchval(PG_SCRATCH_SIZE)
+            finally:
+                await txn.rollback()
+        finally:
+            await conn.close()
+        return elapsed, after - before
+
+    async def _measure_askar(
+        self, items: List[DecryptedItem]
+    ) -> Tuple[float, Optional[float]]:
+        """Time an Askar store KDF and the Askar phase on a scratch store.
+
+        Entries are fetched in batches, removed and inserted again under
+        another category, like the Askar phase does.
+        """
+        start = time.perf_counter()
+        store = await Store.provision(
+            "sqlite://:memory:", "kdf:argon2i:mod", "estimate", recreate=True
+        )
+        kdf = time.perf_counter() - start
+        if not items:
+            await store.close()
+            return kdf, None
+        try:
+            async with store.transaction() as txn:
+                for index, item in enumerate(items):
+                    await txn.insert(
+                        "Indy::Estimate",
+                        str(index),
+                        value=item.value or b"",
+                        tags={
+                            name.decode(errors="replace"): value.decode(
+                                errors="replace"
+                            )
+                            for name, value in zip(item.tag_names, item.tag_values)
+                        },
+                    )
+                await txn.commit()
+            start = time.perf_counter()
+            async with store.transaction() as txn:
+                while True:
+                    rows = await txn.fetch_all(
+                        "Indy::Estimate", limit=self.strategy.batch_size
+                    )
+                    if not rows:
+                        break
+                    for row in rows:
+                        await txn.remove("Indy::Estimate", row.name)
+                        await txn.insert(
+                            "estimate", row.name, value=row.value, tags=row.tags
+                        )
+                await txn.commit()
+            askar = (time.perf_counter() - start) / len(items)
+        finally:
+            await store.close()
+        return kdf, askar
+
+    async def measure(
+        self, wallets: List[WalletCensus], conn
+    ) -> Tuple[HostTimings, Dict[str, int], float]:
+        """Time the migration steps on samples of the largest keyed wallets.
+
+        Returns the timings, the exact Askar phase item counts of the sampled
+        wallets, and the fraction of items converted in the Askar phase to
+        assume for the others.
+        """
+        keyed = sorted(
+            (census for census in wallets if census.wallet in self.wallet_keys),
+            key=lambda census: census.items,
+            reverse=True,
+        )[:SAMPLED_WALLETS]
+        if not keyed:
+            raise UpgradeError("None of the given wallets were found in the database")
+
+        samples = []
+        for census in keyed:
+            print(f"Sampling wallet {census.wallet}...")
+            samples.append(
+                await self._sample(conn, census, self.wallet_keys[census.wallet])
+            )
+        rows = [row for sample in samples for row in sample.rows]
+
+        print("Timing writes...")
+        write, disk = await self._measure_writes(
+            [row for sample in samples for row in sample.converted]
+        )
+        print("Timing the Askar phase...")
+        askar_kdf, askar = await self._measure_askar(
+            [item for sample in samples for item in sample.items]
+        )
+
+        count = len(rows) or 1
+        sample_bytes = sum(row_bytes(row) for row in rows)
+        timings = HostTimings(
+            indy_kdf=sum(sample.kdf for sample in samples) / len(samples),
+            askar_kdf=askar_kdf,
+            read=sum(sample.read for sample in samples) / count,
+            crypto=sum(sample.crypto for sample in samples) / count,
+            write=write / count,
+            askar=askar if askar is not None else write / count,
+            disk_ratio=disk / sample_bytes if sample_bytes else 1.0,
+            peak_memory=peak_memory(),
+        )
+        askar_items = {
+            census.wallet: sample.askar_items for census, sample in zip(keyed, samples)
+        }
+        keyed_items = sum(census.items for census in keyed)
+        fraction = sum(askar_items.values()) / keyed_items if keyed_items else 0.0
+        return timings, askar_items, fraction
+
+    def _working_set(self, wallets: List[WalletCensus]) -> int:
+        """Memory held by in-flight batches, for the largest average item."""
+        strategy = self.strategy
+        average = max(
+            (census.bytes / census.items for census in wallets if census.items),
+            default=0,
+        )
+        rows = strategy.tuner.max_batch_size if strategy.tuner else strategy.batch_size
+        if strategy.max_batch_bytes and average:
+            rows = min(rows, max(1, int(strategy.max_batch_bytes // average)))
+        concurrency = strategy.tuner.max_concurrency if strategy.tuner else 1
+        prefetch = strategy.cursor_prefetch or 0
+        return int(average * (rows * BATCH_COPIES * concurrency + prefetch))
+
+    def project(
+        self,
+        wallets: List[WalletCensus],
+        timings: HostTimings,
+        askar_items: Dict[str, int],
+        askar_fraction: float,
+        source_bytes: int,
+    ) -> List[StrategyEstimate]:
+        """Project each strategy that applies to the database."""
+        estimates = []
+        for census in wallets:
+            askar = askar_items.get(census.wallet)
+            if askar is None:
+                askar = round(census.items * askar_fraction)
+            # Each wallet's key is derived once by Indy and once by Askar
+            seconds = (
+                timings.indy_kdf
+                + timings.askar_kdf
+                + census.items * timings.item
+                + askar * timings.askar
+            )
+            estimates.append(
+                WalletEstimate(
+                    census.wallet,
+                    census.items,
+                    census.tags,
+                    askar,
+                    seconds,
+                    int(census.bytes * timings.disk_ratio),
+                )
+            )
+        memory = timings.peak_memory + self._working_set(wallets)
+
+        def strategy(name: str, selected: List[WalletEstimate], extra: float = 0):
+            target = sum(wallet.target_bytes for wallet in selected)
+            if name == "dbpw":
+                # SQLite reuses the pages freed as items are moved, Postgres
+                # only once vacuumed
+                if self.sqlite:
+                    peak = max(source_bytes, target)
+                else:
+                    peak = source_bytes + target
+            elif name == "mwst-as-stores":
+                peak = source_bytes + target + len(selected) * PG_DATABASE_SIZE
+            else:
+                peak = source_bytes + target + 2 * PG_DATABASE_SIZE
+            return StrategyEstimate(
+                name,
+                selected,
+                sum(wallet.seconds for wallet in selected) + extra,
+                target,
+                peak,
+                memory,
+            )
+
+        if not self.mwst:
+            return [strategy("dbpw", estimates)]
+        stores = estimates
+        if isinstance(self.strategy, MwstAsStoresStrategy):
+            stores = [
+                wallet for wallet in estimates if wallet.wallet in self.wallet_keys
+            ]
+        return [
+            strategy("mwst-as-stores", stores),
+            # Sub-wallet settings are read from the migrated base wallet
+            strategy("mwst-as-profiles", estimates, timings.askar_kdf),
+        ]
+
+    async def run(self) -> Tuple[HostTimings, List[StrategyEstimate]]:
+        conn = await self._connect()
+        try:
+            print("Counting wallet items...")
+            wallets = await self.census(conn)
+            timings, askar_items, fraction = await self.measure(wallets, conn)
+            source_bytes = await self._source_size(conn)
+        finally:
+            await conn.close()
+        return timings, self.project(
+            wallets, timings, askar_items, fraction, source_bytes
+        )
+
+
+def format_estimates(timings: HostTimings, estimates: List[StrategyEstimate]) -> str:
+    """Describe the measured costs and projections as text."""
+    ms = 1000
+    lines = [
+        "Measured on this host:",
+        f"  key derivation: Indy {timings.indy_kdf:.2f} s, "
+        f"Askar {timings.askar_kdf:.2f} s",
+        f"  per item: read {timings.read * ms:.3f} ms, "
+        f"crypto {timings.crypto * ms:.3f} ms, write {timings.write * ms:.3f} ms",
+        f"  per Askar phase entry: {timings.askar * ms:.3f} ms",
+    ]
+    for estimate in estimates:
+        lines.append("")
+        lines.append(f"Strategy {estimate.strategy}:")
+        width = max((len(wallet.wallet) for wallet in estimate.wallets), default=0)
+        for wallet in estimate.wallets:
+            lines.append(
+                f"  {wallet.wallet:<{width}}  {wallet.items:>9} items "
+                f"{wallet.tags:>10} tags {wallet.askar_items:>8} Askar entries  "
+                f"{format_duration(wallet.seconds):>9}  "
+                f"{format_bytes(wallet.target_bytes):>10}"
+            )
+        lines.append(f"  Projected duration: {format_duration(estimate.seconds)}")
+        lines.append(f"  Target size: {format_bytes(estimate.target_bytes)}")
+        lines.append(f"  Peak disk usage: {format_bytes(estimate.peak_disk_bytes)}")
+        lines.append(f"  Peak memory: {format_bytes(estimate.peak_memory_bytes)}")
+    return "\n".join(lines)
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Union
+from urllib.parse import urlparse
+
+from .error import MissingWalletError, UpgradeError
+from .metrics import wallet_scope
+from .progress import format_duration, worker_pool, worker_progress
+from .scheduling import WalletScheduler
+from .sqlite_connection import SqliteConnection
+from .strategies import DbpwStrategy, Strategy
+
+# Wallet database file in each wallet directory, as laid out by the Indy SDK
+# under ~/.indy_client/wallet
+WALLET_FILE = "sqlite.db"
+
+
+class FleetResult(NamedTuple):
+    """Outcome of migrating one wallet of a fleet."""
+
+    wallet_name: str
+    path: str
+    seconds: float
+    error: Optional[str] = None
+
+
+def migrate_wallet(
+    path: str, wallet_name: str, wallet_key: str, options: dict
+) -> FleetResult:
+    """Migrate one SQLite wallet, in a worker process."""
+    start = time.perf_counter()
+    progress = worker_progress()
+    strategy = DbpwStrategy(
+        SqliteConnection(f"sqlite://{path}"),
+        wallet_name,
+        wallet_key,
+        progress=progress,
+        **options,
+    )
+    try:
+        with wallet_scope(wallet_name):
+            asyncio.run(strategy.run())
+    except Exception as error:
+        return FleetResult(
+            wallet_name, path, time.perf_counter() - start, str(error) or repr(error)
+        )
+    finally:
+        if progress:
+            progress.flush()
+    return FleetResult(wallet_name, path, time.perf_counter() - start)
+
+
+class DbpwFleetStrategy(Strategy):
+    """Many SQLite database per wallet wallets, migrated by a process pool."""
+
+    def __init__(
+        self,
+        uri: str,
+        wallet_keys: Dict[str, Union[str, dict]],
+        batch_size: int,
+        fleet_workers: Optional[int] = None,
+        allow_missing_wallet: Optional[bool] = False,
+        compact: bool = False,
+        **kwargs,
+    ):
+        """Initialize a DbpwFleetStrategy instance.
+
+        The URI names a directory holding a `<wallet name>/sqlite.db` file per
+        wallet. Wallet keys map each wallet name to its key, or to an object
+        with the key and the path of a wallet file kept elsewhere.
+        """
+        super().__init__(batch_size, **kwargs)
+        self.uri = uri
+        self.wallet_keys = wallet_keys
+        self.fleet_workers = fleet_workers or os.cpu_count() or 1
+        self.allow_missing_wallet = allow_missing_wallet
+        self.compact = compact
+
+    def find_wallets(self) -> Dict[str, str]:
+        """Wallet file paths by name, from the directory and the keys."""
+        directory = urlparse(self.uri).path
+        found = {}
+        if os.path.isdir(directory):
+            for entry in sorted(os.listdir(directory)):
+                path = os.path.join(directory, entry, WALLET_FILE)
+                if os.path.isfile(path):
+                    found[entry] = path
+        for wallet_name, entry in self.wallet_keys.items():
+            if isinstance(entry, dict) and entry.get("path"):
+                found[wallet_name] = entry["path"]
+
+        for wallet_name in self.wallet_keys:
+            if wallet_name not in found:
+                raise UpgradeError(f"Wallet {wallet_name} not found in {directory}")
+        missing = sorted(set(found) - set(self.wallet_keys))
+        if missing:
+            if not self.allow_missing_wallet:
+                raise MissingWalletError(
+                    f"Must provide entry for {missing} in wallet_keys dictionary "
+                    "to migrate wallets"
+                )
+            print(f"Running upgrade without migrating wallets {missing}")
+        return {wallet_name: found[wallet_name] for wallet_name in self.wallet_keys}
+
+    def wallet_key(self, wallet_name: str) -> str:
+        entry = self.wallet_keys[wallet_name]
+        return entry["key"] if isinstance(entry, dict) else entry
+
+    def worker_options(self) -> dict:
+        """Settings passed to the strategy of each wallet."""
+        return {
+            "batch_size": self.batch_size,
+            "tuner": self.tuner,
+            "max_batch_bytes": self.max_batch_bytes,
+            "compact": self.compact,
+            # One key per wallet, and the processes already use every CPU
+            "preflight_workers": 1,
+        }
+
+    @staticmethod
+    def report(results: List[FleetResult], elapsed: float):
+        failed = [result for result in results if result.error]
+        print(
+            f"Fleet: {len(results) - len(failed)} of {len(results)} wallet(s) "
+            f"migrated, {len(failed)} failed, in {format_duration(elapsed)}"
+        )
+        if results:
+            slowest = max(results, key=lambda result: result.seconds)
+            print(
+                f"Slowest wallet {slowest.wallet_name} took "
+                f"{format_duration(slowest.seconds)}, total "
+                f"{format_duration(sum(result.seconds for result in results))}"
+            )
+        for result in failed:
+            print(f"  {result.wallet_name} ({result.path}): {result.error}")
+
+    async def run(self):
+        """Perform the upgrade.
+
+        Wallets are migrated largest file first, `fleet_workers` at a time,
+        each by a DbpwStrategy in a worker process. A failed wallet does not
+        stop the others; the failures are reported together at the end.
+        """
+        paths = self.find_wallets()
+        scheduler = WalletScheduler(
+            {name: (0, os.path.getsize(path)) for name, path in paths.items()},
+            self.fleet_workers,
+        )
+        wallets = scheduler.order(list(paths))
+        scheduler.report(wallets)
+
+        options = self.worker_options()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with worker_pool(
+            min(self.fleet_workers, len(wallets)) or 1, self.progress
+        ) as pool:
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool,
+                        migrate_wallet,
+                        paths[wallet_name],
+                        wallet_name,
+                        self.wallet_key(wallet_name),
+                        options,
+                    )
+                    for wallet_name in wallets
+                )
+            )
+
+        self.report(results, time.perf_counter() - start)
+        failed = [result.wallet_name for result in results if result.error]
+        if failed:
+            raise UpgradeError(f"Migration failed for wallets: {failed}")
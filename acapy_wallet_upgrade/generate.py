@@ -0,0 +1,808 @@
+"""Synthetic Indy wallet generator.
+
+Builds Indy SDK wallets of a chosen shape (item count, tags per item, value
+sizes and category mix) in any of the layouts the upgrade supports, for
+testing and benchmarking migrations.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import sys
+import uuid
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import aiosqlite
+import asyncpg
+import base58
+import msgpack
+import nacl.bindings
+from nacl.signing import SigningKey
+
+from .cache import LRUCache
+from .records import DecryptedItem
+from .strategies import (
+    CHACHAPOLY_KEY_LEN,
+    CHACHAPOLY_NONCE_LEN,
+    INDY_KEY_NAMES,
+    derive_master_key,
+)
+
+
+# Relative weights of the generated item categories. Indy categories bring
+# their companion records (DID metadata, credential definition keys, etc.)
+DEFAULT_CATEGORIES = {
+    "connection": 20.0,
+    "credential_exchange_v10": 15.0,
+    "oob_record": 10.0,
+    "Indy::Credential": 45.0,
+    "Indy::Key": 5.0,
+    "Indy::Schema": 2.0,
+    "Indy::CredentialDefinition": 2.0,
+    "Indy::RevocationRegistryDefinition": 1.0,
+}
+
+# Number of items written per round trip
+CHUNK_SIZE = 1000
+
+
+class WalletShape:
+    """Description of the contents of a generated wallet."""
+
+    def __init__(
+        self,
+        items: int = 1000,
+        tags: int = 5,
+        plaintext_tags: int = 1,
+        min_value_size: int = 100,
+        max_value_size: int = 2000,
+        categories: Optional[Dict[str, float]] = None,
+        seed: Optional[int] = None,
+    ):
+        """Initialize a WalletShape instance."""
+        self.items = items
+        self.tags = tags
+        self.plaintext_tags = plaintext_tags
+        self.min_value_size = min_value_size
+        self.max_value_size = max(max_value_size, min_value_size)
+        self.categories = categories or DEFAULT_CATEGORIES
+        for category in self.categories:
+            if category not in DEFAULT_CATEGORIES and category.startswith("Indy::"):
+                raise ValueError(f"Unsupported Indy category: {category}")
+        self.seed = seed
+
+    def generate(
+        self, start_id: int = 1, seed: Optional[int] = None
+    ) -> Iterator[DecryptedItem]:
+        """Yield the plaintext items of one wallet, numbered from start_id.
+
+        The count includes companion records, and a wallet always holds a
+        single master secret. When a category's records no longer fit in the
+        count, a plain record is generated instead.
+        """
+        builder = _ItemBuilder(self, random.Random(self.seed if seed is None else seed))
+        categories = list(self.categories)
+        weights = list(self.categories.values())
+        item_id = start_id
+        produced = 0
+        for item in builder.build("Indy::MasterSecret", item_id):
+            yield item
+            item_id += 1
+            produced += 1
+        while produced < self.items:
+            category = builder.rnd.choices(categories, weights)[0]
+            group = builder.build(category, item_id)
+            if len(group) > self.items - produced:
+                group = builder.build("connection", item_id)
+            for item in group:
+                yield item
+                item_id += 1
+                produced += 1
+
+
+class _ItemBuilder:
+    """Plaintext records for each supported category."""
+
+    def __init__(self, shape: WalletShape, rnd: random.Random):
+        self.shape = shape
+        self.rnd = rnd
+        self.count = 0
+        self.did = base58.b58encode(rnd.randbytes(16)).decode()
+
+    def _pad(self, value: dict) -> bytes:
+        size = self.rnd.randint(self.shape.min_value_size, self.shape.max_value_size)
+        value["pad"] = ""
+        value["pad"] = "x" * max(0, size - len(json.dumps(value)))
+        return json.dumps(value).encode()
+
+    def _item(
+        self, item_id: int, category: str, name: str, value: bytes, tags: bool = True
+    ) -> DecryptedItem:
+        item = DecryptedItem(
+            item_id, category.encode(), name.encode(), value, [], [], []
+        )
+        if tags:
+            for index in range(self.shape.tags):
+                item.tag_plaintext.append(0)
+                item.tag_names.append(b"tag_%d" % index)
+                item.tag_values.append(b"value_%d" % self.rnd.randrange(100))
+            for index in range(self.shape.plaintext_tags):
+                item.tag_plaintext.append(1)
+                item.tag_names.append(b"plain_%d" % index)
+                item.tag_values.append(b"%d" % self.rnd.randrange(100))
+        return item
+
+    def build(self, category: str, item_id: int) -> List[DecryptedItem]:
+        self.count += 1
+        method = getattr(self, "_" + category.replace("::", "_"), None)
+        if method:
+            return method(item_id)
+        name = "%032x" % self.rnd.getrandbits(128)
+        value = self._pad(
+            {"state": self.rnd.choice(("start", "active", "done")), "id": name}
+        )
+        return [self._item(item_id, category, name, value)]
+
+    def _Indy_MasterSecret(self, item_id: int) -> List[DecryptedItem]:
+        value = json.dumps({"value": {"ms": str(self.rnd.getrandbits(256))}})
+        return [self._item(item_id, "Indy::MasterSecret", "default", value.encode())]
+
+    def _Indy_Key(self, item_id: int) -> List[DecryptedItem]:
+        signing_key = SigningKey(self.rnd.randbytes(32))
+        verkey_bytes = bytes(signing_key.verify_key)
+        verkey = base58.b58encode(verkey_bytes).decode()
+        did = base58.b58encode(verkey_bytes[:16]).decode()
+        signkey = base58.b58encode(bytes(signing_key) + verkey_bytes).decode()
+        return [
+            self._item(
+                item_id,
+                "Indy::Key",
+                verkey,
+                json.dumps({"verkey": verkey, "signkey": signkey}).encode(),
+                False,
+            ),
+            self._item(
+                item_id + 1,
+                "Indy::Did",
+                did,
+                json.dumps({"did": did, "verkey": verkey}).encode(),
+                False,
+            ),
+            self._item(
+                item_id + 2,
+                "Indy::DidMetadata",
+                did,
+                json.dumps({"value": json.dumps({"public": False})}).encode(),
+                False,
+            ),
+        ]
+
+    def _schema_id(self, count: int) -> str:
+        return f"{self.did}:2:schema_{count}:1.0"
+
+    def _cred_def_id(self, count: int) -> str:
+        return f"{self.did}:3:CL:{count}:default"
+
+    def _Indy_Schema(self, item_id: int) -> List[DecryptedItem]:
+        schema_id = self._schema_id(self.count)
+        value = self._pad({"id": schema_id, "attrNames": ["name", "score"]})
+        return [self._item(item_id, "Indy::Schema", schema_id, value, False)]
+
+    def _Indy_CredentialDefinition(self, item_id: int) -> List[DecryptedItem]:
+        cred_def_id = self._cred_def_id(self.count)
+        schema_id = self._schema_id(self.count)
+        return [
+            self._item(
+                item_id,
+                "Indy::CredentialDefinition",
+                cred_def_id,
+                self._pad({"id": cred_def_id, "schemaId": schema_id}),
+                False,
+            ),
+            self._item(
+                item_id + 1, "Indy::SchemaId", cred_def_id, schema_id.encode(), False
+            ),
+            self._item(
+                item_id + 2,
+                "Indy::CredentialDefinitionPrivateKey",
+                cred_def_id,
+                self._pad({"p_key": {}}),
+                False,
+            ),
+            self._item(
+                item_id + 3,
+                "Indy::CredentialDefinitionCorrectnessProof",
+                cred_def_id,
+                json.dumps({"value": {"c": "1", "xz_cap": "1"}}).encode(),
+                False,
+            ),
+        ]
+
+    def _Indy_RevocationRegistryDefinition(self, item_id: int) -> List[DecryptedItem]:
+        rev_reg_id = f"{self.did}:4:{self._cred_def_id(self.count)}:CL_ACCUM:default"
+        return [
+            self._item(
+                item_id + offset,
+                category,
+                rev_reg_id,
+                self._pad({"id": rev_reg_id}),
+                False,
+            )
+            for offset, category in enumerate(
+                (
+                    "Indy::RevocationRegistryDefinition",
+                    "Indy::RevocationRegistryDefinitionPrivate",
+                    "Indy::RevocationRegistry",
+                    "Indy::RevocationRegistryInfo",
+                )
+            )
+        ]
+
+    def _Indy_Credential(self, item_id: int) -> List[DecryptedItem]:
+        name = "%032x" % self.rnd.getrandbits(128)
+        count = self.rnd.randint(1, 3)
+        value = self._pad(
+            {
+                "schema_id": self._schema_id(count),
+                "cred_def_id": self._cred_def_id(count),
+                "rev_reg_id": None,
+                "values": {
+                    "name": {"raw": name, "encoded": "1"},
+                    "score": {"raw": str(count), "encoded": str(count)},
+                },
+            }
+        )
+        return [self._item(item_id, "Indy::Credential", name, value)]
+
+
+def _encrypt(message: bytes, key: bytes, hmac_key: Optional[bytes] = None) -> bytes:
+    """Encrypt message into nonce || ciphertext, as Indy does.
+
+    With an HMAC key, the nonce is derived from the message so that the
+    ciphertext is searchable.
+    """
+    if hmac_key:
+        nonce = hmac.HMAC(hmac_key, message, digestmod=hashlib.sha256).digest()[
+            :CHACHAPOLY_NONCE_LEN
+        ]
+    else:
+        nonce = os.urandom(CHACHAPOLY_NONCE_LEN)
+    return nonce + nacl.bindings.crypto_aead_chacha20poly1305_ietf_encrypt(
+        message, None, nonce, key
+    )
+
+
+class IndyEncryptor:
+    """Encryption of generated items into Indy rows, for a single Indy key set.
+
+    The reverse of `IndyCipher.decrypt_rows`. Tag names and encrypted tag
+    values are searchable in Indy, and their ciphertexts are cached by
+    plaintext.
+    """
+
+    def __init__(self, keys: dict, b64: bool = False, cache_size: int = 4096):
+        """Initialize an IndyEncryptor instance."""
+        self.keys = keys
+        self.b64 = b64
+        self.cache = LRUCache(cache_size)
+
+    def _encrypt_tag(self, message: bytes, key_name: str) -> bytes:
+        cache_key = (key_name, message)
+        enc = self.cache.get(cache_key)
+        if enc is None:
+            enc = _encrypt(message, self.keys[key_name], self.keys["tag_hmac"])
+            self.cache.put(cache_key, enc)
+        return enc
+
+    def encrypt_items(self, items: Sequence[DecryptedItem]) -> List[tuple]:
+        """Encrypt generated items into Indy rows.
+
+        Rows are (id, type, name, value, key, tags_enc, tags_plain), with the
+        tags as lists of (name, value) pairs.
+        """
+        keys = self.keys
+        result = []
+        for item in items:
+            value_key = os.urandom(CHACHAPOLY_KEY_LEN)
+            row_type = _encrypt(item.type, keys["type"], keys["item_hmac"])
+            row_name = _encrypt(item.name, keys["name"], keys["item_hmac"])
+            if self.b64:
+                row_type = base64.b64encode(row_type)
+                row_name = base64.b64encode(row_name)
+            tags_enc = []
+            tags_plain = []
+            for plain, name, value in zip(
+                item.tag_plaintext, item.tag_names, item.tag_values
+            ):
+                name = self._encrypt_tag(name, "tag_name")
+                if plain:
+                    tags_plain.append((name, value))
+                else:
+                    tags_enc.append((name, self._encrypt_tag(value, "tag_value")))
+            result.append(
+                (
+                    item.id,
+                    row_type,
+                    row_name,
+                    _encrypt(item.value, value_key),
+                    _encrypt(value_key, keys["value"]),
+                    tags_enc,
+                    tags_plain,
+                )
+            )
+        return result
+
+
+def new_indy_keys(wallet_key: str) -> Tuple[bytes, dict]:
+    """Create the keys of a new Indy wallet.
+
+    Returns the wallet metadata (JSON) and the keys in the form returned by
+    `Strategy.fetch_indy_key`.
+    """
+    keys = {name: os.urandom(CHACHAPOLY_KEY_LEN) for name in INDY_KEY_NAMES}
+    salt = os.urandom(32)
+    master_key = derive_master_key(wallet_key, salt)
+    keys_enc = _encrypt(
+        msgpack.packb([keys[name] for name in INDY_KEY_NAMES]), master_key
+    )
+    metadata = json.dumps({"keys": list(keys_enc), "master_key_salt": list(salt)})
+    keys["master"] = master_key
+    keys["salt"] = salt[:16]
+    return metadata.encode(), keys
+
+
+def _chunks(items: Iterator[DecryptedItem]) -> Iterator[List[DecryptedItem]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _wallet_record(item_id: int, wallet_name: str, wallet_key: str) -> DecryptedItem:
+    """ACA-Py multitenancy record for a sub-wallet, kept in the base wallet."""
+    wallet_id = str(uuid.uuid4())
+    value = {
+        "settings": {
+            "wallet.type": "indy",
+            "wallet.name": wallet_name,
+            "wallet.key": wallet_key,
+        },
+        "key_management_mode": "managed",
+    }
+    return DecryptedItem(
+        item_id,
+        b"wallet_record",
+        wallet_id.encode(),
+        json.dumps(value).encode(),
+        [0],
+        [b"wallet_name"],
+        [wallet_name.encode()],
+    )
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE metadata (
+        id INTEGER NOT NULL,
+        value NOT NULL,
+        PRIMARY KEY(id)
+    );
+    CREATE TABLE items (
+        id INTEGER NOT NULL,
+        type NOT NULL,
+        name NOT NULL,
+        value NOT NULL,
+        key NOT NULL,
+        PRIMARY KEY(id)
+    );
+    CREATE UNIQUE INDEX ux_items_type_name ON items(type, name);
+    CREATE TABLE tags_encrypted (
+        name NOT NULL,
+        value NOT NULL,
+        item_id INTEGER NOT NULL,
+        PRIMARY KEY(name, item_id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    );
+    CREATE TABLE tags_plaintext (
+        name NOT NULL,
+        value NOT NULL,
+        item_id INTEGER NOT NULL,
+        PRIMARY KEY(name, item_id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    );
+"""
+
+
+async def generate_sqlite(path: str, wallet_key: str, shape: WalletShape):
+    """Write an Indy SQLite wallet to path."""
+    if os.path.exists(path):
+        raise ValueError(f"Wallet file already exists: {path}")
+    metadata, keys = new_indy_keys(wallet_key)
+    cipher = IndyEncryptor(keys)
+    async with aiosqlite.connect(path) as conn:
+        await conn.executescript(SQLITE_SCHEMA)
+        await conn.execute("INSERT INTO metadata (value) VALUES (?)", (metadata,))
+        for chunk in _chunks(shape.generate()):
+            rows = cipher.encrypt_items(chunk)
+            await conn.executemany(
+                "INSERT INTO items (id, type, name, value, key) VALUES (?, ?, ?, ?, ?)",
+                [row[:5] for row in rows],
+            )
+            await conn.executemany(
+                "INSERT INTO tags_encrypted (name, value, item_id) VALUES (?, ?, ?)",
+                [(name, value, row[0]) for row in rows for name, value in row[5]],
+            )
+            await conn.executemany(
+                "INSERT INTO tags_plaintext (name, value, item_id) VALUES (?, ?, ?)",
+                [
+                    (name, value.decode(), row[0])
+                    for row in rows
+                    for name, value in row[6]
+                ],
+            )
+        await conn.commit()
+
+
+async def _pg_connect(uri: str, database: str) -> asyncpg.Connection:
+    """Connect to a database on the server of uri, creating it if needed."""
+    parts = urlparse(uri)
+    kwargs = dict(
+        host=parts.hostname,
+        port=parts.port or 5432,
+        user=parts.username,
+        password=parts.password,
+    )
+    try:
+        return await asyncpg.connect(database=database, **kwargs)
+    except asyncpg.InvalidCatalogNameError:
+        sys_conn = await asyncpg.connect(database="template1", **kwargs)
+        try:
+            await sys_conn.execute(
+                f'CREATE DATABASE "{database}" OWNER "{parts.username}"'
+            )
+        finally:
+            await sys_conn.close()
+        return await asyncpg.connect(database=database, **kwargs)
+
+
+async def _pg_write_items(
+    conn: asyncpg.Connection,
+    cipher: IndyEncryptor,
+    items: Iterator[DecryptedItem],
+    wallet_id: Optional[str] = None,
+):
+    """Bulk copy encrypted items and their tags."""
+    prefix = (wallet_id,) if wallet_id else ()
+    columns = ("wallet_id",) if wallet_id else ()
+    for chunk in _chunks(items):
+        rows = cipher.encrypt_items(chunk)
+        await conn.copy_records_to_table(
+            "items",
+            records=[prefix + row[:5] for row in rows],
+            columns=columns + ("id", "type", "name", "value", "key"),
+        )
+        await conn.copy_records_to_table(
+            "tags_encrypted",
+            records=[
+                prefix + (name, value, row[0]) for row in rows for name, value in row[5]
+            ],
+            columns=columns + ("name", "value", "item_id"),
+        )
+        await conn.copy_records_to_table(
+            "tags_plaintext",
+            records=[
+                prefix + (name, value.decode(), row[0])
+                for row in rows
+                for name, value in row[6]
+            ],
+            columns=columns + ("name", "value", "item_id"),
+        )
+
+
+PG_SCHEMA = """
+    CREATE TABLE metadata (
+        id BIGSERIAL PRIMARY KEY,
+        value BYTEA NOT NULL
+    );
+    CREATE TABLE items (
+        id BIGSERIAL PRIMARY KEY,
+        type BYTEA NOT NULL,
+        name BYTEA NOT NULL,
+        value BYTEA NOT NULL,
+        key BYTEA NOT NULL
+    );
+    CREATE UNIQUE INDEX ux_items_type_name ON items(type, name);
+    CREATE TABLE tags_encrypted (
+        name BYTEA NOT NULL,
+        value BYTEA NOT NULL,
+        item_id BIGINT NOT NULL,
+        PRIMARY KEY(name, item_id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    );
+    CREATE TABLE tags_plaintext (
+        name BYTEA NOT NULL,
+        value TEXT NOT NULL,
+        item_id BIGINT NOT NULL,
+        PRIMARY KEY(name, item_id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    );
+"""
+
+PG_MWST_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS metadata (
+        wallet_id VARCHAR(64) NOT NULL,
+        value BYTEA NOT NULL,
+        PRIMARY KEY(wallet_id)
+    );
+    CREATE TABLE IF NOT EXISTS items (
+        id BIGSERIAL PRIMARY KEY,
+        wallet_id VARCHAR(64) NOT NULL,
+        type BYTEA NOT NULL,
+        name BYTEA NOT NULL,
+        value BYTEA NOT NULL,
+        key BYTEA NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_items_wallet_id_type_name
+        ON items(wallet_id, type, name);
+    CREATE TABLE IF NOT EXISTS tags_encrypted (
+        wallet_id VARCHAR(64) NOT NULL,
+        name BYTEA NOT NULL,
+        value BYTEA NOT NULL,
+        item_id BIGINT NOT NULL,
+        PRIMARY KEY(name, item_id, wallet_id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    );
+    CREATE TABLE IF NOT EXISTS tags_plaintext (
+        wallet_id VARCHAR(64) NOT NULL,
+        name BYTEA NOT NULL,
+        value TEXT NOT NULL,
+        item_id BIGINT NOT NULL,
+        PRIMARY KEY(name, item_id, wallet_id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    );
+"""
+
+
+async def generate_postgres(uri: str, wallet_key: str, shape: WalletShape):
+    """Write an Indy DatabasePerWallet wallet to the database named in uri."""
+    conn = await _pg_connect(uri, urlparse(uri).path[1:])
+    try:
+        metadata, keys = new_indy_keys(wallet_key)
+        async with conn.transaction():
+            await conn.execute(PG_SCHEMA)
+            await conn.execute(
+                "INSERT INTO metadata (value) VALUES ($1)", base64.b64encode(metadata)
+            )
+            await _pg_write_items(conn, IndyEncryptor(keys, b64=True), shape.generate())
+            await conn.execute(
+                "SELECT setval(pg_get_serial_sequence('items', 'id'), "
+                "(SELECT MAX(id) FROM items))"
+            )
+    finally:
+        await conn.close()
+
+
+async def generate_postgres_mwst(
+    uri: str,
+    wallet_keys: Dict[str, str],
+    shape: WalletShape,
+    base_wallet: Optional[Tuple[str, str]] = None,
+):
+    """Write Indy MultiWalletSingleTable wallets to the database named in uri.
+
+    With a base wallet (name, key), it is written as well and holds an
+    ACA-Py `wallet_record` for each of the other wallets, as a multitenant
+    agent would for the mwst-as-profiles strategy.
+    """
+    conn = await _pg_connect(uri, urlparse(uri).path[1:])
+    wallets: List[Tuple[str, str]] = list(wallet_keys.items())
+    if base_wallet:
+        wallets.insert(0, base_wallet)
+    try:
+        async with conn.transaction():
+            await conn.execute(PG_MWST_SCHEMA)
+            start_id = (await conn.fetchval("SELECT MAX(id) FROM items") or 0) + 1
+            for index, (wallet_name, wallet_key) in enumerate(wallets):
+                metadata, keys = new_indy_keys(wallet_key)
+                await conn.execute(
+                    "INSERT INTO metadata (wallet_id, value) VALUES ($1, $2)",
+                    wallet_name,
+                    base64.b64encode(metadata),
+                )
+                seed = None if shape.seed is None else shape.seed + index
+                items: List[DecryptedItem] = list(shape.generate(start_id, seed))
+                if base_wallet and index == 0:
+                    items.extend(
+                        _wallet_record(start_id + len(items) + offset, name, key)
+                        for offset, (name, key) in enumerate(wallet_keys.items())
+                    )
+                await _pg_write_items(
+                    conn, IndyEncryptor(keys, b64=True), iter(items), wallet_name
+                )
+                start_id += len(items)
+            await conn.execute(
+                "SELECT setval(pg_get_serial_sequence('items', 'id'), "
+                "(SELECT MAX(id) FROM items))"
+            )
+    finally:
+        await conn.close()
+
+
+def config():
+    parser = argparse.ArgumentParser("askar-upgrade-generate")
+    parser.add_argument(
+        "--strategy",
+        required=True,
+        choices=["dbpw", "mwst-as-profiles", "mwst-as-stores"],
+        help=("Specify the layout of the generated wallets."),
+    )
+    parser.add_argument(
+        "--uri",
+        required=True,
+        help=(
+            "Specify URI of the database to generate. For dbpw with more than "
+            "one wallet, SQLite wallets are written to <dir>/<name>/sqlite.db "
+            "under the directory given as the URI path, and Postgres wallets "
+            "to one database per wallet on the server."
+        ),
+    )
+    parser.add_argument(
+        "--wallets",
+        type=int,
+        default=1,
+        help=("Specify the number of wallets (sub-wallets for mwst-as-profiles)."),
+    )
+    parser.add_argument(
+        "--wallet-name",
+        type=str,
+        default="wallet",
+        help=("Specify the wallet name, or the name prefix for several wallets."),
+    )
+    parser.add_argument(
+        "--wallet-key",
+        type=str,
+        help=("Specify the wallet key. Random keys are generated by default."),
+    )
+    parser.add_argument(
+        "--base-wallet-name",
+        type=str,
+        default="base",
+        help=("Specify the name of the base wallet for mwst-as-profiles."),
+    )
+    parser.add_argument(
+        "--wallet-keys-file",
+        type=str,
+        help=("Write the mapping of wallet names to keys to this file."),
+    )
+    parser.add_argument(
+        "--items",
+        type=int,
+        default=1000,
+        help=("Specify the number of items per wallet."),
+    )
+    parser.add_argument(
+        "--tags",
+        type=int,
+        default=5,
+        help=("Specify the number of encrypted tags per tagged item."),
+    )
+    parser.add_argument(
+        "--plaintext-tags",
+        type=int,
+        default=1,
+        help=("Specify the number of plaintext tags per tagged item."),
+    )
+    parser.add_argument(
+        "--min-value-size",
+        type=int,
+        default=100,
+        help=("Specify the smallest item value size in bytes."),
+    )
+    parser.add_argument(
+        "--max-value-size",
+        type=int,
+        default=2000,
+        help=("Specify the largest item value size in bytes."),
+    )
+    parser.add_argument(
+        "--category",
+        action="append",
+        metavar="NAME=WEIGHT",
+        help=(
+            "Specify the relative weight of an item category. May be repeated; "
+            "replaces the default mix."
+        ),
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help=("Specify a seed for reproducible wallet contents."),
+    )
+    return parser.parse_args(sys.argv[1:])
+
+
+async def main(args: argparse.Namespace) -> Dict[str, str]:
+    categories = None
+    if args.category:
+        categories = {}
+        for entry in args.category:
+            name, _, weight = entry.partition("=")
+            categories[name] = float(weight or 1)
+    shape = WalletShape(
+        args.items,
+        args.tags,
+        args.plaintext_tags,
+        args.min_value_size,
+        args.max_value_size,
+        categories,
+        args.seed,
+    )
+
+    def wallet_key() -> str:
+        return args.wallet_key or secrets.token_urlsafe(24)
+
+    if args.wallets == 1 and args.strategy != "mwst-as-profiles":
+        wallet_keys = {args.wallet_name: wallet_key()}
+    else:
+        wallet_keys = {
+            f"{args.wallet_name}-{index}": wallet_key() for index in range(args.wallets)
+        }
+
+    parsed = urlparse(args.uri)
+    if args.strategy == "dbpw":
+        if parsed.scheme == "sqlite":
+            if len(wallet_keys) == 1:
+                await generate_sqlite(parsed.path, wallet_keys[args.wallet_name], shape)
+            else:
+                for name, key in wallet_keys.items():
+                    os.makedirs(os.path.join(parsed.path, name), exist_ok=True)
+                    path = os.path.join(parsed.path, name, "sqlite.db")
+                    await generate_sqlite(path, key, shape)
+        elif parsed.scheme == "postgres":
+            for name, key in wallet_keys.items():
+                await generate_postgres(
+                    f"{parsed.scheme}://{parsed.netloc}/{name}", key, shape
+                )
+        else:
+            raise ValueError("URI scheme must be one of: sqlite, postgres")
+    else:
+        if parsed.scheme != "postgres":
+            raise ValueError(f"{args.strategy} strategy only valid for Postgres")
+        base_wallet = None
+        if args.strategy == "mwst-as-profiles":
+            base_wallet = (args.base_wallet_name, wallet_key())
+        await generate_postgres_mwst(args.uri, wallet_keys, shape, base_wallet)
+        if base_wallet:
+            wallet_keys = {base_wallet[0]: base_wallet[1], **wallet_keys}
+
+    if args.wallet_keys_file:
+        with open(args.wallet_keys_file, "w") as wkf:
+            json.dump(wallet_keys, wkf, indent=2)
+    return wallet_keys
+
+
+def entrypoint():
+    args = config()
+    wallet_keys = asyncio.run(main(args))
+    if not args.wallet_keys_file:
+        print(json.dumps(wallet_keys, indent=2))
+
+
+if __name__ == "__main__":
+    entrypoint()
@@ -0,0 +1,143 @@
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+JOURNAL_TABLE = "askar_upgrade_journal"
+# Indy tables whose changes are captured
+CAPTURED_TABLES = ("items", "tags_encrypted", "tags_plaintext")
+
+INSTALL = f"""
+    BEGIN TRANSACTION;
+    CREATE TABLE IF NOT EXISTS {JOURNAL_TABLE} (
+        seq BIGSERIAL,
+        wallet_id VARCHAR(64) NOT NULL,
+        item_id BIGINT NOT NULL,
+        old_type BYTEA NULL,
+        old_name BYTEA NULL,
+        PRIMARY KEY (seq)
+    );
+    CREATE INDEX IF NOT EXISTS ix_{JOURNAL_TABLE}_wallet_id
+        ON {JOURNAL_TABLE} (wallet_id, seq);
+
+    -- Updated and deleted items also record their previous type and name,
+    -- which identify the copied item in the target
+    CREATE OR REPLACE FUNCTION {JOURNAL_TABLE}_items() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO {JOURNAL_TABLE} (wallet_id, item_id)
+            VALUES (NEW.wallet_id, NEW.id);
+        ELSE
+            INSERT INTO {JOURNAL_TABLE} (wallet_id, item_id, old_type, old_name)
+            VALUES (OLD.wallet_id, OLD.id, OLD.type, OLD.name);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION {JOURNAL_TABLE}_tags() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO {JOURNAL_TABLE} (wallet_id, item_id)
+            VALUES (OLD.wallet_id, OLD.item_id);
+        ELSE
+            INSERT INTO {JOURNAL_TABLE} (wallet_id, item_id)
+            VALUES (NEW.wallet_id, NEW.item_id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS {JOURNAL_TABLE} ON items;
+    CREATE TRIGGER {JOURNAL_TABLE} AFTER INSERT OR UPDATE OR DELETE ON items
+        FOR EACH ROW EXECUTE PROCEDURE {JOURNAL_TABLE}_items();
+    DROP TRIGGER IF EXISTS {JOURNAL_TABLE} ON tags_encrypted;
+    CREATE TRIGGER {JOURNAL_TABLE} AFTER INSERT OR UPDATE OR DELETE ON tags_encrypted
+        FOR EACH ROW EXECUTE PROCEDURE {JOURNAL_TABLE}_tags();
+    DROP TRIGGER IF EXISTS {JOURNAL_TABLE} ON tags_plaintext;
+    CREATE TRIGGER {JOURNAL_TABLE} AFTER INSERT OR UPDATE OR DELETE ON tags_plaintext
+        FOR EACH ROW EXECUTE PROCEDURE {JOURNAL_TABLE}_tags();
+    COMMIT;
+"""  # noqa
+
+REMOVE = f"""
+    BEGIN TRANSACTION;
+    DROP TRIGGER IF EXISTS {JOURNAL_TABLE} ON items;
+    DROP TRIGGER IF EXISTS {JOURNAL_TABLE} ON tags_encrypted;
+    DROP TRIGGER IF EXISTS {JOURNAL_TABLE} ON tags_plaintext;
+    DROP FUNCTION IF EXISTS {JOURNAL_TABLE}_items();
+    DROP FUNCTION IF EXISTS {JOURNAL_TABLE}_tags();
+    DROP TABLE IF EXISTS {JOURNAL_TABLE};
+    COMMIT;
+"""
+
+# Previous (type, name) of an item, or (None, None) if only inserted or
+# its tags changed
+OldKey = Tuple[Optional[bytes], Optional[bytes]]
+
+
+class ChangeJournal:
+    """Changes to the items of a MultiWalletSingleTable Indy database.
+
+    Triggers on the Indy items and tags tables record the id of every
+    inserted, updated or deleted item, by wallet, while the agent keeps
+    using the database. Replaying a wallet's changes only needs the current
+    rows of the recorded items, and the previous type and name of the
+    updated and deleted ones.
+    """
+
+    def __init__(self, conn: asyncpg.Connection):
+        """Initialize a ChangeJournal instance."""
+        self._conn = conn
+
+    async def install(self):
+        """Start recording changes. Safe to repeat."""
+        await self._conn.execute(INSTALL)
+
+    async def installed(self) -> bool:
+        return await self._conn.fetchval(
+            "SELECT to_regclass($1) IS NOT NULL", JOURNAL_TABLE
+        )
+
+    async def pending(self) -> Dict[str, int]:
+        """Number of recorded changes by wallet."""
+        return dict(
+            await self._conn.fetch(
+                f"SELECT wallet_id, COUNT(*) FROM {JOURNAL_TABLE} GROUP BY wallet_id"
+            )
+        )
+
+    async def changes(
+        self, wallet_id: str
+    ) -> Tuple[List[int], Dict[int, List[OldKey]]]:
+        """Changed item ids of a wallet with their previous types and names.
+
+        Also returns the sequence numbers of the changes read, for `consume`.
+        Sequence numbers are taken before commit, so a change committed later
+        may have a lower number than one already read.
+        """
+        rows = await self._conn.fetch(
+            f"""
+            SELECT seq, item_id, old_type, old_name FROM {JOURNAL_TABLE}
+            WHERE wallet_id = $1 ORDER BY seq
+            """,
+            wallet_id,
+        )
+        changes: Dict[int, List[OldKey]] = {}
+        for _, item_id, old_type, old_name in rows:
+            changes.setdefault(item_id, []).append((old_type, old_name))
+        return [row[0] for row in rows], changes
+
+    async def consume(self, wallet_id: str, seqs: List[int]):
+        """Forget the changes of a wallet read by `changes`, once replayed."""
+        await self._conn.execute(
+            f"""
+            DELETE FROM {JOURNAL_TABLE}
+            WHERE wallet_id = $1 AND seq = ANY($2::bigint[])
+            """,
+            wallet_id,
+            seqs,
+        )
+
+    async def remove(self):
+        """Stop recording changes and drop the journal."""
+        await self._conn.execute(REMOVE)
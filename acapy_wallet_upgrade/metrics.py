@@ -0,0 +1,198 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Wallet that metrics and progress recorded in the current task belong to
+current_wallet: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "wallet", default=None
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@contextlib.contextmanager
+def wallet_scope(name: str) -> Iterator[None]:
+    """Attribute the metrics and progress recorded in the block to a wallet."""
+    token = current_wallet.set(name)
+    try:
+        yield
+    finally:
+        current_wallet.reset(token)
+
+
+class Histogram:
+    """Cumulative histogram of observed values."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """Initialize a Histogram instance."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[int]:
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class Metrics:
+    """Counters and histograms for a migration run.
+
+    Each metric is broken down by labels such as the stage and the Askar
+    category. Metrics recorded inside a `wallet` block are also labelled with
+    the wallet name. Strategies only record metrics when given an instance,
+    so the layer costs nothing when disabled.
+    """
+
+    def __init__(self):
+        """Initialize a Metrics instance."""
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.started = time.time()
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        wallet = current_wallet.get()
+        if wallet is not None and "wallet" not in labels:
+            labels["wallet"] = wallet
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def wallet(self, name: str):
+        """Attribute the metrics recorded in the block to a wallet."""
+        return wallet_scope(name)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """Increase a counter."""
+        series = self.counters.setdefault(name, {})
+        key = self._labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """Record a value in a histogram."""
+        series = self.histograms.setdefault(name, {})
+        key = self._labels(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self) -> dict:
+        """Describe all metrics as a JSON-serializable dict."""
+        return {
+            "started": self.started,
+            "elapsed": time.time() - self.started,
+            "counters": {
+                name: [
+                    {"labels": dict(labels), "value": value}
+                    for labels, value in series.items()
+                ]
+                for name, series in self.counters.items()
+            },
+            "histograms": {
+                name: [
+                    {
+                        "labels": dict(labels),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "buckets": dict(zip(histogram.buckets, histogram.counts)),
+                    }
+                    for labels, histogram in series.items()
+                ]
+                for name, series in self.histograms.items()
+            },
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w") as report:
+            json.dump(self.report(), report, indent=2)
+
+    def prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+
+        def render(labels: Labels, extra: Labels = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            return "{%s}" % ",".join(
+                '%s="%s"' % (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+                for key, value in pairs
+            )
+
+        lines = []
+        for name, series in self.counters.items():
+            lines.append(f"# TYPE askar_upgrade_{name} counter")
+            for labels, value in series.items():
+                lines.append(f"askar_upgrade_{name}{render(labels)} {value}")
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE askar_upgrade_{name} histogram")
+            for labels, histogram in series.items():
+                for bound, count in zip(histogram.buckets, histogram.cumulative()):
+                    le = render(labels, (("le", str(bound)),))
+                    lines.append(f"askar_upgrade_{name}_bucket{le} {count}")
+                le = render(labels, (("le", "+Inf"),))
+                lines.append(f"askar_upgrade_{name}_bucket{le} {histogram.count}")
+                lines.append(
+                    f"askar_upgrade_{name}_sum{render(labels)} {histogram.sum}"
+                )
+                lines.append(
+                    f"askar_upgrade_{name}_count{render(labels)} {histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request.split()
+            if len(parts) > 1 and parts[1] == b"/metrics":
+                status = "200 OK"
+                body = self.prometheus().encode()
+            else:
+                status = "404 Not Found"
+                body = b""
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    @contextlib.asynccontextmanager
+    async def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve the metrics on http://host:port/metrics for the duration."""
+        server = await asyncio.start_server(self._handle, host, port)
+        try:
+            yield server
+        finally:
+            server.close()
+            await server.wait_closed()
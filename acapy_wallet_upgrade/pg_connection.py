@@ -1,11 +1,15 @@
 import base64
-from typing import Optional
+import contextlib
+from itertools import repeat
+from typing import Iterable, List, Optional, Sequence, Tuple
 from urllib.parse import urlparse
 
 import asyncpg
 
 from .db_connection import DbConnection, Wallet
 from .error import UpgradeError
+from .pools import ConnectionPools
+from .records import AskarRow
 
 
 class PgConnection(DbConnection):
@@ -16,15 +20,26 @@ class PgConnection(DbConnection):
     def __init__(
         self,
         uri: str,
+        pools: Optional[ConnectionPools] = None,
     ):
-        """Initialize a PgConnection instance."""
+        """Initialize a PgConnection instance.
+
+        With pools, the connection is borrowed from the database's pool.
+        """
         self.uri = uri
         self.parsed_url = urlparse(uri)
+        self.pools = pools
         self._conn: asyncpg.Connection = None
+        self._pool: Optional[asyncpg.Pool] = None
 
     async def connect(self):
         """Accessor for the connection pool instance."""
         if not self._conn:
+            if self.pools:
+                pool = await self.pools.pool(self.uri)
+                self._conn = await pool.acquire()
+                self._pool = pool
+                return
             parts = self.parsed_url
             self._conn = await asyncpg.connect(
                 host=parts.hostname,
@@ -143,6 +158,7 @@ class PgConnection(DbConnection):
             await self._conn.executemany(
                 """
                     INSERT INTO config (name, value) VALUES($1, $2)
+                    ON CONFLICT DO NOTHING
                 """,
                 (
                     (key, value)
@@ -169,10 +185,81 @@ class PgConnection(DbConnection):
             """
         )
 
+    async def id_ranges(self, count: int) -> List[Tuple[int, int]]:
+        """Split the Indy item ids into up to count ranges of similar size.
+
+        Ranges are half-open, as (first, end) pairs.
+        """
+        row = await self._conn.fetchrow(
+            """
+            SELECT percentile_disc($1::float8[]) WITHIN GROUP (ORDER BY id), MAX(id)
+            FROM items_old
+            """,
+            [index / count for index in range(count)],
+        )
+        starts, last = row
+        if last is None:
+            return []
+        starts = sorted(set(starts))
+        return list(zip(starts, starts[1:] + [last + 1]))
+
+    @contextlib.asynccontextmanager
+    async def exported_snapshot(self):
+        """Export a snapshot of the database, held until the context exits.
+
+        Transactions importing the snapshot with SET TRANSACTION SNAPSHOT
+        all see the same rows.
+        """
+        conn = await asyncpg.connect(self.uri)
+        try:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                yield await conn.fetchval("SELECT pg_export_snapshot()")
+        finally:
+            await conn.close()
+
+    async def optimize_layout(self):
+        """Rewrite the Askar tables in lookup order and gather statistics.
+
+        Items are clustered by profile, kind and category, and tags by item,
+        so that each lookup reads few pages. CLUSTER holds an exclusive lock
+        on each table while rewriting it.
+        """
+        for command in (
+            "CLUSTER items USING ix_items_uniq",
+            "CLUSTER items_tags USING ix_items_tags_item_id",
+            "ANALYZE profiles",
+            "ANALYZE items",
+            "ANALYZE items_tags",
+        ):
+            await self._conn.execute(command)
+
+    async def vacuum(self, tables: Sequence[str]):
+        """Reclaim the space of deleted rows and refresh statistics."""
+        # VACUUM cannot run in a transaction, so one statement at a time
+        for table in tables:
+            await self._conn.execute(f"VACUUM (ANALYZE) {table}")
+
+    async def table_sizes(self, tables: Sequence[str]) -> List[Tuple[str, int, int]]:
+        """Sizes in bytes of each existing table and of its indexes."""
+        return [
+            tuple(row)
+            for row in await self._conn.fetch(
+                """
+                SELECT t, pg_table_size(to_regclass(t)), pg_indexes_size(to_regclass(t))
+                FROM unnest($1::text[]) t WHERE to_regclass(t) IS NOT NULL
+                """,
+                list(tables),
+            )
+        ]
+
     async def close(self):
         """Release the connection."""
         if self._conn:
-            await self._conn.close()
+            if self._pool:
+                await self._pool.release(self._conn)
+                self._pool = None
+            else:
+                await self._conn.close()
             self._conn = None
 
     def get_wallet(self) -> "PgWallet":
@@ -186,12 +273,18 @@ class PgWallet(Wallet):
         new_conn: asyncpg.Connection,
         items_table: str,
         wallet_id: str,
+        delete_source: bool = True,
     ):
         self._old_conn = old_conn
         self._new_conn = new_conn
         self._items_table = items_table
         self._wallet_id = wallet_id
+        self._delete_source = delete_source
         self._profile_id = None
+        self._reader: Optional[asyncpg.Connection] = None
+        self._prefetch: Optional[int] = None
+        self._snapshot: Optional[str] = None
+        self._id_range: Optional[Tuple[int, int]] = None
 
     @property
     def profile_id(self):
@@ -210,6 +303,11 @@ class PgWallet(Wallet):
                 name,
                 key,
             )
+            if not id_row:
+                # Inserted by an earlier run that was interrupted
+                id_row = await self._new_conn.fetch(
+                    "SELECT id FROM profiles WHERE name = $1", name
+                )
             self._profile_id = id_row[0][0]
             return self._profile_id
 
@@ -233,57 +331,219 @@ class PgWallet(Wallet):
         else:
             raise Exception("Row not found")
 
-    async def fetch_pending_items(self, batch_size: int):
+    def use_cursor(self, reader: asyncpg.Connection, prefetch: int):
+        """Stream pending items through a server-side cursor on reader.
+
+        The reader connection must be dedicated to this wallet: the cursor
+        holds a read-only transaction open on it for the whole wallet.
+        """
+        self._reader = reader
+        self._prefetch = prefetch
+
+    def partition(
+        self,
+        writer: asyncpg.Connection,
+        reader: asyncpg.Connection,
+        snapshot: str,
+        first: int,
+        end: int,
+        prefetch: int,
+    ) -> "PgWallet":
+        """View of the items with ids in [first, end) as of an exported snapshot.
+
+        The view streams its items through a cursor on reader, inside a
+        transaction importing the snapshot, and writes through writer.
+        """
+        view = PgWallet(
+            writer, writer, self._items_table, self._wallet_id, self._delete_source
+        )
+        view._profile_id = self._profile_id
+        view.use_cursor(reader, prefetch)
+        view._snapshot = snapshot
+        view._id_range = (first, end)
+        return view
+
+    async def count_pending_items(self) -> int:
+        """Count the items that have not been updated yet."""
+        if self._wallet_id:
+            return await self._old_conn.fetchval(
+                f"SELECT COUNT(*) FROM {self._items_table} WHERE wallet_id = $1",
+                self._wallet_id,
+            )
+        return await self._old_conn.fetchval(
+            f"SELECT COUNT(*) FROM {self._items_table}"
+        )
+
+    def _pending_items_query(self, limit: bool, max_bytes: bool = False) -> str:
+        command = """
+                SELECT i.id, i.type, i.name, i.value, i.key,
+                (SELECT string_agg(encode(te.name::bytea, 'hex') || ':' || encode(te.value::bytea, 'hex')::text, ',')
+                    FROM tags_encrypted te WHERE te.item_id = i.id) AS tags_enc,
+                (SELECT string_agg(encode(tp.name::bytea, 'hex') || ':' || encode(tp.value::bytea, 'hex')::text, ',')
+                    FROM tags_plaintext tp WHERE tp.item_id = i.id) AS tags_plain
+                """  # noqa
+        where = " WHERE wallet_id = $1" if self._wallet_id else ""
+        param = 2 if self._wallet_id else 1
+        if self._id_range:
+            where += " AND" if where else " WHERE"
+            where += f" id >= ${param} AND id < ${param + 1}"
+            param += 2
+        if max_bytes:
+            # Keep the leading rows whose values fit in the byte budget, and
+            # always the first row
+            command += f"""
+                FROM (
+                    SELECT b.*, SUM(octet_length(b.value)) OVER (ORDER BY b.id) AS total,
+                    ROW_NUMBER() OVER (ORDER BY b.id) AS position
+                    FROM (
+                        SELECT * FROM {self._items_table}{where}
+                        ORDER BY id LIMIT ${param}
+                    ) b
+                ) i
+                WHERE i.total <= ${param + 1} OR i.position = 1
+                """  # noqa
+        else:
+            command += f"FROM {self._items_table} i{where}"
+            if limit:
+                command += f" LIMIT ${param}"
+        return command
+
+    async def fetch_pending_items(
+        self, batch_size: int, max_bytes: Optional[int] = None
+    ):
         """Fetch un-updated items by wallet_id, if it exists."""
+        if self._reader:
+            batches = self._stream_pending_items(batch_size, max_bytes)
+            new_size = None
+            while True:
+                try:
+                    rows = await batches.asend(new_size)
+                except StopAsyncIteration:
+                    break
+                new_size = yield rows
+            return
+
+        command = self._pending_items_query(limit=True, max_bytes=bool(max_bytes))
         while True:
-            command = """
-                    SELECT i.id, i.type, i.name, i.value, i.key,
-                    (SELECT string_agg(encode(te.name::bytea, 'hex') || ':' || encode(te.value::bytea, 'hex')::text, ',')
-                        FROM tags_encrypted te WHERE te.item_id = i.id) AS tags_enc,
-                    (SELECT string_agg(encode(tp.name::bytea, 'hex') || ':' || encode(tp.value::bytea, 'hex')::text, ',')
-                        FROM tags_plaintext tp WHERE tp.item_id = i.id) AS tags_plain
-                    """  # noqa
-            if self._wallet_id:
-                command += (
-                    f"FROM {self._items_table} i WHERE i.wallet_id = $2 LIMIT $1;"
-                )
-                rows = await self._old_conn.fetch(
-                    command,
-                    batch_size,
-                    self._wallet_id,
-                )
-            else:
-                command += f"FROM {self._items_table} i LIMIT $1;"
-                rows = await self._old_conn.fetch(command, batch_size)
+            args = (self._wallet_id, batch_size) if self._wallet_id else (batch_size,)
+            if max_bytes:
+                args += (max_bytes,)
+            rows = await self._old_conn.fetch(command, *args)
             if not rows:
                 break
-            yield rows
+            batch_size = (yield rows) or batch_size
+
+    async def _stream_pending_items(
+        self, batch_size: int, max_bytes: Optional[int] = None
+    ):
+        """Fetch all pending items with one server-side cursor.
+
+        The query is planned and started once per wallet, and the client
+        holds at most `prefetch` rows beyond the batch being processed.
+        Batches are cut at `batch_size` rows or `max_bytes` value bytes,
+        whichever comes first.
+        """
+        command = self._pending_items_query(limit=False)
+        args = (self._wallet_id,) if self._wallet_id else ()
+        if self._id_range:
+            args += self._id_range
+        async with self._reader.transaction(isolation="repeatable_read", readonly=True):
+            if self._snapshot:
+                await self._reader.execute(
+                    f"SET TRANSACTION SNAPSHOT '{self._snapshot}'"
+                )
+            rows = []
+            size = 0
+            async for row in self._reader.cursor(
+                command, *args, prefetch=self._prefetch
+            ):
+                row_size = len(row[3])
+                if rows and max_bytes and size + row_size > max_bytes:
+                    batch_size = (yield rows) or batch_size
+                    rows = []
+                    size = 0
+                rows.append(row)
+                size += row_size
+                if len(rows) >= batch_size:
+                    batch_size = (yield rows) or batch_size
+                    rows = []
+                    size = 0
+            if rows:
+                yield rows
 
     async def update_items(self, items):
         """Update items in the database."""
         del_ids = []
         for item in items:
-            del_ids = item["id"]
+            del_ids = item.id
             async with self._new_conn.transaction():
                 ins = await self._new_conn.fetch(
                     """
                         INSERT INTO items (profile_id, kind, category, name, value)
-                        VALUES ($1, 2, $2, $3, $4) RETURNING id
+                        VALUES ($1, 2, $2, $3, $4)
+                        ON CONFLICT DO NOTHING RETURNING id
                     """,
                     self._profile_id or 1,
-                    item["category"],
-                    item["name"],
-                    item["value"],
+                    item.category,
+                    item.name,
+                    item.value,
                 )
-                item_id = ins[0][0]
-                if item["tags"]:
-                    await self._new_conn.executemany(
-                        """
-                            INSERT INTO items_tags (item_id, plaintext, name, value)
-                            VALUES ($1, $2, $3, $4)
-                        """,
-                        ((item_id, *tag) for tag in item["tags"]),
+                # Items copied by an earlier, interrupted run are only deleted
+                if ins and item.tag_names:
+                    await self._insert_tags(ins[0][0], item)
+                if self._delete_source:
+                    await self._old_conn.execute(
+                        f"DELETE FROM {self._items_table} WHERE id IN ($1)", del_ids
                     )
-                await self._old_conn.execute(
-                    f"DELETE FROM {self._items_table} WHERE id IN ($1)", del_ids
+
+    async def _insert_tags(self, item_id: int, item: AskarRow):
+        await self._new_conn.executemany(
+            """
+                INSERT INTO items_tags (item_id, plaintext, name, value)
+                VALUES ($1, $2, $3, $4)
+            """,
+            zip(
+                repeat(item_id),
+                item.tag_plaintext,
+                item.tag_names,
+                item.tag_values,
+            ),
+        )
+
+    async def fetch_items(self, ids: Sequence[int]):
+        """Fetch the wallet's items with the given ids, if they still exist."""
+        command = self._pending_items_query(limit=False)
+        if self._wallet_id:
+            command += " AND i.id = any($2::bigint[])"
+            return await self._old_conn.fetch(command, self._wallet_id, list(ids))
+        command += " WHERE i.id = any($1::bigint[])"
+        return await self._old_conn.fetch(command, list(ids))
+
+    async def replace_items(
+        self, stale: Iterable[Tuple[bytes, bytes]], items: Sequence[AskarRow]
+    ):
+        """Delete items by (category, name) and insert items, atomically.
+
+        The source is left untouched.
+        """
+        async with self._new_conn.transaction():
+            await self._new_conn.executemany(
+                """
+                    DELETE FROM items
+                    WHERE profile_id = $1 AND kind = 2 AND category = $2 AND name = $3
+                """,
+                [(self.profile_id, category, name) for category, name in stale],
+            )
+            for item in items:
+                item_id = await self._new_conn.fetchval(
+                    """
+                        INSERT INTO items (profile_id, kind, category, name, value)
+                        VALUES ($1, 2, $2, $3, $4) RETURNING id
+                    """,
+                    self.profile_id,
+                    item.category,
+                    item.name,
+                    item.value,
                 )
+                if item.tag_names:
+                    await self._insert_tags(item_id, item)
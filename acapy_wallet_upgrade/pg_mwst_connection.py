@@ -1,11 +1,24 @@
+import asyncio
 import base64
-from typing import Optional
+from typing import Optional, Set
+from urllib.parse import urlparse
 
 from asyncpg import Connection
 import asyncpg
 
 from .error import UpgradeError
 from .pg_connection import PgConnection, PgWallet
+from .pools import ConnectionPools, admin_uri
+
+
+# Databases are created one at a time: Postgres refuses to copy the template
+# database while another session is connected to it
+_create_lock = asyncio.Lock()
+
+# Database holding the Askar schema, copied into each new store database
+TEMPLATE_DATABASE = "askar_upgrade_template"
+# Attempts at copying the template while another session is connected to it
+TEMPLATE_ATTEMPTS = 10
 
 
 class PgMWSTConnection(PgConnection):
@@ -14,9 +27,33 @@ class PgMWSTConnection(PgConnection):
 
     DB_TYPE = "pgsql_mwst"
 
+    def __init__(
+        self,
+        uri: str,
+        template: Optional["DatabaseTemplate"] = None,
+        pools: Optional[ConnectionPools] = None,
+    ):
+        """Initialize a PgMWSTConnection instance.
+
+        A missing database is created from the template if one is given.
+        """
+        super().__init__(uri, pools)
+        self.template = template
+        # Whether connecting created the database from the template, whose
+        # schema then needs no pre_upgrade
+        self.from_template = False
+
     async def connect(self):
         """Accessor for the connection pool instance."""
-        if not self._conn:
+        if self._conn:
+            return
+        if self.pools:
+            try:
+                await super().connect()
+            except asyncpg.InvalidCatalogNameError:
+                await self._create(self.parsed_url)
+                await super().connect()
+        else:
             self._conn = await self.connect_create_if_not_exists(self.parsed_url)
 
     async def connect_create_if_not_exists(self, parts):
@@ -30,17 +67,7 @@ class PgMWSTConnection(PgConnection):
             )
         except asyncpg.InvalidCatalogNameError:
             # Database does not exist, create it.
-            sys_conn = await asyncpg.connect(
-                host=parts.hostname,
-                port=parts.port or 5432,
-                user=parts.username,
-                password=parts.password,
-                database="template1",
-            )
-            await sys_conn.execute(
-                f'CREATE DATABASE "{parts.path[1:]}" OWNER "{parts.username}"'
-            )
-            await sys_conn.close()
+            await self._create(parts)
 
             # Connect to the newly created database.
             conn = await asyncpg.connect(
@@ -53,25 +80,63 @@ class PgMWSTConnection(PgConnection):
 
         return conn
 
+    async def _create(self, parts):
+        if self.template:
+            self.from_template = await self.template.create(parts.path[1:])
+        elif self.pools:
+            async with _create_lock, self.pools.connection(
+                admin_uri(self.uri)
+            ) as admin:
+                try:
+                    await admin.execute(
+                        f'CREATE DATABASE "{parts.path[1:]}" OWNER "{parts.username}"'
+                    )
+                except asyncpg.DuplicateDatabaseError:
+                    pass
+        else:
+            await self._create_database(parts)
+
+    async def _create_database(self, parts):
+        async with _create_lock:
+            sys_conn = await asyncpg.connect(
+                host=parts.hostname,
+                port=parts.port or 5432,
+                user=parts.username,
+                password=parts.password,
+                database="template1",
+            )
+            try:
+                await sys_conn.execute(
+                    f'CREATE DATABASE "{parts.path[1:]}" OWNER "{parts.username}"'
+                )
+            except asyncpg.DuplicateDatabaseError:
+                # Created by another worker in the meantime
+                pass
+            finally:
+                await sys_conn.close()
+
     async def pre_upgrade(self):
-        """Add new tables and columns."""
+        """Add new tables and columns.
+
+        Safe to repeat, so that an interrupted migration can be resumed.
+        """
         await self._conn.execute(
             """
             BEGIN TRANSACTION;
-            CREATE TABLE config (
+            CREATE TABLE IF NOT EXISTS config (
                 name TEXT NOT NULL,
                 value TEXT,
                 PRIMARY KEY (name)
             );
-            CREATE TABLE profiles (
+            CREATE TABLE IF NOT EXISTS profiles (
                 id BIGSERIAL,
                 name TEXT NOT NULL,
                 reference TEXT NULL,
                 profile_key BYTEA NULL,
                 PRIMARY KEY (id)
             );
-            CREATE UNIQUE INDEX ix_profile_name ON profiles (name);
-            CREATE TABLE items (
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_profile_name ON profiles (name);
+            CREATE TABLE IF NOT EXISTS items (
                 id BIGSERIAL,
                 profile_id BIGINT NOT NULL,
                 kind SMALLINT NOT NULL,
@@ -83,9 +148,9 @@ class PgMWSTConnection(PgConnection):
                 FOREIGN KEY (profile_id) REFERENCES profiles (id)
                     ON DELETE CASCADE ON UPDATE CASCADE
             );
-            CREATE UNIQUE INDEX ix_items_uniq ON items
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_items_uniq ON items
                 (profile_id, kind, category, name);
-            CREATE TABLE items_tags (
+            CREATE TABLE IF NOT EXISTS items_tags (
                 id BIGSERIAL,
                 item_id BIGINT NOT NULL,
                 name BYTEA NOT NULL,
@@ -95,11 +160,11 @@ class PgMWSTConnection(PgConnection):
                 FOREIGN KEY (item_id) REFERENCES items (id)
                     ON DELETE CASCADE ON UPDATE CASCADE
             );
-            CREATE INDEX ix_items_tags_item_id ON items_tags(item_id);
-            CREATE INDEX ix_items_tags_name_enc
+            CREATE INDEX IF NOT EXISTS ix_items_tags_item_id ON items_tags(item_id);
+            CREATE INDEX IF NOT EXISTS ix_items_tags_name_enc
                 ON items_tags(name, SUBSTR(value, 1, 12)) include (item_id)
                 WHERE plaintext=0;
-            CREATE INDEX ix_items_tags_name_plain
+            CREATE INDEX IF NOT EXISTS ix_items_tags_name_plain
                 ON items_tags(name, value) include (item_id)
                 WHERE plaintext=1;
             COMMIT;
@@ -111,9 +176,111 @@ class PgMWSTConnection(PgConnection):
 
         await self._conn.execute(
             """
-            INSERT INTO config (name, value) VALUES ('version', 1);
+            INSERT INTO config (name, value) VALUES ('version', 1)
+            ON CONFLICT DO NOTHING;
             """
         )
 
-    def get_wallet(self, old_conn: Connection, wallet_id: str) -> "PgWallet":
-        return PgWallet(old_conn, self._conn, "items", wallet_id)
+    async def profile_names(self) -> Set[str]:
+        """Names of the profiles already created."""
+        return {row[0] for row in await self._conn.fetch("SELECT name FROM profiles")}
+
+    def get_wallet(
+        self, old_conn: Connection, wallet_id: str, delete_source: bool = True
+    ) -> "PgWallet":
+        return PgWallet(old_conn, self._conn, "items", wallet_id, delete_source)
+
+
+class DatabaseTemplate:
+    """Template database with the Askar schema, for new store databases.
+
+    Each database is created with CREATE DATABASE ... TEMPLATE over one
+    long-lived admin connection, so Postgres copies the template's files
+    instead of a new admin connection and the schema script per database.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        name: str = TEMPLATE_DATABASE,
+        pools: Optional[ConnectionPools] = None,
+    ):
+        """Initialize a DatabaseTemplate instance.
+
+        With pools, the admin connection is borrowed from the admin pool.
+        """
+        self.parsed_url = urlparse(uri)
+        self.name = name
+        self.pools = pools
+        self._admin: Optional[Connection] = None
+        self._admin_pool: Optional[asyncpg.Pool] = None
+        self._lock = asyncio.Lock()
+        self._built = False
+
+    @property
+    def uri(self) -> str:
+        parts = self.parsed_url
+        return f"{parts.scheme}://{parts.netloc}/{self.name}"
+
+    async def open(self):
+        """Open the admin connection."""
+        # The admin session stays connected, so not to template1, which
+        # CREATE DATABASE copies by default
+        if self.pools:
+            self._admin_pool = await self.pools.pool(admin_uri(self.uri))
+            self._admin = await self._admin_pool.acquire()
+        else:
+            self._admin = await asyncpg.connect(admin_uri(self.uri))
+
+    async def build(self):
+        """Build the template if missing.
+
+        Building is safe to repeat, and the template is shared by every
+        process migrating the same server.
+        """
+        conn = PgMWSTConnection(self.uri)
+        await conn.connect()
+        try:
+            await conn.pre_upgrade()
+        finally:
+            await conn.close()
+
+    async def create(self, database: str) -> bool:
+        """Create a database as a copy of the template.
+
+        The template is built before the first copy. Returns whether the
+        database was created, rather than by another worker in the meantime.
+        """
+        async with self._lock:
+            if not self._built:
+                await self.build()
+                self._built = True
+            for attempt in range(TEMPLATE_ATTEMPTS):
+                try:
+                    await self._admin.execute(
+                        f'CREATE DATABASE "{database}" '
+                        f'OWNER "{self.parsed_url.username}" TEMPLATE "{self.name}"'
+                    )
+                    return True
+                except asyncpg.DuplicateDatabaseError:
+                    # Created by another worker in the meantime
+                    return False
+                except asyncpg.ObjectInUseError:
+                    # Another process is building the template
+                    if attempt == TEMPLATE_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(1)
+
+    async def drop(self):
+        """Drop the template, once no more databases are created from it."""
+        await self._admin.execute(f'DROP DATABASE IF EXISTS "{self.name}"')
+
+    async def close(self):
+        """Close the admin connection."""
+        if self._admin:
+            if self._admin_pool:
+                await self._admin_pool.release(self._admin)
+                self._admin_pool = None
+            else:
+                await self._admin.close()
+            self._admin = None
@@ -0,0 +1,61 @@
+import asyncio
+import contextlib
+from typing import Dict
+from urllib.parse import urlparse
+
+import asyncpg
+
+# Maintenance database the admin connections use. Unlike template1, it is
+# not copied by CREATE DATABASE, so admin sessions may stay connected to it.
+ADMIN_DATABASE = "postgres"
+
+
+def admin_uri(uri: str) -> str:
+    """URI of the maintenance database on the server of uri."""
+    parts = urlparse(uri)
+    return f"{parts.scheme}://{parts.netloc}/{ADMIN_DATABASE}"
+
+
+class ConnectionPools:
+    """asyncpg pools shared across wallets and phases, one per database.
+
+    Pools are created on first use and open connections as needed, up to
+    `max_size` per database, so wallets migrated one after the other reuse
+    the connections, and their handshakes, of the ones before.
+    """
+
+    def __init__(self, max_size: int = 4):
+        """Initialize a ConnectionPools instance."""
+        self.max_size = max_size
+        self._pools: Dict[str, asyncpg.Pool] = {}
+        self._lock = asyncio.Lock()
+
+    async def pool(self, uri: str) -> asyncpg.Pool:
+        """Pool of connections to the database of uri."""
+        async with self._lock:
+            pool = self._pools.get(uri)
+            if pool is None:
+                pool = self._pools[uri] = await asyncpg.create_pool(
+                    uri, min_size=0, max_size=self.max_size
+                )
+            return pool
+
+    @contextlib.asynccontextmanager
+    async def connection(self, uri: str):
+        """Borrow a connection to the database of uri."""
+        async with (await self.pool(uri)).acquire() as conn:
+            yield conn
+
+    async def release(self, uri: str):
+        """Close the pool of one database, such as before dropping it."""
+        async with self._lock:
+            pool = self._pools.pop(uri, None)
+        if pool:
+            await pool.close()
+
+    async def close(self):
+        """Close every pool."""
+        async with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        await asyncio.gather(*(pool.close() for pool in pools))
@@ -0,0 +1,298 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from typing import Deque, Dict, Iterator, Optional, TextIO, Tuple
+
+from .metrics import current_wallet
+
+# Progress is tracked per (wallet, stage)
+Key = Tuple[str, str]
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "TiB"
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+class _Entry:
+    """Counts and recent samples for one wallet and stage."""
+
+    def __init__(self, window: float):
+        self.done = 0
+        self.total: Optional[int] = None
+        self.window = window
+        self.samples: Deque[Tuple[float, int]] = deque()
+
+    def add(self, amount: int, now: float):
+        self.done += amount
+        samples = self.samples
+        # Keep at most ten samples per second
+        if len(samples) > 1 and now - samples[-2][0] < 0.1:
+            samples[-1] = (now, self.done)
+        else:
+            samples.append((now, self.done))
+        while len(samples) > 2 and samples[1][0] < now - self.window:
+            samples.popleft()
+
+    def rate(self) -> float:
+        if len(self.samples) < 2:
+            return 0.0
+        (start, first), (end, last) = self.samples[0], self.samples[-1]
+        return (last - first) / (end - start) if end > start else 0.0
+
+
+class ProgressTracker:
+    """Progress of a migration across wallets, tasks and processes.
+
+    Totals are set from count queries before each stage starts, and every
+    update records a sample from which a rolling items per second rate and
+    ETA are derived. Output is written at most once per interval, so updates
+    stay cheap enough for the hot loop, either as text lines or as NDJSON
+    records for orchestration tooling.
+
+    Updates may come from any number of tasks or threads. Worker processes
+    send theirs through a queue, see `remote` and `listen`.
+    """
+
+    def __init__(
+        self,
+        mode: str = "text",
+        interval: float = 1.0,
+        window: float = 30.0,
+        stream: Optional[TextIO] = None,
+    ):
+        """Initialize a ProgressTracker instance."""
+        if mode not in ("text", "ndjson"):
+            raise ValueError(f"Unknown progress mode: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.window = window
+        self.stream = stream or sys.stderr
+        self.started = time.monotonic()
+        self._entries: Dict[Key, _Entry] = {}
+        self._overall = _Entry(window)
+        self._overall.samples.append((self.started, 0))
+        self._next_emit = 0.0
+        self._lock = threading.Lock()
+
+    def _entry(self, key: Key) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(self.window)
+        return entry
+
+    @staticmethod
+    def _key(stage: str, wallet: Optional[str]) -> Key:
+        return (wallet or current_wallet.get() or "", stage)
+
+    def set_total(self, stage: str, total: int, wallet: Optional[str] = None):
+        """Set the expected number of items for a stage of a wallet."""
+        with self._lock:
+            entry = self._entry(self._key(stage, wallet))
+            entry.total = total
+            if not entry.samples:
+                entry.samples.append((time.monotonic(), entry.done))
+
+    def update(self, stage: str, amount: int, wallet: Optional[str] = None):
+        """Record processed items, writing progress if the interval passed."""
+        now = time.monotonic()
+        key = self._key(stage, wallet)
+        with self._lock:
+            self._entry(key).add(amount, now)
+            self._overall.add(amount, now)
+            if now < self._next_emit:
+                return
+            self._next_emit = now + self.interval
+            self._emit(now, key)
+
+    def finish(self):
+        """Write the final progress."""
+        with self._lock:
+            self._emit(time.monotonic(), None)
+
+    def _describe(self, entry: _Entry, total: Optional[int]) -> dict:
+        rate = entry.rate()
+        eta = None
+        if total is not None and rate > 0:
+            eta = max(0, total - entry.done) / rate
+        return {"done": entry.done, "total": total, "rate": rate, "eta": eta}
+
+    def _overall_total(self) -> Optional[int]:
+        totals = [entry.total for entry in self._entries.values()]
+        if not totals or None in totals:
+            return None
+        return sum(totals)
+
+    def _emit(self, now: float, key: Optional[Key]):
+        overall = self._describe(self._overall, self._overall_total())
+        if self.mode == "ndjson":
+            record = {
+                "elapsed": round(now - self.started, 3),
+                "wallets": [
+                    {
+                        "wallet": wallet,
+                        "stage": stage,
+                        **self._describe(entry, entry.total),
+                    }
+                    for (wallet, stage), entry in self._entries.items()
+                ],
+                "overall": overall,
+            }
+            if key is None:
+                record["final"] = True
+            line = json.dumps(record)
+        else:
+            parts = []
+            if key is not None:
+                entry = self._entries[key]
+                wallet, stage = key
+                label = f"{wallet} {stage}" if wallet else stage
+                parts.append(
+                    f"{label} {self._text(self._describe(entry, entry.total))}"
+                )
+            parts.append(f"overall {self._text(overall)}")
+            line = "Progress: " + " | ".join(parts)
+        print(line, file=self.stream, flush=True)
+
+    @staticmethod
+    def _text(state: dict) -> str:
+        done, total = state["done"], state["total"]
+        if total:
+            count = f"{done}/{total} ({min(done / total, 1):.0%})"
+        else:
+            count = str(done)
+        return (
+            f"{count} {state['rate']:.0f} items/s ETA {format_duration(state['eta'])}"
+        )
+
+    def remote(self, queue) -> "RemoteProgress":
+        """Create a picklable reporter for a worker process."""
+        return RemoteProgress(queue, self.interval)
+
+    def listen(self, queue) -> threading.Thread:
+        """Apply updates sent by RemoteProgress reporters through queue.
+
+        Runs in a daemon thread until None is put on the queue.
+        """
+
+        def run():
+            while True:
+                message = queue.get()
+                if message is None:
+                    return
+                for (wallet, stage), (total, amount) in message.items():
+                    if total is not None:
+                        self.set_total(stage, total, wallet)
+                    if amount:
+                        self.update(stage, amount, wallet)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class RemoteProgress:
+    """Progress reporter for worker processes.
+
+    Updates are buffered and sent to the parent's ProgressTracker through a
+    multiprocessing queue at most once per interval.
+    """
+
+    def __init__(self, queue, interval: float = 1.0):
+        """Initialize a RemoteProgress instance."""
+        self.queue = queue
+        self.interval = interval
+        self._pending: Dict[Key, list] = {}
+        self._next_send = 0.0
+
+    def __getstate__(self):
+        return {"queue": self.queue, "interval": self.interval}
+
+    def __setstate__(self, state):
+        self.__init__(state["queue"], state["interval"])
+
+    def _pending_entry(self, stage: str, wallet: Optional[str]) -> list:
+        key = ProgressTracker._key(stage, wallet)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = [None, 0]
+        return entry
+
+    def set_total(self, stage: str, total: int, wallet: Optional[str] = None):
+        self._pending_entry(stage, wallet)[0] = total
+        self.flush()
+
+    def update(self, stage: str, amount: int, wallet: Optional[str] = None):
+        self._pending_entry(stage, wallet)[1] += amount
+        now = time.monotonic()
+        if now >= self._next_send:
+            self._next_send = now + self.interval
+            self.flush()
+
+    def flush(self):
+        """Send buffered updates."""
+        if self._pending:
+            self.queue.put({key: tuple(value) for key, value in self._pending.items()})
+            self._pending = {}
+
+    def finish(self):
+        self.flush()
+
+
+# Progress reporter of the current worker process
+_worker_progress: Optional[RemoteProgress] = None
+
+
+def _init_worker(progress: Optional[RemoteProgress]):
+    global _worker_progress
+    _worker_progress = progress
+
+
+def worker_progress() -> Optional[RemoteProgress]:
+    """Progress reporter of the current worker_pool process, if any."""
+    return _worker_progress
+
+
+@contextlib.contextmanager
+def worker_pool(
+    workers: int, progress: Optional[ProgressTracker]
+) -> Iterator[ProcessPoolExecutor]:
+    """Spawn a process pool whose workers report to progress.
+
+    Worker updates are relayed through a managed queue, and are all applied
+    once the pool has shut down.
+    """
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager() if progress else None
+    queue = manager.Queue() if manager else None
+    listener = progress.listen(queue) if progress and queue else None
+    try:
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(progress.remote(queue) if progress and queue else None,),
+        ) as pool:
+            yield pool
+    finally:
+        if manager and queue and listener:
+            queue.put(None)
+            listener.join()
+            manager.shutdown()
@@ -0,0 +1,28 @@
+from typing import List, NamedTuple, Optional
+
+
+class DecryptedItem(NamedTuple):
+    """An Indy item after decryption.
+
+    Tags are held as parallel sequences rather than one tuple per tag.
+    """
+
+    id: int
+    type: bytes
+    name: bytes
+    value: Optional[bytes]
+    tag_plaintext: List[int]
+    tag_names: List[bytes]
+    tag_values: List[bytes]
+
+
+class AskarRow(NamedTuple):
+    """An item encrypted for Askar, ready to be written to the items tables."""
+
+    id: int
+    category: bytes
+    name: bytes
+    value: bytes
+    tag_plaintext: List[int]
+    tag_names: List[bytes]
+    tag_values: List[bytes]
@@ -0,0 +1,182 @@
+import asyncio
+import contextlib
+from datetime import datetime, timedelta
+import heapq
+import re
+import time
+from typing import (
+    Any,
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .progress import format_duration
+
+
+class CostModel(NamedTuple):
+    """Rough cost in seconds of migrating a wallet.
+
+    Only the relative costs matter for the order wallets are started in; the
+    absolute values just make the reported makespan readable.
+    """
+
+    # Key derivations, and creating and opening the target store
+    wallet: float = 1.5
+    item: float = 0.001
+    byte: float = 5e-9
+
+    def cost(self, items: int, nbytes: int) -> float:
+        return self.wallet + items * self.item + nbytes * self.byte
+
+
+def parse_deadline(value: str, now: Optional[datetime] = None) -> float:
+    """Timestamp of a deadline given as an ISO 8601 date and time or HH:MM.
+
+    A time of day means its next occurrence, in local time unless an offset
+    is given.
+    """
+    now = now or datetime.now().astimezone()
+    if re.fullmatch(r"\d{1,2}:\d{2}", value):
+        clock = datetime.strptime(value, "%H:%M").time()
+        deadline = datetime.combine(now.date(), clock, now.tzinfo)
+        if deadline <= now:
+            deadline += timedelta(days=1)
+        return deadline.timestamp()
+    try:
+        deadline = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid deadline: {value}") from None
+    if deadline.tzinfo is None:
+        deadline = deadline.astimezone()
+    return deadline.timestamp()
+
+
+class WalletScheduler:
+    """Longest-processing-time-first scheduling of wallets across workers.
+
+    Wallets are started largest first, each on whichever worker becomes free
+    next, so that the few largest wallets start early and run alongside the
+    many small ones instead of being left running alone at the end. The
+    makespan of this schedule is at most 4/3 of the optimum.
+
+    Given a deadline, a wallet is only started if it is expected to finish
+    before it. Expected durations are the modelled costs, scaled by the ratio
+    of measured to modelled time of the wallets finished so far. Wallets
+    that would not finish in time are left untouched and listed in
+    `deferred`; smaller wallets after them may still be started.
+    """
+
+    def __init__(
+        self,
+        sizes: Dict[str, Tuple[int, int]],
+        workers: int = 1,
+        model: CostModel = CostModel(),
+        deadline: Optional[float] = None,
+    ):
+        """Initialize a WalletScheduler instance.
+
+        Sizes are (items, value bytes) by wallet, and the deadline is a
+        timestamp.
+        """
+        self.sizes = sizes
+        self.workers = max(1, workers)
+        self.model = model
+        self.deadline = deadline
+        self.deferred: List[str] = []
+        # Measured seconds and modelled cost of the finished wallets
+        self._measured = 0.0
+        self._modelled = 0.0
+
+    def cost(self, wallet: str) -> float:
+        return self.model.cost(*self.sizes.get(wallet, (0, 0)))
+
+    def expected(self, wallet: str) -> float:
+        """Expected seconds to migrate a wallet, calibrated on finished ones."""
+        if self._modelled > 0:
+            return self.cost(wallet) * self._measured / self._modelled
+        return self.cost(wallet)
+
+    def fits(self, wallet: str, now: Optional[float] = None) -> bool:
+        """Whether a wallet started now is expected to finish by the deadline."""
+        if self.deadline is None:
+            return True
+        return (now or time.time()) + self.expected(wallet) <= self.deadline
+
+    def order(self, wallets: Sequence[str]) -> List[str]:
+        """Wallets in the order they are started: largest first."""
+        return sorted(wallets, key=self.cost, reverse=True)
+
+    def makespan(self, wallets: Sequence[str]) -> float:
+        """Expected time until the last wallet finishes."""
+        loads = [0.0] * min(self.workers, len(wallets))
+        for wallet in self.order(wallets):
+            heapq.heapreplace(loads, loads[0] + self.cost(wallet))
+        return max(loads, default=0.0)
+
+    def report(self, wallets: Sequence[str]):
+        total = sum(self.cost(wallet) for wallet in wallets)
+        largest = max((self.cost(wallet) for wallet in wallets), default=0.0)
+        print(
+            f"Scheduling {len(wallets)} wallet(s) largest first on "
+            f"{min(self.workers, len(wallets))} worker(s): expected makespan "
+            f"{format_duration(self.makespan(wallets))} (total "
+            f"{format_duration(total)}, largest wallet {format_duration(largest)})"
+        )
+        if self.deadline is not None:
+            print(
+                "Starting only wallets expected to finish by the deadline, in "
+                f"{format_duration(max(0.0, self.deadline - time.time()))}"
+            )
+
+    async def run(
+        self,
+        wallets: Sequence[str],
+        migrate: Callable[[Any, str], Awaitable[None]],
+        worker: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ):
+        """Call migrate for each wallet, largest first, on concurrent workers.
+
+        Each worker enters its own `worker()` context, typically holding its
+        database connections, and passes the value to migrate. If a wallet
+        fails, the other workers are cancelled and the error is raised.
+        Wallets not expected to finish by the deadline are deferred.
+        """
+        pending = self.order(wallets)
+        pending.reverse()
+
+        def next_wallet() -> Optional[str]:
+            while pending:
+                wallet = pending.pop()
+                if self.fits(wallet):
+                    return wallet
+                self.deferred.append(wallet)
+            return None
+
+        async def work():
+            async with worker() if worker else contextlib.nullcontext() as resource:
+                wallet = next_wallet()
+                while wallet is not None:
+                    start = time.perf_counter()
+                    await migrate(resource, wallet)
+                    self._measured += time.perf_counter() - start
+                    self._modelled += self.cost(wallet)
+                    wallet = next_wallet()
+
+        tasks = [
+            asyncio.ensure_future(work())
+            for _ in range(min(self.workers, len(wallets)))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
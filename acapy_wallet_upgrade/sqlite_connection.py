@@ -1,4 +1,6 @@
-from typing import Optional
+from itertools import repeat
+import os
+from typing import List, Optional, Tuple
 from urllib.parse import urlparse
 import aiosqlite
 
@@ -19,6 +21,11 @@ class SqliteConnection(DbConnection):
         self._conn: aiosqlite.Connection = None
         self._protocol: str = "sqlite"
 
+    @property
+    def path(self) -> str:
+        """Path of the database file."""
+        return self._path
+
     async def connect(self):
         """Accessor for the connection pool instance."""
         if not self._conn:
@@ -129,6 +136,85 @@ class SqliteConnection(DbConnection):
         """
         )
 
+    async def id_ranges(self, count: int) -> List[Tuple[int, int]]:
+        """Split the Indy item ids into up to count ranges of similar size.
+
+        Ranges are half-open, as (first, end) pairs.
+        """
+        stmt = await self._conn.execute(
+            """
+            SELECT MIN(id), MAX(id) + 1 FROM (
+                SELECT id, NTILE(?1) OVER (ORDER BY id) AS part FROM items_old
+            ) GROUP BY part ORDER BY part
+            """,
+            (count,),
+        )
+        return [tuple(row) for row in await stmt.fetchall()]
+
+    async def merge_items(self, staging_path: str, first: int, end: int):
+        """Replace the Indy items in [first, end) with those of a staging database.
+
+        The staging database holds the items and tags converted from the
+        range, numbered from 1. They are renumbered after the items already
+        migrated, and moved in one transaction with the removal of the range.
+        """
+        await self._conn.execute("ATTACH DATABASE ?1 AS staging", (staging_path,))
+        try:
+            stmt = await self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM items")
+            offset = (await stmt.fetchone())[0]
+            await self._conn.execute(
+                """
+                INSERT INTO main.items (id, profile_id, kind, category, name, value)
+                SELECT id + ?1, profile_id, kind, category, name, value
+                FROM staging.items
+                """,
+                (offset,),
+            )
+            await self._conn.execute(
+                """
+                INSERT INTO main.items_tags (item_id, name, value, plaintext)
+                SELECT item_id + ?1, name, value, plaintext FROM staging.items_tags
+                """,
+                (offset,),
+            )
+            await self._conn.execute(
+                "DELETE FROM main.items_old WHERE id >= ?1 AND id < ?2", (first, end)
+            )
+            await self._conn.commit()
+        except Exception:
+            await self._conn.rollback()
+            raise
+        finally:
+            await self._conn.execute("DETACH DATABASE staging")
+
+    async def compact(self) -> Tuple[int, int]:
+        """Replace the database file with a defragmented copy.
+
+        The copy is written with VACUUM INTO, without the pages freed by the
+        migration, and then swapped in atomically. Returns the file sizes
+        before and after.
+        """
+        copy_path = f"{self._path}.compact"
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+        before = os.path.getsize(self._path)
+        conn = await aiosqlite.connect(self._path)
+        try:
+            await conn.execute("VACUUM INTO ?1", (copy_path,))
+            # Nothing may be left in a write-ahead log of the replaced file
+            await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception:
+            if os.path.exists(copy_path):
+                os.remove(copy_path)
+            raise
+        finally:
+            await conn.close()
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(self._path + suffix):
+                os.remove(self._path + suffix)
+        os.replace(copy_path, self._path)
+        return before, os.path.getsize(self._path)
+
     async def close(self):
         """Release the connection."""
         if self._conn:
@@ -140,8 +226,20 @@ class SqliteConnection(DbConnection):
 
 
 class SqliteWallet(Wallet):
-    def __init__(self, conn: aiosqlite.Connection):
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        items_table: str = "items_old",
+        id_range: Optional[Tuple[int, int]] = None,
+    ):
+        """Initialize a SqliteWallet instance.
+
+        With an id range, only the items in [first, end) are migrated, and
+        they are left in the items table.
+        """
         self._conn = conn
+        self._items_table = items_table
+        self._id_range = id_range
 
     async def insert_profile(self, name: str, key: bytes):
         """Insert the initial profile."""
@@ -161,49 +259,93 @@ class SqliteWallet(Wallet):
 
         return found
 
-    async def fetch_pending_items(self, batch_size: int):
-        """Fetch un-updated items."""
-        while True:
+    async def count_pending_items(self) -> int:
+        """Count the items that have not been updated yet."""
+        if self._id_range:
             stmt = await self._conn.execute(
+                f"SELECT COUNT(*) FROM {self._items_table} WHERE id >= ?1 AND id < ?2",
+                self._id_range,
+            )
+        else:
+            stmt = await self._conn.execute(f"SELECT COUNT(*) FROM {self._items_table}")
+        return (await stmt.fetchone())[0]
+
+    async def fetch_pending_items(
+        self, batch_size: int, max_bytes: Optional[int] = None
+    ):
+        """Fetch un-updated items."""
+        select = """
+            SELECT i.id, i.type, i.name, i.value, i.key,
+            (SELECT GROUP_CONCAT(HEX(te.name) || ':' || HEX(te.value))
+                FROM tags_encrypted te WHERE te.item_id = i.id) AS tags_enc,
+            (SELECT GROUP_CONCAT(HEX(tp.name) || ':' || HEX(tp.value))
+                FROM tags_plaintext tp WHERE tp.item_id = i.id) AS tags_plain
+            """
+        table = self._items_table
+        if self._id_range:
+            # The items are not deleted as they are migrated, so the range
+            # is read in id order from after the last batch
+            table = f"(SELECT * FROM {table} WHERE id >= ?3 AND id < ?4 ORDER BY id)"
+            first, end = self._id_range
+        if max_bytes:
+            # Keep the leading rows whose values fit in the byte budget, and
+            # always the first row
+            command = (
+                select
+                + f"""
+                FROM (
+                    SELECT b.*, SUM(LENGTH(b.value)) OVER (ORDER BY b.id) AS total,
+                    ROW_NUMBER() OVER (ORDER BY b.id) AS position
+                    FROM (SELECT * FROM {table} ORDER BY id LIMIT ?1) b
+                ) i
+                WHERE i.total <= ?2 OR i.position = 1
                 """
-                SELECT i.id, i.type, i.name, i.value, i.key,
-                (SELECT GROUP_CONCAT(HEX(te.name) || ':' || HEX(te.value))
-                    FROM tags_encrypted te WHERE te.item_id = i.id) AS tags_enc,
-                (SELECT GROUP_CONCAT(HEX(tp.name) || ':' || HEX(tp.value))
-                    FROM tags_plaintext tp WHERE tp.item_id = i.id) AS tags_plain
-                FROM items_old i LIMIT ?1
-                """,
-                (batch_size,),
             )
+        else:
+            command = select + f"FROM {table} i LIMIT ?1"
+        while True:
+            if self._id_range:
+                args = (batch_size, max_bytes, first, end)
+            else:
+                args = (batch_size, max_bytes) if max_bytes else (batch_size,)
+            stmt = await self._conn.execute(command, args)
             rows = await stmt.fetchall()
             if not rows:
                 break
-            yield rows
+            if self._id_range:
+                first = rows[-1][0] + 1
+            batch_size = (yield rows) or batch_size
 
     async def update_items(self, items):
         """Update items in the database."""
         del_ids = []
         for item in items:
-            del_ids.append(item["id"])
+            del_ids.append(item.id)
             ins = await self._conn.execute(
                 """
                 INSERT INTO items (profile_id, kind, category, name, value)
                 VALUES (1, 2, ?1, ?2, ?3)
                 """,
-                (item["category"], item["name"], item["value"]),
+                (item.category, item.name, item.value),
             )
             item_id = ins.lastrowid
-            if item["tags"]:
+            if item.tag_names:
                 await self._conn.executemany(
                     """
                     INSERT INTO items_tags (item_id, plaintext, name, value)
                     VALUES (?1, ?2, ?3, ?4)
                     """,
-                    ((item_id, *tag) for tag in item["tags"]),
+                    zip(
+                        repeat(item_id),
+                        item.tag_plaintext,
+                        item.tag_names,
+                        item.tag_values,
+                    ),
+                )
+        if not self._id_range:
+            await self._conn.execute(
+                "DELETE FROM {} WHERE id IN ({})".format(
+                    self._items_table, ",".join([str(del_id) for del_id in del_ids])
                 )
-        await self._conn.execute(
-            "DELETE FROM items_old WHERE id IN ({})".format(
-                ",".join([str(del_id) for del_id in del_ids])
             )
-        )
         await self._conn.commit()
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from urllib.parse import quote
+
+import aiosqlite
+
+from .db_connection import Wallet
+from .metrics import wallet_scope
+from .progress import worker_pool, worker_progress
+from .sqlite_connection import SqliteConnection, SqliteWallet
+from .strategies import DbpwStrategy
+
+# Memory map of the read-only source in each worker process
+MMAP_SIZE = 1 << 30
+
+# Converted items of one id range, numbered from 1
+STAGING_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER NOT NULL,
+        profile_id INTEGER NOT NULL,
+        kind INTEGER NOT NULL,
+        category BLOB NOT NULL,
+        name BLOB NOT NULL,
+        value BLOB NOT NULL,
+        expiry DATETIME NULL,
+        PRIMARY KEY (id)
+    );
+    CREATE TABLE IF NOT EXISTS items_tags (
+        id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        name BLOB NOT NULL,
+        value BLOB NOT NULL,
+        plaintext BOOLEAN NOT NULL,
+        PRIMARY KEY (id)
+    );
+"""
+
+
+async def _convert_range(
+    strategy: DbpwStrategy,
+    path: str,
+    staging_path: str,
+    first: int,
+    end: int,
+    indy_key: dict,
+    profile_key: dict,
+):
+    # The staging database is the main one, so the unqualified items tables
+    # are the staging ones and the Indy tables are found in the source
+    conn = await aiosqlite.connect(f"file:{quote(staging_path)}", uri=True)
+    try:
+        await conn.executescript(STAGING_SCHEMA)
+        await conn.execute(
+            "ATTACH DATABASE ?1 AS source", (f"file:{quote(path)}?mode=ro",)
+        )
+        await conn.execute(f"PRAGMA source.mmap_size = {MMAP_SIZE}")
+        wallet = SqliteWallet(conn, id_range=(first, end))
+        await strategy.update_items(wallet, indy_key, profile_key, track_total=False)
+    finally:
+        await conn.close()
+
+
+def convert_range(
+    path: str,
+    staging_path: str,
+    first: int,
+    end: int,
+    wallet_name: str,
+    indy_key: dict,
+    profile_key: dict,
+    options: dict,
+):
+    """Convert the items of an id range into a staging database, in a worker."""
+    progress = worker_progress()
+    strategy = DbpwStrategy(
+        SqliteConnection(f"sqlite://{staging_path}"),
+        wallet_name,
+        "",
+        progress=progress,
+        **options,
+    )
+    try:
+        with wallet_scope(wallet_name):
+            asyncio.run(
+                _convert_range(
+                    strategy, path, staging_path, first, end, indy_key, profile_key
+                )
+            )
+    finally:
+        if progress:
+            progress.flush()
+
+
+class DbpwRangesStrategy(DbpwStrategy):
+    """Database per wallet strategy converting a SQLite wallet in processes.
+
+    The items are split into `readers` ranges of item ids, each converted by
+    a worker process.
+    """
+
+    def worker_options(self) -> dict:
+        """Settings passed to the strategy of each worker."""
+        return {
+            "batch_size": self.batch_size,
+            "tuner": self.tuner,
+            "max_batch_bytes": self.max_batch_bytes,
+        }
+
+    def staging_path(self, index: int) -> str:
+        return f"{self.conn.path}.range{index}"
+
+    async def migrate_items(self, wallet: Wallet, indy_key: dict, profile_key: dict):
+        """Convert ranges of items in worker processes, then merge them.
+
+        Workers read the wallet read-only, and each writes the converted items
+        of its range to a staging database next to the wallet. The ranges are
+        then merged one by one, each in a transaction also removing the range
+        from the Indy items, so an interrupted migration can be run again.
+        """
+        ranges = await self.conn.id_ranges(self.readers)
+        if len(ranges) < 2:
+            await super().migrate_items(wallet, indy_key, profile_key)
+            return
+        # Left by an interrupted run, whose unmerged ranges are still pending
+        for index in range(len(ranges)):
+            if os.path.exists(self.staging_path(index)):
+                os.remove(self.staging_path(index))
+        if self.progress:
+            self.progress.set_total("items", await wallet.count_pending_items())
+        print(f"Converting {len(ranges)} item id range(s) in worker processes")
+
+        options = self.worker_options()
+        loop = asyncio.get_running_loop()
+        with worker_pool(len(ranges), self.progress) as pool:
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool,
+                        convert_range,
+                        self.conn.path,
+                        self.staging_path(index),
+                        first,
+                        end,
+                        self.wallet_name,
+                        indy_key,
+                        profile_key,
+                        options,
+                    )
+                    for index, (first, end) in enumerate(ranges)
+                )
+            )
+
+        for index, (first, end) in enumerate(ranges):
+            await self.conn.merge_items(self.staging_path(index), first, end)
+            os.remove(self.staging_path(index))
+        print(f"Merged {len(ranges)} item id range(s)")
@@ -1,14 +1,18 @@
 from abc import ABC, abstractmethod
+import asyncio
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import hashlib
 import hmac
+import itertools
 import json
 import logging
 import os
 import re
 import sys
-from typing import Dict, Optional, Union, cast
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union, cast
 from urllib.parse import urlparse
 
 from aries_askar import Key, Store, Session
@@ -16,13 +20,35 @@ import asyncpg
 import base58
 import cbor2
 import msgpack
+from nacl.exceptions import CryptoError
+import nacl.bindings
 import nacl.pwhash
 
+from .cache import LRUCache
 from .db_connection import DbConnection, Wallet
+from .metrics import Metrics, current_wallet, wallet_scope
+from .progress import ProgressTracker, format_bytes, format_duration
+from .records import AskarRow, DecryptedItem
+from .journal import ChangeJournal
+from .scheduling import WalletScheduler
+from .work_queue import WorkQueue
 from .error import UpgradeError, MissingWalletError
 from .pg_connection import PgConnection, PgWallet
-from .pg_mwst_connection import PgMWSTConnection
+from .pg_mwst_connection import DatabaseTemplate, PgMWSTConnection
+from .pools import ConnectionPools, admin_uri
 from .sqlite_connection import SqliteConnection
+from .tuning import AutoTuner
+
+try:
+    # libsodium through PyNaCl's private cffi module, for encryption and
+    # decryption without copying the buffers. The module is not part of the
+    # PyNaCl API, so the public bindings are used if it changes.
+    from nacl._sodium import ffi, lib
+
+    lib.crypto_aead_chacha20poly1305_ietf_decrypt
+    lib.crypto_aead_chacha20poly1305_ietf_encrypt
+except (ImportError, AttributeError):  # pragma: no cover
+    ffi = lib = None
 
 LOGGER = logging.getLogger(__name__)
 
@@ -31,6 +57,272 @@ CHACHAPOLY_KEY_LEN = 32
 CHACHAPOLY_NONCE_LEN = 12
 CHACHAPOLY_TAG_LEN = 16
 ENCRYPTED_KEY_LEN = CHACHAPOLY_NONCE_LEN + CHACHAPOLY_KEY_LEN + CHACHAPOLY_TAG_LEN
+# Order of the keys in an Indy wallet's encrypted metadata
+INDY_KEY_NAMES = (
+    "type",
+    "name",
+    "value",
+    "item_hmac",
+    "tag_name",
+    "tag_value",
+    "tag_hmac",
+)
+
+
+# Indy categories converted one by one in the Askar phase
+ASKAR_CATEGORIES = (
+    "Indy::Key",
+    "Indy::MasterSecret",
+    "Indy::Did",
+    "Indy::Schema",
+    "Indy::CredentialDefinition",
+    "Indy::RevocationRegistryDefinition",
+    "Indy::RevocationRegistryDefinitionPrivate",
+    "Indy::RevocationRegistry",
+    "Indy::RevocationRegistryInfo",
+    "Indy::Credential",
+)
+
+# Tables of an Askar database, and of a MultiWalletSingleTable Indy database
+ASKAR_TABLES = ("profiles", "items", "items_tags")
+INDY_TABLES = ("items", "tags_encrypted", "tags_plaintext")
+
+
+def derive_master_key(wallet_key: str, salt: bytes) -> bytes:
+    """Derive an Indy wallet master key from its passphrase."""
+    return nacl.pwhash.argon2i.kdf(
+        CHACHAPOLY_KEY_LEN,
+        wallet_key.encode("ascii"),
+        salt[:16],
+        nacl.pwhash.argon2i.OPSLIMIT_MODERATE,
+        nacl.pwhash.argon2i.MEMLIMIT_MODERATE,
+    )
+
+
+def _cipher_key(key: bytes):
+    """Key in the form taken by `_decrypt_view` and `_encrypt_view`."""
+    return ffi.from_buffer(key) if ffi else bytes(key)
+
+
+def _decrypt_view(enc_value: bytes, key) -> bytes:
+    """Decrypt nonce || ciphertext without slicing the input."""
+    clen = len(enc_value) - CHACHAPOLY_NONCE_LEN
+    if clen < CHACHAPOLY_TAG_LEN:
+        raise UpgradeError("Decryption failed")
+    if not ffi:
+        enc_value = memoryview(enc_value)
+        try:
+            return nacl.bindings.crypto_aead_chacha20poly1305_ietf_decrypt(
+                bytes(enc_value[CHACHAPOLY_NONCE_LEN:]),
+                None,
+                bytes(enc_value[:CHACHAPOLY_NONCE_LEN]),
+                key,
+            )
+        except CryptoError:
+            raise UpgradeError("Decryption failed")
+    buf = ffi.from_buffer(enc_value)
+    out = ffi.new("unsigned char[]", clen - CHACHAPOLY_TAG_LEN)
+    if lib.crypto_aead_chacha20poly1305_ietf_decrypt(
+        out,
+        ffi.NULL,
+        ffi.NULL,
+        buf + CHACHAPOLY_NONCE_LEN,
+        clen,
+        ffi.NULL,
+        0,
+        buf,
+        key,
+    ):
+        raise UpgradeError("Decryption failed")
+    return ffi.buffer(out)[:]
+
+
+def _encrypt_view(message: bytes, nonce, key) -> bytearray:
+    """Encrypt message into a single preallocated nonce || ciphertext buffer."""
+    if not ffi:
+        out = bytearray(nonce)
+        out += nacl.bindings.crypto_aead_chacha20poly1305_ietf_encrypt(
+            bytes(message), None, bytes(nonce), key
+        )
+        return out
+    mlen = len(message)
+    out = bytearray(CHACHAPOLY_NONCE_LEN + mlen + CHACHAPOLY_TAG_LEN)
+    out[:CHACHAPOLY_NONCE_LEN] = nonce
+    buf = ffi.from_buffer(out)
+    lib.crypto_aead_chacha20poly1305_ietf_encrypt(
+        buf + CHACHAPOLY_NONCE_LEN,
+        ffi.NULL,
+        ffi.from_buffer(message),
+        mlen,
+        ffi.NULL,
+        0,
+        ffi.NULL,
+        buf,
+        key,
+    )
+    return out
+
+
+def _encrypt_searchable(message: bytes, key, hasher: hmac.HMAC) -> bytearray:
+    """Encrypt message with a nonce derived from a pre-keyed HMAC state."""
+    hasher = hasher.copy()
+    hasher.update(message)
+    return _encrypt_view(message, hasher.digest()[:CHACHAPOLY_NONCE_LEN], key)
+
+
+class IndyCipher:
+    """Batch decryption of Indy wallet rows for a single Indy key set.
+
+    Item types, tag names and encrypted tag values are searchable (and so
+    deterministic) in Indy, and their plaintexts are cached by ciphertext.
+    """
+
+    def __init__(self, keys: dict, b64: bool = False, cache_size: int = 4096):
+        """Initialize an IndyCipher instance."""
+        self._type_key = _cipher_key(keys["type"])
+        self._name_key = _cipher_key(keys["name"])
+        self._value_key = _cipher_key(keys["value"])
+        self._tag_name_key = _cipher_key(keys["tag_name"])
+        self._tag_value_key = _cipher_key(keys["tag_value"])
+        self.b64 = b64
+        self.cache = LRUCache(cache_size)
+
+    def _decrypt_cached(self, enc_value: bytes, key) -> bytes:
+        value = self.cache.get(enc_value)
+        if value is None:
+            value = _decrypt_view(enc_value, key)
+            self.cache.put(enc_value, value)
+        return value
+
+    def _decrypt_tags(
+        self, item: DecryptedItem, tags: str, plaintext: int, value_key=None
+    ):
+        decrypt = self._decrypt_cached
+        for tag in tags.split(","):
+            tag_name, tag_value = tag.split(":")
+            value = bytes.fromhex(tag_value)
+            if value_key is not None:
+                value = decrypt(value, value_key)
+            item.tag_plaintext.append(plaintext)
+            item.tag_names.append(decrypt(bytes.fromhex(tag_name), self._tag_name_key))
+            item.tag_values.append(value)
+
+    def decrypt_key(self, row_type: bytes, row_name: bytes) -> Tuple[bytes, bytes]:
+        """Decrypt the type and name of an Indy row."""
+        if self.b64:
+            row_name = base64.b64decode(row_name)
+            item_type = self.cache.get(row_type)
+            if item_type is None:
+                item_type = _decrypt_view(base64.b64decode(row_type), self._type_key)
+                self.cache.put(row_type, item_type)
+        else:
+            item_type = self._decrypt_cached(row_type, self._type_key)
+        return item_type, _decrypt_view(row_name, self._name_key)
+
+    def decrypt_rows(self, rows: Sequence[tuple]) -> List[DecryptedItem]:
+        """Decrypt a batch of fetched Indy rows."""
+        result = []
+        for (
+            row_id,
+            row_type,
+            row_name,
+            row_value,
+            row_key,
+            tags_enc,
+            tags_plain,
+        ) in rows:
+            item_type, item_name = self.decrypt_key(row_type, row_name)
+            value_key = _decrypt_view(row_key, self._value_key)
+            value = (
+                _decrypt_view(row_value, _cipher_key(value_key)) if row_value else None
+            )
+            item = DecryptedItem(
+                row_id,
+                item_type,
+                item_name,
+                value,
+                [],
+                [],
+                [],
+            )
+            if tags_enc:
+                self._decrypt_tags(item, tags_enc, 0, self._tag_value_key)
+            if tags_plain:
+                self._decrypt_tags(item, tags_plain, 1)
+            result.append(item)
+        return result
+
+
+class AskarCipher:
+    """Batch encryption of decrypted items for a single Askar profile key.
+
+    The HMAC states are keyed once and copied for each message, and the
+    random nonces for a batch are drawn with a single call.
+    """
+
+    def __init__(self, profile_key: dict, cache_size: int = 4096):
+        """Initialize an AskarCipher instance."""
+        self._key = profile_key
+        self._category_key = _cipher_key(profile_key["ick"])
+        self._name_key = _cipher_key(profile_key["ink"])
+        self._tag_name_key = _cipher_key(profile_key["tnk"])
+        self._tag_value_key = _cipher_key(profile_key["tvk"])
+        self._item_hmac = hmac.HMAC(profile_key["ihk"], digestmod=hashlib.sha256)
+        self._tag_hmac = hmac.HMAC(profile_key["thk"], digestmod=hashlib.sha256)
+        self.cache = LRUCache(cache_size)
+
+    def _encrypt_cached(self, message: bytes, key, hasher: hmac.HMAC) -> bytes:
+        cache_key = (key, message)
+        enc = self.cache.get(cache_key)
+        if enc is None:
+            enc = _encrypt_searchable(message, key, hasher)
+            self.cache.put(cache_key, enc)
+        return enc
+
+    def _encrypt_value(self, category: bytes, name: bytes, value: bytes, nonce):
+        hasher = self._item_hmac.copy()
+        hasher.update(len(category).to_bytes(4, "big"))
+        hasher.update(category)
+        hasher.update(len(name).to_bytes(4, "big"))
+        hasher.update(name)
+        return _encrypt_view(value, nonce, _cipher_key(hasher.digest()))
+
+    def encrypt_key(self, category: bytes, name: bytes) -> Tuple[bytes, bytes]:
+        """Encrypt the category and name of an item, as Askar looks it up."""
+        return (
+            self._encrypt_cached(category, self._category_key, self._item_hmac),
+            _encrypt_searchable(name, self._name_key, self._item_hmac),
+        )
+
+    def encrypt_items(self, items: Sequence[DecryptedItem]) -> List[AskarRow]:
+        """Encrypt a batch of decrypted items for the Askar profile."""
+        encrypt = self._encrypt_cached
+        tag_hmac = self._tag_hmac
+        tag_name_key = self._tag_name_key
+        tag_value_key = self._tag_value_key
+        nonces = memoryview(os.urandom(CHACHAPOLY_NONCE_LEN * len(items)))
+        result = []
+        start = 0
+        for item in items:
+            end = start + CHACHAPOLY_NONCE_LEN
+            result.append(
+                AskarRow(
+                    item.id,
+                    encrypt(item.type, self._category_key, self._item_hmac),
+                    _encrypt_searchable(item.name, self._name_key, self._item_hmac),
+                    self._encrypt_value(
+                        item.type, item.name, item.value, nonces[start:end]
+                    ),
+                    item.tag_plaintext,
+                    [encrypt(k, tag_name_key, tag_hmac) for k in item.tag_names],
+                    [
+                        v if plain else encrypt(v, tag_value_key, tag_hmac)
+                        for plain, v in zip(item.tag_plaintext, item.tag_values)
+                    ],
+                )
+            )
+            start = end
+        return result
 
 
 class Progress:
@@ -41,19 +333,22 @@ class Progress:
         message: str,
         report_in_progress: bool = True,
         interval: int = 10,
+        quiet: bool = False,
     ):
         self.count = 0
         self.message = message
         self.report_in_progress = report_in_progress
         self.interval = interval
+        self.quiet = quiet
         self.last_reported = None
 
         # Initial progress indicator -- let them know something is happening
-        print(message, end="")
+        if not quiet:
+            print(message, end="")
 
     def update(self, amount: int = 1):
         """Update count, report if thresholds met."""
-        if self.report_in_progress:
+        if self.report_in_progress and not self.quiet:
             passed_intervals = ((self.count % self.interval) + amount) / self.interval
             if passed_intervals >= 1:
                 if self.count == 0:
@@ -65,6 +360,8 @@ class Progress:
 
     def report(self):
         """Final report."""
+        if self.quiet:
+            return
         if not self.report_in_progress or self.last_reported is None:
             print(f" {self.count}")
             return
@@ -76,8 +373,66 @@ class Progress:
 class Strategy(ABC):
     """Base class for upgrade strategies."""
 
-    def __init__(self, batch_size: int):
-        self.batch_size = batch_size
+    # Maximum number of entries held by each per-wallet crypto cache
+    cache_size = 4096
+    # Work queue shared with workers on other hosts, if any
+    work_queue: Optional[WorkQueue] = None
+
+    def __init__(
+        self,
+        batch_size: int,
+        cursor_prefetch: Optional[int] = None,
+        tuner: Optional[AutoTuner] = None,
+        max_batch_bytes: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+        progress: Optional[ProgressTracker] = None,
+        preflight_workers: Optional[int] = None,
+        wallet_workers: int = 1,
+        deadline: Optional[float] = None,
+        optimize_layout: bool = False,
+        vacuum_source: bool = False,
+        pools: Optional[ConnectionPools] = None,
+    ):
+        self._batch_size = batch_size
+        self.cursor_prefetch = cursor_prefetch
+        self.tuner = tuner
+        self.max_batch_bytes = max_batch_bytes
+        self.metrics = metrics
+        self.progress = progress
+        self.preflight_workers = preflight_workers
+        self.wallet_workers = wallet_workers
+        self.deadline = deadline
+        self.optimize_layout = optimize_layout
+        self.vacuum_source = vacuum_source
+        self.pools = pools
+        # Indy keys derived by verify_keys, by (metadata, wallet key)
+        self._indy_keys: Dict[Tuple[Union[str, bytes], str], dict] = {}
+
+    @property
+    def batch_size(self) -> int:
+        """Batch size to start each stage with."""
+        return self.tuner.batch_size if self.tuner else self._batch_size
+
+    def stage_tuner(self, stage: str) -> Optional[AutoTuner]:
+        """Auto-tuner controller of a stage of the current wallet.
+
+        Wallets migrated concurrently have their own controllers, so that
+        the rates of one wallet's batches are not compared with another's,
+        and share the crypto concurrency.
+        """
+        if not self.tuner:
+            return None
+        if self.wallet_workers > 1:
+            return self.tuner.stage(
+                f"{current_wallet.get()}/{stage}", self.wallet_workers
+            )
+        return self.tuner.stage(stage)
+
+    def progress_printer(self, message: str) -> Progress:
+        """Stdout progress of a stage, silent when a tracker reports progress."""
+        return Progress(
+            message, interval=self.batch_size, quiet=self.progress is not None
+        )
 
     def encrypt_merged(
         self, message: bytes, my_key: bytes, hmac_key: bytes = None
@@ -129,116 +484,351 @@ class Strategy(ABC):
             )
             yield name, value
 
-    def decrypt_item(self, row: tuple, keys: dict, b64: bool = False):
+    def decrypt_item(self, row: tuple, keys: dict, b64: bool = False) -> DecryptedItem:
         row_id, row_type, row_name, row_value, row_key, tags_enc, tags_plain = row
         value_key = self.decrypt_merged(row_key, keys["value"])
         value = self.decrypt_merged(row_value, value_key) if row_value else None
-        tags = [
-            (0, k, v)
-            for k, v in (
-                (
-                    self.decrypt_tags(tags_enc, keys["tag_name"], keys["tag_value"])
-                    if tags_enc
-                    else ()
-                )
-            )
-        ]
-        for k, v in (
-            self.decrypt_tags(tags_plain, keys["tag_name"]) if tags_plain else ()
+        item = DecryptedItem(
+            row_id,
+            self.decrypt_merged(row_type, keys["type"], b64),
+            self.decrypt_merged(row_name, keys["name"], b64),
+            value,
+            [],
+            [],
+            [],
+        )
+        for plaintext, tags, value_key in (
+            (0, tags_enc, keys["tag_value"]),
+            (1, tags_plain, None),
         ):
-            tags.append((1, k, v))
-        return {
-            "id": row_id,
-            "type": self.decrypt_merged(row_type, keys["type"], b64),
-            "name": self.decrypt_merged(row_name, keys["name"], b64),
-            "value": value,
-            "tags": tags,
-        }
+            if not tags:
+                continue
+            for k, v in self.decrypt_tags(tags, keys["tag_name"], value_key):
+                item.tag_plaintext.append(plaintext)
+                item.tag_names.append(k)
+                item.tag_values.append(v)
+        return item
+
+    def update_item(self, item: DecryptedItem, key: dict) -> AskarRow:
+        return AskarRow(
+            item.id,
+            self.encrypt_merged(item.type, key["ick"], key["ihk"]),
+            self.encrypt_merged(item.name, key["ink"], key["ihk"]),
+            self.encrypt_value(item.type, item.name, item.value, key["ihk"]),
+            item.tag_plaintext,
+            [self.encrypt_merged(k, key["tnk"], key["thk"]) for k in item.tag_names],
+            [
+                v if plain else self.encrypt_merged(v, key["tvk"], key["thk"])
+                for plain, v in zip(item.tag_plaintext, item.tag_values)
+            ],
+        )
 
-    def update_item(self, item: dict, key: dict) -> dict:
-        tags = []
-        for plain, k, v in item["tags"]:
-            if not plain:
-                v = self.encrypt_merged(v, key["tvk"], key["thk"])
-            k = self.encrypt_merged(k, key["tnk"], key["thk"])
-            tags.append((plain, k, v))
-
-        ret_val = {
-            "id": item["id"],
-            "category": self.encrypt_merged(item["type"], key["ick"], key["ihk"]),
-            "name": self.encrypt_merged(item["name"], key["ink"], key["ihk"]),
-            "value": self.encrypt_value(
-                item["type"], item["name"], item["value"], key["ihk"]
-            ),
-            "tags": tags,
-        }
+    def _convert_rows(
+        self, ciphers: Tuple[IndyCipher, AskarCipher], rows: Sequence[tuple]
+    ) -> List[AskarRow]:
+        indy_cipher, askar_cipher = ciphers
+        return askar_cipher.encrypt_items(indy_cipher.decrypt_rows(rows))
 
-        return ret_val
+    async def _convert_rows_concurrently(
+        self,
+        executor: ThreadPoolExecutor,
+        ciphers: List[Tuple[IndyCipher, AskarCipher]],
+        rows: Sequence[tuple],
+    ) -> List[AskarRow]:
+        """Split rows between worker threads, each with its own cipher pair."""
+        chunk = -(-len(rows) // len(ciphers))
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    self._convert_rows,
+                    pair,
+                    rows[start : start + chunk],  # noqa: E203
+                )
+                for pair, start in zip(ciphers, range(0, len(rows), chunk))
+            )
+        )
+        return list(itertools.chain.from_iterable(results))
 
     async def update_items(
         self,
         wallet: Wallet,
         indy_key: dict,
         profile_key: dict,
+        partitions: Optional[Sequence[Wallet]] = None,
+        track_total: bool = True,
     ):
-        progress = Progress("Migrating items...", interval=self.batch_size)
-        async for rows in wallet.fetch_pending_items(self.batch_size):
-            upd = []
-            for row in rows:
-                result = self.decrypt_item(
-                    row, indy_key, b64=isinstance(wallet, PgWallet)
+        """Migrate the items of a wallet.
+
+        If partitions of the wallet are given, they are migrated concurrently,
+        each converting its batches on a thread of its own. Without
+        `track_total`, the caller sets the progress total of the wallet.
+        """
+        progress = self.progress_printer("Migrating items...")
+        tuner = self.stage_tuner("items")
+        metrics = self.metrics
+        tracker = self.progress
+        if tracker and track_total:
+            tracker.set_total("items", await wallet.count_pending_items())
+        b64 = isinstance(wallet, PgWallet)
+        ciphers: List[Tuple[IndyCipher, AskarCipher]] = []
+
+        def cipher_pairs(count: int):
+            while len(ciphers) < count:
+                ciphers.append(
+                    (
+                        IndyCipher(indy_key, b64=b64, cache_size=self.cache_size),
+                        AskarCipher(profile_key, cache_size=self.cache_size),
+                    )
                 )
-                upd.append(self.update_item(result, profile_key))
-            await wallet.update_items(upd)
-            progress.update(len(upd))
+            return ciphers[:count]
+
+        if partitions:
+            executor = ThreadPoolExecutor(len(partitions))
+        else:
+            executor = ThreadPoolExecutor(tuner.max_concurrency) if tuner else None
+        loop = asyncio.get_running_loop()
+
+        async def migrate(
+            source: Wallet, pair: Optional[Tuple[IndyCipher, AskarCipher]]
+        ):
+            batches = source.fetch_pending_items(self.batch_size, self.max_batch_bytes)
+            new_size = None
+            while True:
+                start = time.perf_counter()
+                try:
+                    rows = await batches.asend(new_size)
+                except StopAsyncIteration:
+                    break
+                fetched = time.perf_counter()
+                if pair:
+                    upd = await loop.run_in_executor(
+                        executor, self._convert_rows, pair, rows
+                    )
+                elif tuner and tuner.concurrency > 1 and len(rows) > 1:
+                    upd = await self._convert_rows_concurrently(
+                        executor, cipher_pairs(tuner.concurrency), rows
+                    )
+                else:
+                    upd = self._convert_rows(cipher_pairs(1)[0], rows)
+                converted = time.perf_counter()
+                await source.update_items(upd)
+                written = time.perf_counter()
+                progress.update(len(upd))
+                if tracker:
+                    tracker.update("items", len(upd))
+                if tuner or metrics:
+                    nbytes = sum(len(row[3]) for row in rows)
+                    db_time = (fetched - start) + (written - converted)
+                if tuner:
+                    tuner.record(len(rows), nbytes, written - start, db_time)
+                    new_size = tuner.batch_size
+                if metrics:
+                    metrics.inc("rows_total", len(rows), stage="items")
+                    metrics.inc("bytes_total", nbytes, stage="items")
+                    metrics.inc("db_seconds_total", db_time, stage="items")
+                    metrics.inc("cpu_seconds_total", converted - fetched, stage="items")
+                    metrics.observe("batch_seconds", fetched - start, stage="fetch")
+                    metrics.observe(
+                        "batch_seconds", converted - fetched, stage="convert"
+                    )
+                    metrics.observe("batch_seconds", written - converted, stage="write")
+
+        try:
+            if partitions:
+                tasks = [
+                    asyncio.ensure_future(migrate(part, pair))
+                    for part, pair in zip(partitions, cipher_pairs(len(partitions)))
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+            else:
+                await migrate(wallet, None)
+        finally:
+            if executor:
+                executor.shutdown()
         progress.report()
 
-    async def fetch_indy_key(self, wallet: Wallet, wallet_key: str) -> dict:
-        metadata_json = await wallet.get_metadata()
+        # The ndjson tracker owns stdout, so the summary is only printed
+        # alongside the legacy progress output
+        if tracker is None:
+            decrypt_hits = sum(pair[0].cache.hits for pair in ciphers)
+            decrypt_misses = sum(pair[0].cache.misses for pair in ciphers)
+            encrypt_hits = sum(pair[1].cache.hits for pair in ciphers)
+            encrypt_misses = sum(pair[1].cache.misses for pair in ciphers)
+            print(
+                "Cache hit rates: decryption "
+                f"{decrypt_hits / ((decrypt_hits + decrypt_misses) or 1):.1%} "
+                f"({decrypt_hits} hits, {decrypt_misses} misses), encryption "
+                f"{encrypt_hits / ((encrypt_hits + encrypt_misses) or 1):.1%} "
+                f"({encrypt_hits} hits, {encrypt_misses} misses)"
+            )
+        if tuner:
+            print(f"Auto-tuner settled on {tuner.summary()}")
+
+    @contextlib.asynccontextmanager
+    async def source_reader(self, wallet: Wallet, uri: str):
+        """Stream the wallet's pending items over a dedicated connection.
+
+        Only applies to Postgres wallets, and only when a cursor prefetch has
+        been configured.
+        """
+        if not self.cursor_prefetch or not isinstance(wallet, PgWallet):
+            yield
+            return
+        async with self.connection(uri) as reader:
+            wallet.use_cursor(reader, self.cursor_prefetch)
+            yield
+
+    def unlock_indy_key(
+        self, metadata_json: Union[str, bytes], wallet_key: str
+    ) -> dict:
+        """Derive the master key and decrypt the keys of an Indy wallet.
+
+        Raises CryptoError if the wallet key is incorrect.
+        """
         metadata = json.loads(metadata_json)
         keys_enc = bytes(metadata["keys"])
         salt = bytes(metadata["master_key_salt"])
 
         salt = salt[:16]
-        master_key = nacl.pwhash.argon2i.kdf(
-            CHACHAPOLY_KEY_LEN,
-            wallet_key.encode("ascii"),
-            salt,
-            nacl.pwhash.argon2i.OPSLIMIT_MODERATE,
-            nacl.pwhash.argon2i.MEMLIMIT_MODERATE,
-        )
+        start = time.perf_counter()
+        master_key = derive_master_key(wallet_key, salt)
+        if self.metrics:
+            self.metrics.observe(
+                "kdf_seconds", time.perf_counter() - start, stage="indy"
+            )
 
         keys_mpk = self.decrypt_merged(keys_enc, master_key)
         keys_lst = msgpack.unpackb(keys_mpk)
-        keys = dict(
-            zip(
-                (
-                    "type",
-                    "name",
-                    "value",
-                    "item_hmac",
-                    "tag_name",
-                    "tag_value",
-                    "tag_hmac",
-                ),
-                keys_lst,
-            )
-        )
+        keys = dict(zip(INDY_KEY_NAMES, keys_lst))
         keys["master"] = master_key
         keys["salt"] = salt
         return keys
 
+    async def fetch_indy_key(self, wallet: Wallet, wallet_key: str) -> dict:
+        metadata_json = await wallet.get_metadata()
+        keys = self._indy_keys.pop((metadata_json, wallet_key), None)
+        if keys is None:
+            keys = self.unlock_indy_key(metadata_json, wallet_key)
+        return keys
+
+    async def verify_keys(
+        self,
+        metadata: Dict[str, Union[str, bytes]],
+        wallet_keys: Dict[str, Optional[str]],
+    ):
+        """Check the keys of many wallets before anything is modified.
+
+        Keys are derived concurrently in worker threads, as the KDF releases
+        the GIL, and kept for fetch_indy_key so no key is derived twice. Every
+        missing wallet and incorrect key is reported in a single UpgradeError.
+        """
+        errors = []
+        pending = {}
+        for wallet_id, wallet_key in wallet_keys.items():
+            if wallet_id not in metadata:
+                errors.append(f"{wallet_id}: wallet not found in database")
+            elif not wallet_key:
+                errors.append(f"{wallet_id}: no wallet key")
+            else:
+                pending[wallet_id] = (metadata[wallet_id], wallet_key)
+
+        if pending:
+            # Each derivation holds the KDF's memory limit while it runs
+            workers = min(self.preflight_workers or os.cpu_count() or 1, len(pending))
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(workers) as executor:
+                results = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(executor, self.unlock_indy_key, *args)
+                        for args in pending.values()
+                    ),
+                    return_exceptions=True,
+                )
+            for (wallet_id, args), result in zip(pending.items(), results):
+                if isinstance(result, CryptoError):
+                    errors.append(f"{wallet_id}: incorrect wallet key")
+                elif isinstance(result, Exception):
+                    errors.append(f"{wallet_id}: {result}")
+                else:
+                    self._indy_keys[args] = result
+
+        if errors:
+            self._indy_keys.clear()
+            raise UpgradeError(
+                "Wallet key check failed, nothing was migrated:\n  "
+                + "\n  ".join(sorted(errors))
+            )
+        print(f"Verified {len(pending)} wallet key(s)")
+
+    async def fetch_wallet_metadata(
+        self, conn: asyncpg.Connection, wallet_ids
+    ) -> Dict[str, bytes]:
+        """Fetch the metadata of wallets in a MultiWalletSingleTable DB."""
+        rows = await conn.fetch(
+            "SELECT wallet_id, value FROM metadata WHERE wallet_id = any($1::text[])",
+            list(wallet_ids),
+        )
+        return {row[0]: base64.b64decode(bytes.decode(row[1])) for row in rows}
+
     async def batched_fetch_all(self, txn: Session, category: str):
+        tuner = self.stage_tuner(category)
+        metrics = self.metrics
+        tracker = self.progress
+        batch_size = self.batch_size
+        # Askar cannot limit a fetch by size, so with a byte budget the first
+        # batch is a single row and later ones are sized from the largest
+        # value seen so far
+        largest = None
         while True:
-            items = await txn.fetch_all(category, limit=self.batch_size)
+            limit = batch_size
+            if self.max_batch_bytes:
+                limit = (
+                    min(batch_size, max(1, self.max_batch_bytes // largest))
+                    if largest
+                    else 1
+                )
+            start = time.perf_counter()
+            items = await txn.fetch_all(category, limit=limit)
+            fetched = time.perf_counter()
             if not items:
                 break
+            sizes = [len(row.value) for row in items]
+            largest = max(largest or 1, *sizes)
             for row in items:
                 yield row
+            elapsed = time.perf_counter() - start
+            if tracker:
+                tracker.update("askar", len(items))
+            if tuner:
+                # Askar phase batches are bound by database round trips
+                tuner.record(len(items), sum(sizes), elapsed, elapsed)
+                batch_size = tuner.batch_size
+            if metrics:
+                labels = {"stage": "askar", "category": category}
+                metrics.inc("rows_total", len(items), **labels)
+                metrics.inc("bytes_total", sum(sizes), **labels)
+                metrics.inc("db_seconds_total", elapsed, **labels)
+                metrics.observe("batch_seconds", elapsed, **labels)
+                metrics.observe(
+                    "batch_seconds",
+                    fetched - start,
+                    stage="askar_fetch",
+                    category=category,
+                )
+        if tuner and tuner.batches:
+            print(f"Auto-tuner settled on {tuner.summary()} for {category}")
 
-    async def update_keys(self, store: Store):
-        progress = Progress("Updating keys...", interval=self.batch_size)
-        async with store.transaction() as txn:
+    async def update_keys(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating keys...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(txn, "Indy::Key"):
                 await txn.remove("Indy::Key", row.name)
                 meta = await txn.fetch("Indy::KeyMetadata", row.name)
@@ -252,9 +842,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_master_keys(self, store: Store):
-        progress = Progress("Updating master secret(s)...", interval=self.batch_size)
-        async with store.transaction() as txn:
+    async def update_master_keys(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating master secret(s)...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(txn, "Indy::MasterSecret"):
                 if progress.count > 0:
                     raise Exception("Encountered multiple master secrets")
@@ -264,9 +854,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_dids(self, store: Store):
-        progress = Progress("Updating DIDs...", interval=self.batch_size)
-        async with store.transaction() as txn:
+    async def update_dids(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating DIDs...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(txn, "Indy::Did"):
                 await txn.remove("Indy::Did", row.name)
                 info = json.loads(row.value)
@@ -290,9 +880,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_schemas(self, store: Store):
-        progress = Progress("Updating stored schemas...", interval=self.batch_size)
-        async with store.transaction() as txn:
+    async def update_schemas(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating stored schemas...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(txn, "Indy::Schema"):
                 await txn.remove("Indy::Schema", row.name)
                 await txn.insert(
@@ -304,11 +894,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_cred_defs(self, store: Store):
-        progress = Progress(
-            "Updating stored credential definitions...", interval=self.batch_size
-        )
-        async with store.transaction() as txn:
+    async def update_cred_defs(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating stored credential definitions...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(txn, "Indy::CredentialDefinition"):
                 await txn.remove("Indy::CredentialDefinition", row.name)
                 sid = await txn.fetch("Indy::SchemaId", row.name)
@@ -349,12 +937,11 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_rev_reg_defs(self, store: Store):
-        progress = Progress(
-            "Updating stored revocation registry definitions...",
-            interval=self.batch_size,
+    async def update_rev_reg_defs(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer(
+            "Updating stored revocation registry definitions..."
         )
-        async with store.transaction() as txn:
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(
                 txn,
                 "Indy::RevocationRegistryDefinition",
@@ -365,11 +952,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_rev_reg_keys(self, store: Store):
-        progress = Progress(
-            "Updating stored revocation registry keys...", interval=self.batch_size
-        )
-        async with store.transaction() as txn:
+    async def update_rev_reg_keys(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating stored revocation registry keys...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(
                 txn, "Indy::RevocationRegistryDefinitionPrivate"
             ):
@@ -381,11 +966,11 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_rev_reg_states(self, store: Store):
-        progress = Progress(
-            "Updating stored revocation registry states...", interval=self.batch_size
+    async def update_rev_reg_states(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer(
+            "Updating stored revocation registry states..."
         )
-        async with store.transaction() as txn:
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(
                 txn,
                 "Indy::RevocationRegistry",
@@ -396,11 +981,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_rev_reg_info(self, store: Store):
-        progress = Progress(
-            "Updating stored revocation registry info...", interval=self.batch_size
-        )
-        async with store.transaction() as txn:
+    async def update_rev_reg_info(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating stored revocation registry info...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(
                 txn,
                 "Indy::RevocationRegistryInfo",
@@ -411,9 +994,9 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
-    async def update_creds(self, store: Store):
-        progress = Progress("Updating stored credentials...", interval=self.batch_size)
-        async with store.transaction() as txn:
+    async def update_creds(self, store: Store, profile: Optional[str] = None):
+        progress = self.progress_printer("Updating stored credentials...")
+        async with store.transaction(profile) as txn:
             async for row in self.batched_fetch_all(txn, "Indy::Credential"):
                 await txn.remove("Indy::Credential", row.name)
                 cred_data = row.value_json
@@ -423,28 +1006,63 @@ class Strategy(ABC):
             await txn.commit()
         progress.report()
 
+    def askar_uri(self, uri: str) -> str:
+        """Askar URI of a database, sized like the connection pools."""
+        if not self.pools or not uri.startswith("postgres"):
+            return uri
+        separator = "&" if "?" in uri else "?"
+        return f"{uri}{separator}max_connections={self.pools.max_size}"
+
+    async def open_store(
+        self, uri: str, wallet_key: str, profile: Optional[str] = None
+    ) -> Store:
+        print("Opening wallet with Askar...")
+        start = time.perf_counter()
+        store = await Store.open(
+            self.askar_uri(uri), pass_key=wallet_key, profile=profile
+        )
+        if self.metrics:
+            self.metrics.observe(
+                "kdf_seconds", time.perf_counter() - start, stage="askar_open"
+            )
+        return store
+
     async def convert_items_to_askar(
         self,
         uri: str,
         wallet_key: str,
         profile: str = None,
+        store: Optional[Store] = None,
     ):
-        print("Opening wallet with Askar...")
-        store = await Store.open(uri, pass_key=wallet_key, profile=profile)
-
-        await self.update_keys(store)
-        await self.update_master_keys(store)
-        await self.update_dids(store)
-        await self.update_schemas(store)
-        await self.update_cred_defs(store)
-        await self.update_rev_reg_defs(store)
-        await self.update_rev_reg_keys(store)
-        await self.update_rev_reg_states(store)
-        await self.update_rev_reg_info(store)
-        await self.update_creds(store)
-
-        print("Closing wallet")
-        await store.close()
+        """Convert the Indy categories of a profile with Askar.
+
+        A store already open, such as one shared by the profiles of a
+        database, is left open.
+        """
+        opened = store is None
+        if opened:
+            store = await self.open_store(uri, wallet_key, profile)
+        if self.progress:
+            async with store.session(profile) as session:
+                total = 0
+                for category in ASKAR_CATEGORIES:
+                    total += await session.count(category)
+            self.progress.set_total("askar", total)
+
+        await self.update_keys(store, profile)
+        await self.update_master_keys(store, profile)
+        await self.update_dids(store, profile)
+        await self.update_schemas(store, profile)
+        await self.update_cred_defs(store, profile)
+        await self.update_rev_reg_defs(store, profile)
+        await self.update_rev_reg_keys(store, profile)
+        await self.update_rev_reg_states(store, profile)
+        await self.update_rev_reg_info(store, profile)
+        await self.update_creds(store, profile)
+
+        if opened:
+            print("Closing wallet")
+            await store.close()
 
     def _credential_tags(self, cred_data: dict) -> dict:
         schema_id = cred_data["schema_id"]
@@ -475,8 +1093,9 @@ class Strategy(ABC):
         pass_key = "kdf:argon2i:13:mod?salt=" + indy_key["salt"].hex()
         await conn.create_config(default_profile=name, key=pass_key)
 
-    async def init_profile(self, wallet: Wallet, name: str, indy_key: dict) -> dict:
-        profile_key = {
+    def profile_key(self, indy_key: dict) -> dict:
+        """Askar profile key reusing the Indy wallet's keys."""
+        return {
             "ver": "1",
             "ick": indy_key["type"],
             "ink": indy_key["name"],
@@ -486,6 +1105,8 @@ class Strategy(ABC):
             "thk": indy_key["tag_hmac"],
         }
 
+    async def init_profile(self, wallet: Wallet, name: str, indy_key: dict) -> dict:
+        profile_key = self.profile_key(indy_key)
         enc_pk = self.encrypt_merged(cbor2.dumps(profile_key), indy_key["master"])
         await wallet.insert_profile(name, enc_pk)
         return profile_key
@@ -494,8 +1115,66 @@ class Strategy(ABC):
         wallet_id_records = await conn.fetch("""SELECT wallet_id FROM metadata""")
         return [wallet_id[0] for wallet_id in wallet_id_records]
 
+    async def wallet_sizes(self, conn) -> Dict[str, Tuple[int, int]]:
+        """Count the items and value bytes of each wallet in a MWST DB.
+
+        The counts are used to schedule the wallets, and as the progress
+        totals, which gives an overall ETA from the start.
+        """
+        sizes = {
+            wallet_id: (count, nbytes)
+            for wallet_id, count, nbytes in await conn.fetch(
+                """
+                SELECT wallet_id, COUNT(*), COALESCE(SUM(octet_length(value)), 0)::bigint
+                FROM items GROUP BY wallet_id
+                """
+            )
+        }
+        if self.progress:
+            for wallet_id, (count, _) in sizes.items():
+                self.progress.set_total("items", count, wallet_id)
+        return sizes
+
+    def pools_for(self, uri: str) -> Optional[ConnectionPools]:
+        """Pools to borrow connections to a database from, if any.
+
+        Work queue workers connect to the source outside the pools, so that
+        a worker with no wallet claimed holds no connection to it, and the
+        worker finishing the queue can drop it.
+        """
+        if self.work_queue and uri == self.uri:
+            return None
+        return self.pools
+
+    @contextlib.asynccontextmanager
+    async def connection(self, uri: str):
+        """Open a connection to a database, borrowed from its pool if any."""
+        pools = self.pools_for(uri)
+        if pools:
+            async with pools.connection(uri) as conn:
+                yield conn
+            return
+        conn = await asyncpg.connect(uri)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    @contextlib.asynccontextmanager
+    async def source_connection(self):
+        """Open a worker's own connection to the source database."""
+        async with self.connection(self.uri) as conn:
+            yield conn
+
     async def delete_wallets_database(self):
         parts = urlparse(self.uri)
+        if self.pools:
+            # Pooled connections to the source would prevent dropping it
+            await self.pools.release(self.uri)
+            async with self.pools.connection(admin_uri(self.uri)) as sys_conn:
+                await sys_conn.execute(f"DROP DATABASE {parts.path[1:]}")
+            print("Indy wallets database deleted.")
+            return
         sys_conn = await asyncpg.connect(
             host=parts.hostname,
             port=parts.port or 5432,
@@ -511,18 +1190,81 @@ class Strategy(ABC):
         if self.delete_indy_wallets:
             if self.skip_confirmation:
                 await self.delete_wallets_database()
+                return
             elif sys.stdout.isatty():
                 response = input(
                     "Would you like to delete the original Indy wallet database? Y/N "
                 )
                 if response in ["Y", "y", "yes", "Yes"]:
                     await self.delete_wallets_database()
+                    return
                 else:
                     print("Indy wallets database not deleted.")
             else:
                 print("Indy wallets database not deleted.")
         else:
             print("Indy wallets database not deleted.")
+        if self.vacuum_source:
+            await self.vacuum_source_database()
+
+    async def finish_layout(self, uri: str):
+        """Optimize the physical layout of a migrated Postgres database.
+
+        Only done when enabled, once the Askar phase has rewritten the items.
+        """
+        if not self.optimize_layout:
+            return
+        conn = PgConnection(uri, self.pools_for(uri))
+        await conn.connect()
+        try:
+            start = time.perf_counter()
+            await conn.optimize_layout()
+            sizes = await conn.table_sizes(ASKAR_TABLES)
+        finally:
+            await conn.close()
+        self.report_sizes(
+            f"Optimized layout of {conn.parsed_url.path[1:]} in "
+            f"{format_duration(time.perf_counter() - start)}",
+            sizes,
+        )
+
+    async def vacuum_source_database(self):
+        """Reclaim the space of the Indy rows deleted from the source."""
+        conn = PgConnection(self.uri, self.pools_for(self.uri))
+        await conn.connect()
+        try:
+            start = time.perf_counter()
+            before = await conn.table_sizes(INDY_TABLES)
+            await conn.vacuum([table for table, _, _ in before])
+            sizes = await conn.table_sizes(INDY_TABLES)
+        finally:
+            await conn.close()
+        self.report_sizes(
+            "Vacuumed Indy wallets database in "
+            f"{format_duration(time.perf_counter() - start)}",
+            sizes,
+        )
+
+    @staticmethod
+    def report_sizes(title: str, sizes: Sequence[Tuple[str, int, int]]):
+        print(f"{title}:")
+        for table, size, indexes in sizes:
+            print(f"  {table}: {format_bytes(size)}, indexes {format_bytes(indexes)}")
+
+    def report_deferred(self, wallets: Sequence[str]):
+        """Report the wallets left for a later run by the deadline."""
+        if not wallets:
+            return
+        print(
+            f"Deadline: {len(wallets)} wallet(s) left untouched for a later run: "
+            f"{sorted(wallets)}"
+        )
+        if self.delete_indy_wallets:
+            print(
+                "Indy wallets will not be deleted because there are wallets "
+                "that were not migrated"
+            )
+            self.delete_indy_wallets = False
 
     @abstractmethod
     async def run(self):
@@ -538,28 +1280,98 @@ class DbpwStrategy(Strategy):
         wallet_name: str,
         wallet_key: str,
         batch_size: int,
+        readers: int = 1,
+        compact: bool = False,
+        **kwargs,
     ):
-        super().__init__(batch_size)
+        """Initialize a DbpwStrategy instance.
+
+        With more than one reader, the items of a PostgreSQL wallet are read
+        and written in that many ranges of item ids at once. With compact, a
+        SQLite wallet is rewritten without free pages once migrated.
+        """
+        super().__init__(batch_size, **kwargs)
         self.conn = conn
         self.wallet_name = wallet_name
         self.wallet_key = wallet_key
+        self.readers = readers
+        self.compact = compact
 
     async def run(self):
         """Perform the upgrade."""
-        await self.conn.connect()
-        wallet = self.conn.get_wallet()
+        with wallet_scope(self.wallet_name):
+            await self.conn.connect()
+            wallet = self.conn.get_wallet()
+
+            try:
+                if await self.conn.find_table("metadata"):
+                    await self.verify_keys(
+                        {self.wallet_name: await wallet.get_metadata()},
+                        {self.wallet_name: self.wallet_key},
+                    )
+                await self.conn.pre_upgrade()
+                indy_key = await self.fetch_indy_key(wallet, self.wallet_key)
+                await self.create_config(self.conn, self.wallet_name, indy_key)
+                profile_key = await self.init_profile(
+                    wallet, self.wallet_name, indy_key
+                )
+                await self.migrate_items(wallet, indy_key, profile_key)
+                await self.conn.finish_upgrade()
+            finally:
+                await self.conn.close()
+
+            await self.convert_items_to_askar(self.conn.uri, self.wallet_key)
+
+            if self.compact and isinstance(self.conn, SqliteConnection):
+                before, after = await self.conn.compact()
+                print(f"Compacted wallet from {before} to {after} bytes")
+            if isinstance(self.conn, PgConnection):
+                await self.finish_layout(self.conn.uri)
+
+    async def migrate_items(self, wallet: Wallet, indy_key: dict, profile_key: dict):
+        """Migrate the items, over parallel readers if configured."""
+        if self.readers > 1 and isinstance(self.conn, PgConnection):
+            await self.update_items_partitioned(wallet, indy_key, profile_key)
+        else:
+            async with self.source_reader(wallet, self.conn.uri):
+                await self.update_items(wallet, indy_key, profile_key)
+
+    async def update_items_partitioned(
+        self, wallet: PgWallet, indy_key: dict, profile_key: dict
+    ):
+        """Migrate ranges of item ids in parallel, from one exported snapshot.
 
+        Each range is streamed through a cursor on a reader connection of its
+        own and written through a separate writer connection, so reading,
+        decryption and writing overlap across ranges. Every reader imports the
+        same snapshot and sees the same items.
+        """
+        ranges = await self.conn.id_ranges(self.readers)
+        conns: List[asyncpg.Connection] = []
         try:
-            await self.conn.pre_upgrade()
-            indy_key = await self.fetch_indy_key(wallet, self.wallet_key)
-            await self.create_config(self.conn, self.wallet_name, indy_key)
-            profile_key = await self.init_profile(wallet, self.wallet_name, indy_key)
-            await self.update_items(wallet, indy_key, profile_key)
-            await self.conn.finish_upgrade()
+            async with self.conn.exported_snapshot() as snapshot:
+                partitions = []
+                for first, end in ranges:
+                    reader = await asyncpg.connect(self.conn.uri)
+                    conns.append(reader)
+                    writer = await asyncpg.connect(self.conn.uri)
+                    conns.append(writer)
+                    partitions.append(
+                        wallet.partition(
+                            writer,
+                            reader,
+                            snapshot,
+                            first,
+                            end,
+                            self.cursor_prefetch or self.batch_size,
+                        )
+                    )
+                print(f"Reading {len(partitions)} item id range(s) in parallel")
+                await self.update_items(
+                    wallet, indy_key, profile_key, partitions=partitions
+                )
         finally:
-            await self.conn.close()
-
-        await self.convert_items_to_askar(self.conn.uri, self.wallet_key)
+            await asyncio.gather(*(conn.close() for conn in conns))
 
 
 class MwstAsProfilesStrategy(Strategy):
@@ -573,27 +1385,21 @@ class MwstAsProfilesStrategy(Strategy):
         batch_size: int,
         delete_indy_wallets: Optional[bool] = False,
         skip_confirmation: Optional[bool] = False,
+        work_queue: Optional[WorkQueue] = None,
+        **kwargs,
     ):
-        super().__init__(batch_size)
+        super().__init__(batch_size, **kwargs)
         self.uri = uri
         self.base_wallet_name = base_wallet_name
         self.base_wallet_key = base_wallet_key
         self.delete_indy_wallets = delete_indy_wallets
         self.skip_confirmation = skip_confirmation
+        self.work_queue = work_queue
 
     async def init_profile(
         self, wallet: Wallet, name: str, base_indy_key: dict, indy_key: dict
     ) -> dict:
-        profile_key = {
-            "ver": "1",
-            "ick": indy_key["type"],
-            "ink": indy_key["name"],
-            "ihk": indy_key["item_hmac"],
-            "tnk": indy_key["tag_name"],
-            "tvk": indy_key["tag_value"],
-            "thk": indy_key["tag_hmac"],
-        }
-
+        profile_key = self.profile_key(indy_key)
         enc_pk = self.encrypt_merged(cbor2.dumps(profile_key), base_indy_key["master"])
         await wallet.insert_profile(name, enc_pk)
         return profile_key
@@ -610,7 +1416,50 @@ class MwstAsProfilesStrategy(Strategy):
         profile_key = await self.init_profile(
             wallet, wallet_id, base_indy_key, indy_key
         )
-        await self.update_items(wallet, indy_key, profile_key)
+        async with self.source_reader(wallet, self.uri):
+            await self.update_items(wallet, indy_key, profile_key)
+
+    async def read_sub_wallet_keys(
+        self, source: asyncpg.Connection, base_indy_key: dict
+    ) -> Dict[str, Optional[str]]:
+        """Read sub-wallet names and keys from the base wallet's Indy items.
+
+        ACA-Py keeps them in the settings of a `wallet_record` per sub-wallet.
+        Item types are encrypted deterministically, so the records are found
+        by their encrypted type.
+        """
+        record_type = base64.b64encode(
+            _encrypt_searchable(
+                b"wallet_record",
+                base_indy_key["type"],
+                hmac.HMAC(base_indy_key["item_hmac"], digestmod=hashlib.sha256),
+            )
+        )
+        rows = await source.fetch(
+            """
+            SELECT id, type, name, value, key, NULL, NULL FROM items
+            WHERE wallet_id = $1 AND type = $2
+            """,
+            self.base_wallet_name,
+            record_type,
+        )
+        sub_wallet_keys = {}
+        for item in IndyCipher(base_indy_key, b64=True).decrypt_rows(rows):
+            settings = json.loads(item.value)["settings"]
+            sub_wallet_keys[settings["wallet.name"]] = settings.get("wallet.key")
+        return sub_wallet_keys
+
+    async def check_wallet_keys(self, source: asyncpg.Connection):
+        """Verify the base wallet key, then every sub-wallet key."""
+        metadata = await self.fetch_wallet_metadata(source, [self.base_wallet_name])
+        await self.verify_keys(metadata, {self.base_wallet_name: self.base_wallet_key})
+        base_indy_key = self._indy_keys[
+            (metadata[self.base_wallet_name], self.base_wallet_key)
+        ]
+        sub_wallet_keys = await self.read_sub_wallet_keys(source, base_indy_key)
+        await self.verify_keys(
+            await self.fetch_wallet_metadata(source, sub_wallet_keys), sub_wallet_keys
+        )
 
     async def get_wallet_info(self, uri: str):
         store = await Store.open(
@@ -642,6 +1491,46 @@ class MwstAsProfilesStrategy(Strategy):
                 )
                 self.delete_indy_wallets = False
 
+    async def migrate_base_wallet(
+        self,
+        source: asyncpg.Connection,
+        base_conn: PgMWSTConnection,
+        sub_conn: PgMWSTConnection,
+    ) -> dict:
+        """Migrate the base wallet and prepare the sub wallet database.
+
+        Returns the base wallet's Indy key.
+        """
+        await base_conn.pre_upgrade()
+        await sub_conn.pre_upgrade()
+        base_wallet = base_conn.get_wallet(source, self.base_wallet_name)
+
+        base_indy_key: dict = await self.fetch_indy_key(
+            base_wallet, self.base_wallet_key
+        )
+        await self.create_config(base_conn, self.base_wallet_name, base_indy_key)
+
+        # ACA-Py expects a default profile
+        default_wallet = sub_conn.get_wallet(source, "default")
+        await self.create_config(sub_conn, "default", base_indy_key)
+        await super().init_profile(default_wallet, "default", base_indy_key)
+
+        with wallet_scope(self.base_wallet_name):
+            await self.migrate_one_profile(
+                base_wallet,
+                base_indy_key,
+                self.base_wallet_name,
+                self.base_wallet_key,
+            )
+            await base_conn.finish_upgrade()
+            await base_conn.close()
+            await self.convert_items_to_askar(
+                base_conn.uri,
+                self.base_wallet_key,
+            )
+            await self.finish_layout(base_conn.uri)
+        return base_indy_key
+
     async def run(self):
         """Perform the upgrade.
 
@@ -653,73 +1542,215 @@ class MwstAsProfilesStrategy(Strategy):
         After Base wallet is migrated, it can be finalized.
 
         Wallet info of subwallets read from base wallet post migration.
+        Subwallets are then migrated largest first, `wallet_workers` at a time.
         """
+        if self.work_queue:
+            await self.run_queue()
+            return
+
         source = await asyncpg.connect(self.uri)
+        try:
+            await self.check_wallet_keys(source)
+        except Exception:
+            await source.close()
+            raise
         parsed = urlparse(self.uri)
 
         base_conn = PgMWSTConnection(
-            f"{parsed.scheme}://{parsed.netloc}/{self.base_wallet_name}"
+            f"{parsed.scheme}://{parsed.netloc}/{self.base_wallet_name}",
+            pools=self.pools,
         )
         await base_conn.connect()
         sub_conn = PgMWSTConnection(
-            f"{parsed.scheme}://{parsed.netloc}/multitenant_sub_wallet"
+            f"{parsed.scheme}://{parsed.netloc}/multitenant_sub_wallet",
+            pools=self.pools,
         )
         await sub_conn.connect()
+        # One Askar store converts every profile of the sub wallet database
+        sub_store: Optional[Store] = None
 
         try:
-            await base_conn.pre_upgrade()
-            await sub_conn.pre_upgrade()
-            base_wallet = base_conn.get_wallet(source, self.base_wallet_name)
-
-            base_indy_key: dict = await self.fetch_indy_key(
-                base_wallet, self.base_wallet_key
-            )
-            await self.create_config(base_conn, self.base_wallet_name, base_indy_key)
-
-            # ACA-Py expects a default profile
-            default_wallet = sub_conn.get_wallet(source, "default")
-            await self.create_config(sub_conn, "default", base_indy_key)
-            await super().init_profile(default_wallet, "default", base_indy_key)
-
-            await self.migrate_one_profile(
-                base_wallet,
-                base_indy_key,
-                self.base_wallet_name,
-                self.base_wallet_key,
-            )
-            await base_conn.finish_upgrade()
-            await base_conn.close()
-            await self.convert_items_to_askar(
-                base_conn.uri,
-                self.base_wallet_key,
+            sizes = await self.wallet_sizes(source)
+            scheduler = WalletScheduler(
+                sizes, self.wallet_workers, deadline=self.deadline
             )
+            base_indy_key = await self.migrate_base_wallet(source, base_conn, sub_conn)
+            # Profiles are converted as soon as their items are copied
+            await sub_conn.finish_upgrade()
+            sub_store = await self.open_store(sub_conn.uri, self.base_wallet_key)
             # Track migrated wallets
             migrated_wallets = [self.base_wallet_name]
 
-            wallet_ids = []
+            wallet_ids = {}
             async for wallet_name, wallet_id, wallet_key in self.get_wallet_info(
                 base_conn.uri
             ):
-                wallet_ids.append(wallet_id)
-                wallet = sub_conn.get_wallet(source, wallet_name)
-                await self.migrate_one_profile(
-                    wallet, base_indy_key, wallet_id, wallet_key
-                )
+                wallet_ids[wallet_name] = (wallet_id, wallet_key)
+
+            # Sub wallets migrated by an earlier run, such as one stopped by
+            # its deadline, have a profile and no items left in the source
+            profiles = await sub_conn.profile_names()
+            done = [
+                wallet_name
+                for wallet_name, (wallet_id, _) in wallet_ids.items()
+                if wallet_id in profiles and wallet_name not in sizes
+            ]
+            if done:
+                print(f"Skipping {len(done)} wallet(s) migrated by an earlier run")
+                migrated_wallets.extend(done)
+            wallets = [
+                wallet_name for wallet_name in wallet_ids if wallet_name not in done
+            ]
+            scheduler.report(wallets)
+
+            @contextlib.asynccontextmanager
+            async def worker():
+                # Each worker reads and writes over its own connections
+                async with self.source_connection() as old_conn:
+                    async with self.connection(sub_conn.uri) as new_conn:
+                        yield old_conn, new_conn
+
+            async def migrate(conns, wallet_name: str):
+                wallet_id, wallet_key = wallet_ids[wallet_name]
+                wallet = PgWallet(*conns, "items", wallet_name)
+                with wallet_scope(wallet_name):
+                    await self.migrate_one_profile(
+                        wallet, base_indy_key, wallet_id, wallet_key
+                    )
+                    await self.convert_items_to_askar(
+                        sub_conn.uri, self.base_wallet_key, wallet_id, sub_store
+                    )
                 migrated_wallets.append(wallet_name)
-            await self.check_for_leftover_wallets(source, migrated_wallets)
 
-            await sub_conn.finish_upgrade()
+            await scheduler.run(wallets, migrate, worker)
+            await sub_store.close()
+            sub_store = None
+            await self.finish_layout(sub_conn.uri)
+            self.report_deferred(scheduler.deferred)
+            await self.check_for_leftover_wallets(source, migrated_wallets)
         finally:
+            if sub_store:
+                await sub_store.close()
             await source.close()
             await base_conn.close()
             await sub_conn.close()
 
-        for wallet_id in wallet_ids:
-            await self.convert_items_to_askar(
-                sub_conn.uri, self.base_wallet_key, wallet_id
-            )
         await self.determine_wallet_deletion()
 
+    async def run_queue(self):
+        """Perform the upgrade as one of the workers sharing the work queue.
+
+        The worker creating the queue checks the keys and migrates the base
+        wallet. Sub wallets are then claimed from the queue, first to copy
+        their items and then, once every sub wallet's items are copied and
+        the sub wallet database is finished, to convert them with Askar.
+        """
+        parsed = urlparse(self.uri)
+        base_uri = f"{parsed.scheme}://{parsed.netloc}/{self.base_wallet_name}"
+        sub_uri = f"{parsed.scheme}://{parsed.netloc}/multitenant_sub_wallet"
+        # Wallet info and the base wallet's Indy key, loaded once per worker
+        state = {}
+        state_lock = asyncio.Lock()
+        # Askar store of the sub wallet database, opened once per worker
+        stores: Dict[str, Store] = {}
+        store_lock = asyncio.Lock()
+
+        async def load_state() -> dict:
+            async with state_lock:
+                if not state:
+                    state["wallets"] = {
+                        wallet_name: (wallet_id, wallet_key)
+                        async for wallet_name, wallet_id, wallet_key in (
+                            self.get_wallet_info(base_uri)
+                        )
+                    }
+                    async with self.source_connection() as source:
+                        state["base_indy_key"] = await self.fetch_indy_key(
+                            PgWallet(source, None, "items", self.base_wallet_name),
+                            self.base_wallet_key,
+                        )
+            return state
+
+        async def prepare():
+            base_conn = PgMWSTConnection(base_uri, pools=self.pools)
+            sub_conn = PgMWSTConnection(sub_uri, pools=self.pools)
+            async with self.source_connection() as source:
+                try:
+                    await self.check_wallet_keys(source)
+                    scheduler = WalletScheduler(await self.wallet_sizes(source))
+                    await base_conn.connect()
+                    await sub_conn.connect()
+                    await self.migrate_base_wallet(source, base_conn, sub_conn)
+                finally:
+                    await base_conn.close()
+                    await sub_conn.close()
+            costs = {
+                wallet_name: scheduler.cost(wallet_name)
+                for wallet_name in (await load_state())["wallets"]
+            }
+            return {"items": costs, "askar": costs}
+
+        async def migrate(wallet_name: str):
+            state = await load_state()
+            wallet_id, wallet_key = state["wallets"][wallet_name]
+            async with self.source_connection() as old_conn:
+                async with self.connection(sub_uri) as new_conn:
+                    with wallet_scope(wallet_name):
+                        await self.migrate_one_profile(
+                            PgWallet(old_conn, new_conn, "items", wallet_name),
+                            state["base_indy_key"],
+                            wallet_id,
+                            wallet_key,
+                        )
+
+        async def finish_items():
+            sub_conn = PgMWSTConnection(sub_uri, pools=self.pools)
+            await sub_conn.connect()
+            try:
+                await sub_conn.finish_upgrade()
+            finally:
+                await sub_conn.close()
+
+        async def convert(wallet_name: str):
+            state = await load_state()
+            async with store_lock:
+                if not stores:
+                    stores[sub_uri] = await self.open_store(
+                        sub_uri, self.base_wallet_key
+                    )
+            with wallet_scope(wallet_name):
+                await self.convert_items_to_askar(
+                    sub_uri,
+                    self.base_wallet_key,
+                    state["wallets"][wallet_name][0],
+                    stores[sub_uri],
+                )
+
+        async def finish():
+            state = await load_state()
+            async with store_lock:
+                for store in stores.values():
+                    await store.close()
+                stores.clear()
+            await self.finish_layout(sub_uri)
+            async with self.source_connection() as source:
+                await self.check_for_leftover_wallets(
+                    source, [self.base_wallet_name, *state["wallets"]]
+                )
+            await self.determine_wallet_deletion()
+
+        try:
+            await self.work_queue.run(
+                ("items", "askar"),
+                prepare,
+                {"items": migrate, "askar": convert},
+                {"items": finish_items, "askar": finish},
+                self.wallet_workers,
+            )
+        finally:
+            for store in stores.values():
+                await store.close()
+
 
 class MwstAsStoresStrategy(Strategy):
     """MultiWalletSingleTable as separate Askar stores upgrade strategy."""
@@ -732,18 +1763,54 @@ class MwstAsStoresStrategy(Strategy):
         allow_missing_wallet: Optional[bool] = False,
         delete_indy_wallets: Optional[bool] = False,
         skip_confirmation: Optional[bool] = False,
+        work_queue: Optional[WorkQueue] = None,
+        deferred_file: Optional[str] = None,
+        live: Optional[str] = None,
+        **kwargs,
     ):
-        super().__init__(batch_size)
+        super().__init__(batch_size, **kwargs)
         self.uri = uri
         self.wallet_keys = wallet_keys
         self.allow_missing_wallet = allow_missing_wallet
         self.delete_indy_wallets = delete_indy_wallets
         self.skip_confirmation = skip_confirmation
+        self.work_queue = work_queue
+        self.deferred_file = deferred_file
+        self.live = live
+        self.template: Optional[DatabaseTemplate] = None
 
-    def create_new_db_connection(self, wallet_name: str):
+    def store_uri(self, wallet_name: str) -> str:
         parsed = urlparse(self.uri)
-        new_conn_uri = f"{parsed.scheme}://{parsed.netloc}/{wallet_name}"
-        return PgMWSTConnection(new_conn_uri)
+        return f"{parsed.scheme}://{parsed.netloc}/{wallet_name}"
+
+    def create_new_db_connection(self, wallet_name: str):
+        return PgMWSTConnection(
+            self.store_uri(wallet_name), self.template, pools=self.pools
+        )
+
+    async def release_store(self, wallet_name: str):
+        """Close the pooled connections of a store once it is migrated."""
+        if self.pools:
+            await self.pools.release(self.store_uri(wallet_name))
+
+    @contextlib.asynccontextmanager
+    async def store_template(self, drop: bool = True):
+        """Create the missing store databases from a template database.
+
+        The template is dropped on leaving, even on failure, unless other
+        workers may still copy it.
+        """
+        self.template = DatabaseTemplate(self.uri, pools=self.pools)
+        await self.template.open()
+        try:
+            yield self.template
+        finally:
+            try:
+                if drop:
+                    await self.template.drop()
+            finally:
+                await self.template.close()
+                self.template = None
 
     async def check_wallet_alignment(self, conn, wallet_keys):
         """Verify that the wallet names passed in align with
@@ -771,33 +1838,282 @@ class MwstAsStoresStrategy(Strategy):
         else:
             await self.check_wallet_alignment(conn, wallet_keys)
 
-    async def run(self):
-        """Perform the upgrade."""
+    async def migrate_one_store(self, source, wallet_name: str, wallet_key: str):
+        """Migrate one wallet to its own database."""
+        # Connect to new database
+        new_db_conn: PgMWSTConnection = self.create_new_db_connection(wallet_name)
+        await new_db_conn.connect()
 
-        # Connect to original database
-        source = await asyncpg.connect(self.uri)
-        await self.check_missing_wallet_flag(
-            source, self.wallet_keys, self.allow_missing_wallet
-        )
+        wallet = new_db_conn.get_wallet(source, wallet_name)
+        try:
+            if not new_db_conn.from_template:
+                await new_db_conn.pre_upgrade()
+            indy_key = await self.fetch_indy_key(wallet, wallet_key)
+            await self.create_config(new_db_conn, wallet_name, indy_key)
+            profile_key = await self.init_profile(wallet, wallet_name, indy_key)
+            async with self.source_reader(wallet, self.uri):
+                await self.update_items(wallet, indy_key, profile_key)
+            await new_db_conn.finish_upgrade()
+        finally:
+            await new_db_conn.close()
 
-        for wallet_name, wallet_key in self.wallet_keys.items():
+        await self.convert_items_to_askar(new_db_conn.uri, wallet_key)
+        await self.finish_layout(new_db_conn.uri)
 
-            # Connect to new database
-            new_db_conn: PgMWSTConnection = self.create_new_db_connection(wallet_name)
-            await new_db_conn.connect()
+    async def copy_one_store(self, source, wallet_name: str, wallet_key: str):
+        """Copy one wallet's items to its own database, keeping the source.
 
-            wallet = new_db_conn.get_wallet(source, wallet_name)
-            try:
-                await new_db_conn.pre_upgrade()
+        Items are streamed from a single snapshot, so that every change
+        after it is in the journal. The Askar conversion is left to the
+        cutover.
+        """
+        new_db_conn: PgMWSTConnection = self.create_new_db_connection(wallet_name)
+        await new_db_conn.connect()
+        wallet = new_db_conn.get_wallet(source, wallet_name, delete_source=False)
+        try:
+            async with self.connection(self.uri) as reader:
+                if not new_db_conn.from_template:
+                    await new_db_conn.pre_upgrade()
                 indy_key = await self.fetch_indy_key(wallet, wallet_key)
                 await self.create_config(new_db_conn, wallet_name, indy_key)
                 profile_key = await self.init_profile(wallet, wallet_name, indy_key)
+                wallet.use_cursor(reader, self.cursor_prefetch or self.batch_size)
                 await self.update_items(wallet, indy_key, profile_key)
-                await new_db_conn.finish_upgrade()
+        finally:
+            await new_db_conn.close()
+
+    async def replay_one_store(self, source, wallet_name: str, wallet_key: str) -> int:
+        """Apply the journalled changes of one wallet to its copy.
+
+        Every changed item is re-read from the source and replaces its copy,
+        found by its previous and current type and name. Returns the number
+        of changed items.
+        """
+        journal = ChangeJournal(source)
+        seqs, changes = await journal.changes(wallet_name)
+        if not changes:
+            return 0
+        new_db_conn: PgMWSTConnection = self.create_new_db_connection(wallet_name)
+        await new_db_conn.connect()
+        wallet = new_db_conn.get_wallet(source, wallet_name, delete_source=False)
+        try:
+            indy_key = await self.fetch_indy_key(wallet, wallet_key)
+            profile_key = await self.init_profile(wallet, wallet_name, indy_key)
+            ciphers = (
+                IndyCipher(indy_key, b64=True, cache_size=self.cache_size),
+                AskarCipher(profile_key, cache_size=self.cache_size),
+            )
+            indy_cipher, askar_cipher = ciphers
+            stale = {
+                tuple(
+                    map(
+                        bytes,
+                        askar_cipher.encrypt_key(
+                            *indy_cipher.decrypt_key(old_type, old_name)
+                        ),
+                    )
+                )
+                for old_keys in changes.values()
+                for old_type, old_name in old_keys
+                if old_type is not None
+            }
+            items = self._convert_rows(ciphers, await wallet.fetch_items(list(changes)))
+            stale.update((bytes(item.category), bytes(item.name)) for item in items)
+            await wallet.replace_items(stale, items)
+        finally:
+            await new_db_conn.close()
+        await journal.consume(wallet_name, seqs)
+        if self.progress:
+            self.progress.update("replay", sum(map(len, changes.values())), wallet_name)
+        return len(changes)
+
+    async def cutover_one_store(self, source, wallet_name: str, wallet_key: str):
+        """Replay the last changes of one wallet, then finish it with Askar."""
+        await self.replay_one_store(source, wallet_name, wallet_key)
+        new_db_conn: PgMWSTConnection = self.create_new_db_connection(wallet_name)
+        await new_db_conn.connect()
+        try:
+            await new_db_conn.finish_upgrade()
+        finally:
+            await new_db_conn.close()
+        await self.convert_items_to_askar(new_db_conn.uri, wallet_key)
+        await self.finish_layout(new_db_conn.uri)
+
+    async def run_live(self):
+        """Perform one phase of the upgrade while the agent keeps running.
+
+        - copy: start recording changes, and copy every wallet's items to its
+          own database without modifying the source
+        - sync: apply the changes recorded since, optional and repeatable
+        - cutover: with the agent stopped, apply the last changes, convert
+          the wallets with Askar and stop recording changes
+        """
+        source = await asyncpg.connect(self.uri)
+        try:
+            await self.check_missing_wallet_flag(
+                source, self.wallet_keys, self.allow_missing_wallet
+            )
+            journal = ChangeJournal(source)
+            if self.live == "copy":
+                await self.verify_keys(
+                    await self.fetch_wallet_metadata(source, self.wallet_keys),
+                    self.wallet_keys,
+                )
+                await journal.install()
+                print("Recording changes to the Indy wallets")
+                scheduler = WalletScheduler(
+                    await self.wallet_sizes(source), self.wallet_workers
+                )
+                migrate_one = self.copy_one_store
+            else:
+                if not await journal.installed():
+                    raise UpgradeError("No recorded changes, run the copy phase first")
+                pending = await journal.pending()
+                print(
+                    f"Replaying {sum(pending.get(w, 0) for w in self.wallet_keys)} "
+                    "recorded change(s)"
+                )
+                if self.progress:
+                    for wallet_name in self.wallet_keys:
+                        self.progress.set_total(
+                            "replay", pending.get(wallet_name, 0), wallet_name
+                        )
+                scheduler = WalletScheduler(
+                    {w: (pending.get(w, 0), 0) for w in self.wallet_keys},
+                    self.wallet_workers,
+                )
+                migrate_one = (
+                    self.replay_one_store
+                    if self.live == "sync"
+                    else self.cutover_one_store
+                )
+        finally:
+            await source.close()
+
+        wallets = list(self.wallet_keys)
+        scheduler.report(wallets)
+
+        async def migrate(conn, wallet_name: str):
+            try:
+                with wallet_scope(wallet_name):
+                    await migrate_one(conn, wallet_name, self.wallet_keys[wallet_name])
             finally:
-                await new_db_conn.close()
+                await self.release_store(wallet_name)
+
+        if self.live == "copy":
+            async with self.store_template():
+                await scheduler.run(wallets, migrate, self.source_connection)
+        else:
+            await scheduler.run(wallets, migrate, self.source_connection)
 
-            await self.convert_items_to_askar(new_db_conn.uri, wallet_key)
+        if self.live == "cutover":
+            async with self.source_connection() as source:
+                await ChangeJournal(source).remove()
+            print("Stopped recording changes to the Indy wallets")
+            await self.determine_wallet_deletion()
+
+    async def run(self):
+        """Perform the upgrade."""
+        if self.work_queue:
+            await self.run_queue()
+            return
+        if self.live:
+            await self.run_live()
+            return
 
+        # Connect to original database
+        source = await asyncpg.connect(self.uri)
+        try:
+            await self.check_missing_wallet_flag(
+                source, self.wallet_keys, self.allow_missing_wallet
+            )
+            await self.verify_keys(
+                await self.fetch_wallet_metadata(source, self.wallet_keys),
+                self.wallet_keys,
+            )
+        except Exception:
+            await source.close()
+            raise
+        scheduler = WalletScheduler(
+            await self.wallet_sizes(source), self.wallet_workers, deadline=self.deadline
+        )
         await source.close()
+        wallets = list(self.wallet_keys)
+        scheduler.report(wallets)
+
+        async def migrate(conn, wallet_name: str):
+            try:
+                with wallet_scope(wallet_name):
+                    await self.migrate_one_store(
+                        conn, wallet_name, self.wallet_keys[wallet_name]
+                    )
+            finally:
+                await self.release_store(wallet_name)
+
+        async with self.store_template():
+            await scheduler.run(wallets, migrate, self.source_connection)
+        if scheduler.deferred and self.deferred_file:
+            # A wallet keys file for the next run, with --allow-missing-wallet
+            with open(self.deferred_file, "w") as deferred:
+                json.dump(
+                    {wallet: self.wallet_keys[wallet] for wallet in scheduler.deferred},
+                    deferred,
+                    indent=2,
+                )
+            print(f"Keys of the wallets left written to {self.deferred_file}")
+        self.report_deferred(scheduler.deferred)
         await self.determine_wallet_deletion()
+
+    async def run_queue(self):
+        """Perform the upgrade as one of the workers sharing the work queue.
+
+        Every worker must be given the keys of every wallet.
+        """
+
+        async def prepare():
+            async with self.source_connection() as source:
+                await self.check_missing_wallet_flag(
+                    source, self.wallet_keys, self.allow_missing_wallet
+                )
+                await self.verify_keys(
+                    await self.fetch_wallet_metadata(source, self.wallet_keys),
+                    self.wallet_keys,
+                )
+                scheduler = WalletScheduler(await self.wallet_sizes(source))
+            return {
+                "stores": {
+                    wallet_name: scheduler.cost(wallet_name)
+                    for wallet_name in self.wallet_keys
+                }
+            }
+
+        async def migrate(wallet_name: str):
+            try:
+                async with self.source_connection() as conn:
+                    with wallet_scope(wallet_name):
+                        await self.migrate_one_store(
+                            conn, wallet_name, self.wallet_keys[wallet_name]
+                        )
+            finally:
+                await self.release_store(wallet_name)
+
+        async def finish():
+            # Every store exists, and no worker copies the template any more
+            await self.template.drop()
+            # Only this worker decides whether the source can be deleted
+            async with self.source_connection() as source:
+                await self.check_missing_wallet_flag(
+                    source, self.wallet_keys, self.allow_missing_wallet
+                )
+            await self.determine_wallet_deletion()
+
+        # Other workers may still copy the template when this one stops, so
+        # only the finishing worker drops it
+        async with self.store_template(drop=False):
+            await self.work_queue.run(
+                ("stores",),
+                prepare,
+                {"stores": migrate},
+                {"stores": finish},
+                self.wallet_workers,
+            )
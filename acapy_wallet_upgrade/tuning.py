@@ -0,0 +1,115 @@
+import os
+from typing import Dict, Optional
+
+
+class AutoTuner:
+    """Adaptive batch size and concurrency controller.
+
+    Follows an additive-increase, multiplicative-decrease scheme: while
+    batches finish within the target latency and throughput holds up, the
+    batch size grows by a fixed step; when a batch is too slow or throughput
+    drops, it is cut by a constant factor. Crypto concurrency is raised one
+    worker at a time while batches are CPU bound, and halved when raising it
+    stops paying off.
+
+    Each stage of the migration (the item phase, or an Askar category) has
+    its own controller, obtained with `stage`, since good values differ
+    widely between small and large records. Wallets migrated concurrently
+    each get their own controllers, sharing the crypto concurrency.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 50,
+        min_batch_size: int = 10,
+        max_batch_size: int = 1000,
+        max_concurrency: Optional[int] = None,
+        target_latency: float = 0.5,
+        decrease_factor: float = 0.5,
+        tolerance: float = 0.1,
+    ):
+        """Initialize an AutoTuner instance."""
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.tolerance = tolerance
+        self.increment = max(1, min_batch_size)
+
+        self.batch_size = min(max(batch_size, min_batch_size), max_batch_size)
+        self.concurrency = 1
+        self.batches = 0
+        self.rows = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.db_time = 0.0
+        self._last_rate: Optional[float] = None
+        self._raised_concurrency = False
+        self._stages: Dict[str, "AutoTuner"] = {}
+
+    def stage(self, name: str, shares: int = 1) -> "AutoTuner":
+        """Return the controller for a named stage, creating it if needed.
+
+        The controller gets its share of the maximum concurrency, out of
+        `shares` controllers running at once.
+        """
+        if name not in self._stages:
+            self._stages[name] = AutoTuner(
+                self.batch_size,
+                self.min_batch_size,
+                self.max_batch_size,
+                max(1, self.max_concurrency // shares),
+                self.target_latency,
+                self.decrease_factor,
+                self.tolerance,
+            )
+        return self._stages[name]
+
+    def record(self, rows: int, nbytes: int, elapsed: float, db_time: float):
+        """Record one processed batch and adjust the settings."""
+        if not rows or elapsed <= 0:
+            return
+
+        self.batches += 1
+        self.rows += rows
+        self.bytes += nbytes
+        self.elapsed += elapsed
+        self.db_time += db_time
+
+        rate = rows / elapsed
+        last_rate = self._last_rate
+        self._last_rate = rate
+        slower = last_rate is not None and rate < last_rate * (1 - self.tolerance)
+
+        if elapsed > self.target_latency or (slower and rows >= self.batch_size):
+            self.batch_size = max(
+                self.min_batch_size, int(self.batch_size * self.decrease_factor)
+            )
+        elif rows >= self.batch_size:
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.increment)
+
+        if slower and self._raised_concurrency:
+            self.concurrency = max(1, int(self.concurrency * self.decrease_factor))
+            self._raised_concurrency = False
+        elif (elapsed - db_time) / elapsed > 0.5 and (
+            self.concurrency < self.max_concurrency
+        ):
+            self.concurrency += 1
+            self._raised_concurrency = True
+        else:
+            self._raised_concurrency = False
+
+    @property
+    def rate(self) -> float:
+        """Average rows per second over all recorded batches."""
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        """Describe the settled values."""
+        return (
+            f"batch size {self.batch_size}, concurrency {self.concurrency} "
+            f"({self.batches} batches, {self.rate:.0f} items/s, "
+            f"{self.bytes / self.elapsed / 1024 if self.elapsed else 0:.0f} KiB/s, "
+            f"{self.db_time / self.elapsed if self.elapsed else 0:.0%} in database)"
+        )
@@ -0,0 +1,297 @@
+import asyncio
+import contextlib
+import os
+import socket
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+from urllib.parse import urlparse
+import uuid
+
+import asyncpg
+
+from .error import UpgradeError
+from .pg_mwst_connection import PgMWSTConnection
+
+QUEUE_TABLE = "askar_upgrade_queue"
+STAGES_TABLE = "askar_upgrade_stages"
+# Advisory lock held while creating the queue and while finishing a stage
+LOCK_KEY = 0x61736B72
+
+SCHEMA = f"""
+    CREATE TABLE {STAGES_TABLE} (
+        stage TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        finished BOOLEAN NOT NULL DEFAULT FALSE,
+        PRIMARY KEY (stage)
+    );
+    CREATE TABLE {QUEUE_TABLE} (
+        stage TEXT NOT NULL REFERENCES {STAGES_TABLE} (stage),
+        wallet_id TEXT NOT NULL,
+        cost DOUBLE PRECISION NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        owner TEXT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        heartbeat TIMESTAMPTZ NULL,
+        finished TIMESTAMPTZ NULL,
+        error TEXT NULL,
+        PRIMARY KEY (stage, wallet_id)
+    );
+"""
+
+# Claim the largest wallet that is pending, or whose worker stopped
+# heartbeating, in the first stage that is not finished
+CLAIM = f"""
+    UPDATE {QUEUE_TABLE} q
+    SET state = 'running', owner = $1, heartbeat = now(), attempts = q.attempts + 1
+    FROM (
+        SELECT j.stage, j.wallet_id FROM {QUEUE_TABLE} j
+        JOIN {STAGES_TABLE} s ON s.stage = j.stage
+        WHERE (
+            j.state = 'pending'
+            OR (j.state = 'running' AND j.heartbeat < now() - make_interval(secs => $2))
+        )
+        AND NOT s.finished
+        AND NOT EXISTS (
+            SELECT 1 FROM {STAGES_TABLE} p WHERE p.position < s.position AND NOT p.finished
+        )
+        ORDER BY j.cost DESC, j.wallet_id
+        LIMIT 1
+        FOR UPDATE OF j SKIP LOCKED
+    ) c
+    WHERE q.stage = c.stage AND q.wallet_id = c.wallet_id
+    RETURNING q.stage, q.wallet_id, q.attempts
+"""  # noqa
+
+# Wallets not done yet in the first stage that is not finished
+NEXT_STAGE = f"""
+    SELECT s.stage, COUNT(j.wallet_id) FILTER (WHERE j.state <> 'done')
+    FROM {STAGES_TABLE} s LEFT JOIN {QUEUE_TABLE} j ON j.stage = s.stage
+    WHERE NOT s.finished
+    GROUP BY s.stage, s.position
+    ORDER BY s.position
+    LIMIT 1
+"""
+
+
+class WorkQueue:
+    """Wallets to migrate, shared by worker processes through Postgres tables.
+
+    Any number of workers, on any number of hosts, run the same migration
+    against the same queue. Each worker claims the largest pending wallet
+    with SELECT ... FOR UPDATE SKIP LOCKED, heartbeats while migrating it and
+    marks it done. A wallet whose worker stops heartbeating for `timeout`
+    seconds is claimed again by another worker, so every migration step must
+    be safe to repeat.
+
+    Wallets are migrated in ordered stages. The wallets of a stage are only
+    claimed once every earlier stage is finished, and the first worker to
+    find all of a stage's wallets done runs the stage's finishing step.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        heartbeat_interval: float = 10.0,
+        timeout: float = 60.0,
+        poll_interval: float = 5.0,
+        worker_id: Optional[str] = None,
+    ):
+        """Initialize a WorkQueue instance."""
+        self.uri = uri
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, conn: asyncpg.Connection):
+        await conn.execute("SELECT pg_advisory_lock($1)", LOCK_KEY)
+        try:
+            yield
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", LOCK_KEY)
+
+    async def create(
+        self,
+        conn: asyncpg.Connection,
+        stages: Sequence[str],
+        prepare: Callable[[], Awaitable[Dict[str, Dict[str, float]]]],
+    ):
+        """Create the queue, unless another worker already has.
+
+        `prepare` is only called by the worker creating the queue, and
+        returns the cost of each wallet by stage. Wallets that failed in an
+        earlier run are queued again.
+        """
+        async with self._locked(conn):
+            if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", STAGES_TABLE):
+                retried = await conn.fetch(
+                    f"""
+                    UPDATE {QUEUE_TABLE} SET state = 'pending', error = NULL
+                    WHERE state = 'failed' RETURNING wallet_id
+                    """
+                )
+                if retried:
+                    print(f"Retrying {len(retried)} failed wallet(s)")
+                return
+            jobs = await prepare()
+            async with conn.transaction():
+                await conn.execute(SCHEMA)
+                await conn.executemany(
+                    f"INSERT INTO {STAGES_TABLE} (stage, position) VALUES ($1, $2)",
+                    [(stage, position) for position, stage in enumerate(stages)],
+                )
+                await conn.executemany(
+                    f"""
+                    INSERT INTO {QUEUE_TABLE} (stage, wallet_id, cost)
+                    VALUES ($1, $2, $3)
+                    """,
+                    [
+                        (stage, wallet_id, cost)
+                        for stage in stages
+                        for wallet_id, cost in jobs.get(stage, {}).items()
+                    ],
+                )
+            print(f"Created work queue for {max(map(len, jobs.values()))} wallet(s)")
+
+    async def _heartbeat(self):
+        conn = await asyncpg.connect(self.uri)
+        try:
+            while True:
+                await asyncio.sleep(self.heartbeat_interval)
+                await conn.execute(
+                    f"""
+                    UPDATE {QUEUE_TABLE} SET heartbeat = now()
+                    WHERE owner = $1 AND state = 'running'
+                    """,
+                    self.worker_id,
+                )
+        finally:
+            await conn.close()
+
+    async def _check_failed(self, conn: asyncpg.Connection):
+        """Stop claiming wallets once any wallet failed, on any worker."""
+        failed = await conn.fetch(
+            f"SELECT stage, wallet_id, error FROM {QUEUE_TABLE} WHERE state = 'failed'"
+        )
+        if failed:
+            raise UpgradeError(
+                "Migration failed for wallets:\n  "
+                + "\n  ".join(f"{row[1]} ({row[0]}): {row[2]}" for row in failed)
+            )
+
+    async def _advance(
+        self,
+        conn: asyncpg.Connection,
+        finish: Dict[str, Callable[[], Awaitable[None]]],
+    ) -> Optional[bool]:
+        """Finish the current stage if all of its wallets are done.
+
+        Returns None once every stage is finished, True if a stage was just
+        finished, and False while other workers still hold wallets.
+        """
+        row = await conn.fetchrow(NEXT_STAGE)
+        if row is None:
+            return None
+        stage, remaining = row
+        if remaining:
+            return False
+        async with self._locked(conn):
+            if not await conn.fetchval(
+                f"SELECT finished FROM {STAGES_TABLE} WHERE stage = $1", stage
+            ):
+                if stage in finish:
+                    await finish[stage]()
+                await conn.execute(
+                    f"UPDATE {STAGES_TABLE} SET finished = TRUE WHERE stage = $1", stage
+                )
+                print(f"Finished stage {stage}")
+        return True
+
+    async def _work(
+        self,
+        migrate: Dict[str, Callable[[str], Awaitable[None]]],
+        finish: Dict[str, Callable[[], Awaitable[None]]],
+    ):
+        conn = await asyncpg.connect(self.uri)
+        try:
+            while True:
+                await self._check_failed(conn)
+                job = await conn.fetchrow(CLAIM, self.worker_id, self.timeout)
+                if job is None:
+                    advanced = await self._advance(conn, finish)
+                    if advanced is None:
+                        return
+                    if not advanced:
+                        await asyncio.sleep(self.poll_interval)
+                    continue
+
+                stage, wallet_id, attempts = job
+                if attempts > 1:
+                    print(f"Resuming wallet {wallet_id} ({stage}), attempt {attempts}")
+                try:
+                    await migrate[stage](wallet_id)
+                except Exception as error:
+                    await conn.execute(
+                        f"""
+                        UPDATE {QUEUE_TABLE} SET state = 'failed', error = $4
+                        WHERE stage = $1 AND wallet_id = $2 AND owner = $3
+                        """,
+                        stage,
+                        wallet_id,
+                        self.worker_id,
+                        str(error) or repr(error),
+                    )
+                    raise
+                await conn.execute(
+                    f"""
+                    UPDATE {QUEUE_TABLE} SET state = 'done', finished = now()
+                    WHERE stage = $1 AND wallet_id = $2 AND owner = $3
+                    """,
+                    stage,
+                    wallet_id,
+                    self.worker_id,
+                )
+        finally:
+            await conn.close()
+
+    async def run(
+        self,
+        stages: Sequence[str],
+        prepare: Callable[[], Awaitable[Dict[str, Dict[str, float]]]],
+        migrate: Dict[str, Callable[[str], Awaitable[None]]],
+        finish: Optional[Dict[str, Callable[[], Awaitable[None]]]] = None,
+        workers: int = 1,
+    ):
+        """Migrate claimed wallets until every stage is finished.
+
+        `migrate` holds the function migrating one wallet for each stage,
+        and `finish` the optional finishing step of each stage. Up to
+        `workers` wallets are migrated at a time by this process.
+        """
+        # The queue database is created on first use
+        conn = await PgMWSTConnection(self.uri).connect_create_if_not_exists(
+            urlparse(self.uri)
+        )
+        try:
+            await self.create(conn, stages, prepare)
+        finally:
+            await conn.close()
+        print(f"Claiming wallets as {self.worker_id}")
+
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        tasks = [
+            asyncio.ensure_future(self._work(migrate, finish or {}))
+            for _ in range(max(1, workers))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
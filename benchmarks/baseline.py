@@ -0,0 +1,79 @@
+"""JSON baselines for benchmark results."""
+
+import json
+import os
+import platform
+import sys
+from typing import Dict, List
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def environment() -> dict:
+    """Describe the machine a baseline was recorded on."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, results: Dict[str, Dict[str, float]]):
+    """Write results (a rate per metric, per case) as a named baseline."""
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), "w") as baseline:
+        json.dump(
+            {
+                "environment": environment(),
+                "results": {
+                    case: {metric: round(rate, 1) for metric, rate in metrics.items()}
+                    for case, metrics in results.items()
+                },
+            },
+            baseline,
+            indent=2,
+            sort_keys=True,
+        )
+        baseline.write("\n")
+
+
+def load_baseline(name: str) -> Dict[str, Dict[str, float]]:
+    with open(baseline_path(name)) as baseline:
+        return json.load(baseline)["results"]
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """List the rates that fell more than tolerance below the baseline.
+
+    Rates are higher-is-better. Cases or metrics missing from either side
+    are not compared.
+    """
+    regressions = []
+    for case, metrics in results.items():
+        for metric, rate in metrics.items():
+            expected = baseline.get(case, {}).get(metric)
+            if expected and rate < expected * (1 - tolerance):
+                regressions.append(
+                    f"{case} {metric}: {rate:.0f}/s, baseline {expected:.0f}/s "
+                    f"({rate / expected - 1:+.0%})"
+                )
+    return regressions
+
+
+def report(results: Dict[str, Dict[str, float]], unit: str = "items/s"):
+    """Print results as a table."""
+    for case, metrics in results.items():
+        print(case)
+        width = max(len(metric) for metric in metrics)
+        for metric, rate in metrics.items():
+            print(f"  {metric:<{width}}  {rate:>12.0f} {unit}")
+    sys.stdout.flush()
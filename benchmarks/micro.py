@@ -0,0 +1,385 @@
+"""Micro-benchmarks for the Strategy crypto primitives.
+
+Times the reference implementations of the per-item hot path, along with
+the batch ciphers used by the migration, over rows with 0, 5 and 50 tags
+and values from 100 B to 50 KB:
+
+    python -m benchmarks.micro --save-baseline micro
+    python -m benchmarks.micro --compare micro
+
+Before timing, a differential check verifies that every variant produces
+the same output as the reference implementation.
+"""
+
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from acapy_wallet_upgrade.generate import IndyEncryptor, WalletShape
+from acapy_wallet_upgrade.records import AskarRow, DecryptedItem
+from acapy_wallet_upgrade.strategies import (
+    CHACHAPOLY_KEY_LEN,
+    CHACHAPOLY_NONCE_LEN,
+    INDY_KEY_NAMES,
+    AskarCipher,
+    DbpwStrategy,
+    IndyCipher,
+)
+
+from .baseline import compare, load_baseline, report, save_baseline
+
+TAG_COUNTS = (0, 5, 50)
+VALUE_SIZES = (100, 1000, 10000, 50000)
+PROFILE_KEY_NAMES = ("ick", "ink", "ihk", "tnk", "tvk", "thk")
+
+
+def as_fetched(row: tuple) -> tuple:
+    """Format IndyEncryptor.encrypt_items output like a fetched Indy row."""
+
+    def tags(pairs):
+        return ",".join(f"{name.hex()}:{value.hex()}" for name, value in pairs) or None
+
+    return (
+        (row[0],) + tuple(bytes(col) for col in row[1:5]) + (tags(row[5]), tags(row[6]))
+    )
+
+
+def value_key(category: bytes, name: bytes, hmac_key: bytes) -> bytes:
+    """Askar item value key, as derived by Strategy.encrypt_value."""
+    hasher = hmac.HMAC(hmac_key, digestmod=hashlib.sha256)
+    for part in (category, name):
+        hasher.update(len(part).to_bytes(4, "big"))
+        hasher.update(part)
+    return hasher.digest()
+
+
+class Fixture:
+    """Encrypted and plaintext items of one shape, with their keys."""
+
+    def __init__(self, tags: int, value_size: int, rows: int, b64: bool = False):
+        """Initialize a Fixture instance."""
+        self.strategy = DbpwStrategy(None, "bench", "bench", rows)
+        self.b64 = b64
+        self.indy_key = {
+            name: os.urandom(CHACHAPOLY_KEY_LEN) for name in INDY_KEY_NAMES
+        }
+        self.profile_key = {
+            name: os.urandom(CHACHAPOLY_KEY_LEN) for name in PROFILE_KEY_NAMES
+        }
+        plaintext_tags = tags // 5
+        shape = WalletShape(
+            items=rows + 1,
+            tags=tags - plaintext_tags,
+            plaintext_tags=plaintext_tags,
+            min_value_size=value_size,
+            max_value_size=value_size,
+            categories={"connection": 1.0},
+            seed=tags * value_size,
+        )
+        # The first generated item is the wallet's master secret
+        self.items: List[DecryptedItem] = list(shape.generate())[1:]
+        self.rows = [
+            as_fetched(row)
+            for row in IndyEncryptor(self.indy_key, b64).encrypt_items(self.items)
+        ]
+        self.value_keys = [
+            self.strategy.decrypt_merged(row[4], self.indy_key["value"])
+            for row in self.rows
+        ]
+        self.credentials = [
+            {
+                "schema_id": "Th7MpTaRZVRYnPiabds81Y:2:schema:1.0",
+                "cred_def_id": "Th7MpTaRZVRYnPiabds81Y:3:CL:12:default",
+                "rev_reg_id": None,
+                "values": {
+                    f"attr {index}": {"raw": f"value {item.id}", "encoded": "1"}
+                    for index in range(tags)
+                },
+            }
+            for item in self.items
+        ]
+
+    def cases(self) -> Dict[str, Dict[str, Callable[[], object]]]:
+        """Benchmarked functions by case, then by variant."""
+        strategy = self.strategy
+        indy_key = self.indy_key
+        profile_key = self.profile_key
+        items = self.items
+        rows = self.rows
+
+        def decrypt_tags():
+            return [
+                list(
+                    strategy.decrypt_tags(
+                        row[5], indy_key["tag_name"], indy_key["tag_value"]
+                    )
+                )
+                for row in rows
+                if row[5]
+            ]
+
+        def decrypt_tags_cipher():
+            cipher = IndyCipher(indy_key)
+            result = []
+            for row in rows:
+                if row[5]:
+                    item = DecryptedItem(row[0], b"", b"", None, [], [], [])
+                    cipher._decrypt_tags(item, row[5], 0, cipher._tag_value_key)
+                    result.append(list(zip(item.tag_names, item.tag_values)))
+            return result
+
+        def encrypt_value():
+            cipher = AskarCipher(profile_key)
+            return [
+                cipher._encrypt_value(
+                    item.type, item.name, item.value, os.urandom(CHACHAPOLY_NONCE_LEN)
+                )
+                for item in items
+            ]
+
+        return {
+            "encrypt_merged": {
+                "reference": lambda: [
+                    strategy.encrypt_merged(item.value, profile_key["ick"])
+                    for item in items
+                ],
+            },
+            "decrypt_merged": {
+                "reference": lambda: [
+                    strategy.decrypt_merged(row[3], key)
+                    for row, key in zip(rows, self.value_keys)
+                ],
+            },
+            "encrypt_value": {
+                "reference": lambda: [
+                    strategy.encrypt_value(
+                        item.type, item.name, item.value, profile_key["ihk"]
+                    )
+                    for item in items
+                ],
+                "cipher": encrypt_value,
+            },
+            "decrypt_tags": {
+                "reference": decrypt_tags,
+                "cipher": decrypt_tags_cipher,
+            },
+            "decrypt_item": {
+                "reference": lambda: [
+                    strategy.decrypt_item(row, indy_key, self.b64) for row in rows
+                ],
+                "batch": lambda: IndyCipher(indy_key, self.b64).decrypt_rows(rows),
+            },
+            "update_item": {
+                "reference": lambda: [
+                    strategy.update_item(item, profile_key) for item in items
+                ],
+                "batch": lambda: AskarCipher(profile_key).encrypt_items(items),
+            },
+            "_credential_tags": {
+                "reference": lambda: [
+                    strategy._credential_tags(cred) for cred in self.credentials
+                ],
+            },
+        }
+
+    def check(self) -> List[str]:
+        """Compare each variant's output with the reference implementation."""
+        mismatches = []
+        outputs = {
+            case: {variant: run() for variant, run in variants.items()}
+            for case, variants in self.cases().items()
+        }
+
+        def differs(case: str, variant: str, expected, actual):
+            if expected != actual:
+                mismatches.append(f"{case} {variant}: output differs from reference")
+
+        for case in ("decrypt_tags", "decrypt_item"):
+            for variant, output in outputs[case].items():
+                differs(case, variant, outputs[case]["reference"], output)
+        differs(
+            "decrypt_item", "round trip", self.items, outputs["decrypt_item"]["batch"]
+        )
+
+        def values(rows: List[AskarRow]) -> List[bytes]:
+            return [
+                self.strategy.decrypt_merged(
+                    bytes(row.value),
+                    value_key(item.type, item.name, self.profile_key["ihk"]),
+                )
+                for item, row in zip(self.items, rows)
+            ]
+
+        expected = outputs["update_item"]["reference"]
+        for variant, output in outputs["update_item"].items():
+            differs(
+                "update_item",
+                variant,
+                [row._replace(value=None) for row in expected],
+                [row._replace(value=None) for row in output],
+            )
+            differs("update_item", variant, values(expected), values(output))
+
+        expected = [item.value for item in self.items]
+        for variant, output in outputs["encrypt_value"].items():
+            differs(
+                "encrypt_value",
+                variant,
+                expected,
+                values([AskarRow(0, b"", b"", value, [], [], []) for value in output]),
+            )
+
+        askar_cipher = AskarCipher(self.profile_key)
+        for item in self.items:
+            differs(
+                "encrypt_merged",
+                "cipher",
+                tuple(
+                    self.strategy.encrypt_merged(
+                        message, self.profile_key[key], self.profile_key["ihk"]
+                    )
+                    for message, key in ((item.type, "ick"), (item.name, "ink"))
+                ),
+                askar_cipher.encrypt_key(item.type, item.name),
+            )
+        indy_cipher = IndyCipher(self.indy_key, self.b64)
+        for row in self.rows:
+            differs(
+                "decrypt_merged",
+                "cipher",
+                tuple(
+                    self.strategy.decrypt_merged(enc, self.indy_key[key], self.b64)
+                    for enc, key in ((row[1], "type"), (row[2], "name"))
+                ),
+                indy_cipher.decrypt_key(row[1], row[2]),
+            )
+        return sorted(set(mismatches))
+
+
+def measure(run: Callable[[], object], count: int, min_time: float) -> float:
+    """Best items per second over repeated runs lasting at least min_time."""
+    best = None
+    total = 0.0
+    runs = 0
+    while runs < 3 or total < min_time:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        runs += 1
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best if best else 0.0
+
+
+def rows_for(value_size: int, rows: Optional[int]) -> int:
+    """Rows per fixture, fewer for larger values to bound the run time."""
+    return rows or max(20, min(500, 2_000_000 // value_size))
+
+
+def run_checks(rows: Optional[int] = None) -> List[str]:
+    mismatches = []
+    for b64 in (False, True):
+        for tags in TAG_COUNTS:
+            fixture = Fixture(tags, VALUE_SIZES[0], rows or 20, b64)
+            mismatches.extend(
+                f"tags={tags} b64={b64} {mismatch}" for mismatch in fixture.check()
+            )
+    return mismatches
+
+
+def run_benchmarks(
+    rows: Optional[int] = None, min_time: float = 0.2
+) -> Dict[str, Dict[str, float]]:
+    # Value cases depend only on the value size, tag cases only on the tag
+    # count, and item cases on both
+    value_cases = ("encrypt_merged", "decrypt_merged", "encrypt_value")
+    tag_cases = ("decrypt_tags", "_credential_tags")
+    results = {}
+    for tags in TAG_COUNTS:
+        for value_size in VALUE_SIZES:
+            fixture = Fixture(tags, value_size, rows_for(value_size, rows))
+            for case, variants in fixture.cases().items():
+                if case in value_cases:
+                    if tags != TAG_COUNTS[0]:
+                        continue
+                    name = f"{case}/value={value_size}"
+                elif case in tag_cases:
+                    if value_size != VALUE_SIZES[0] or not tags:
+                        continue
+                    name = f"{case}/tags={tags}"
+                else:
+                    name = f"{case}/tags={tags}/value={value_size}"
+                print(f"Running {name}...", file=sys.stderr)
+                results[name] = {
+                    variant: measure(run, len(fixture.items), min_time)
+                    for variant, run in variants.items()
+                }
+    return results
+
+
+def config():
+    parser = argparse.ArgumentParser("benchmarks.micro")
+    parser.add_argument(
+        "--rows",
+        type=int,
+        help=("Rows per fixture. Scaled down for larger values by default."),
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help=("Least total time in seconds to spend on each measurement."),
+    )
+    parser.add_argument(
+        "--check-only",
+        action="store_true",
+        help=("Only run the differential check."),
+    )
+    parser.add_argument(
+        "--save-baseline",
+        metavar="NAME",
+        help=("Store the results as benchmarks/baselines/NAME.json."),
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="NAME",
+        help=("Compare the results with a stored baseline."),
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help=("Fraction below the baseline rate reported as a regression."),
+    )
+    return parser.parse_args(sys.argv[1:])
+
+
+def main(args: argparse.Namespace) -> Optional[int]:
+    mismatches = run_checks()
+    for mismatch in mismatches:
+        print(f"Mismatch: {mismatch}")
+    if mismatches:
+        return 1
+    print("Differential check passed")
+    if args.check_only:
+        return None
+
+    results = run_benchmarks(args.rows, args.min_time)
+    report(results)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return None
+
+
+if __name__ == "__main__":
+    sys.exit(main(config()))
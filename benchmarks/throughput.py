@@ -0,0 +1,428 @@
+"""End-to-end throughput benchmarks, per strategy and per stage.
+
+Migrates generated wallets of several sizes with each strategy and reports
+items per second for the item phase stages (fetch, decrypt, encrypt, write
+and delete), for each step of the Askar phase, and for the run as a whole.
+
+    python -m benchmarks.throughput --sizes 1000,10000 --save-baseline local
+    python -m benchmarks.throughput --sizes 1000,10000 --compare local
+
+The Postgres strategies run only when a server is given with --postgres;
+databases named bench_* are created and dropped on it.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+from unittest import mock
+from urllib.parse import urlparse
+
+import asyncpg
+
+from acapy_wallet_upgrade.generate import (
+    WalletShape,
+    generate_postgres,
+    generate_postgres_mwst,
+    generate_sqlite,
+)
+from acapy_wallet_upgrade.pg_connection import PgConnection, PgWallet
+from acapy_wallet_upgrade.sqlite_connection import SqliteConnection, SqliteWallet
+from acapy_wallet_upgrade.strategies import (
+    AskarCipher,
+    DbpwStrategy,
+    IndyCipher,
+    MwstAsProfilesStrategy,
+    MwstAsStoresStrategy,
+    Strategy,
+)
+
+from .baseline import compare, load_baseline, report, save_baseline
+
+WALLET_KEY = "insecure"
+
+# Steps of Strategy.convert_items_to_askar, in order
+ASKAR_STEPS = (
+    "update_keys",
+    "update_master_keys",
+    "update_dids",
+    "update_schemas",
+    "update_cred_defs",
+    "update_rev_reg_defs",
+    "update_rev_reg_keys",
+    "update_rev_reg_states",
+    "update_rev_reg_info",
+    "update_creds",
+)
+
+
+class _DeleteTimer:
+    """Connection proxy timing DELETE statements."""
+
+    def __init__(self, conn, instrument: "Instrument"):
+        self._conn = conn
+        self._instrument = instrument
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def execute(self, query: str, *args):
+        start = time.perf_counter()
+        try:
+            return await self._conn.execute(query, *args)
+        finally:
+            if query.lstrip().upper().startswith("DELETE"):
+                self._instrument.delete_time += time.perf_counter() - start
+
+
+class Instrument:
+    """Stage timings gathered by wrapping the migration's building blocks."""
+
+    def __init__(self):
+        """Initialize an Instrument instance."""
+        self.items: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+        self.delete_time = 0.0
+        self._askar_rows = 0
+
+    def add(self, stage: str, items: int, seconds: float):
+        self.items[stage] = self.items.get(stage, 0) + items
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def rates(self) -> Dict[str, float]:
+        return {
+            stage: self.items[stage] / seconds
+            for stage, seconds in self.seconds.items()
+            if seconds > 0 and self.items[stage]
+        }
+
+    def _timed(self, stage: str, method):
+        instrument = self
+
+        @functools.wraps(method)
+        def wrapper(self, items, *args, **kwargs):
+            start = time.perf_counter()
+            result = method(self, items, *args, **kwargs)
+            instrument.add(stage, len(items), time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    def _fetch(self, method):
+        instrument = self
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            batches = method(self, *args, **kwargs)
+
+            async def timed():
+                batch_size = None
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        rows = await batches.asend(batch_size)
+                    except StopAsyncIteration:
+                        return
+                    instrument.add("fetch", len(rows), time.perf_counter() - start)
+                    batch_size = yield rows
+
+            return timed()
+
+        return wrapper
+
+    def _write(self, method, conn_attr: str):
+        instrument = self
+
+        @functools.wraps(method)
+        async def wrapper(self, items):
+            conn = getattr(self, conn_attr)
+            setattr(self, conn_attr, _DeleteTimer(conn, instrument))
+            instrument.delete_time = 0.0
+            start = time.perf_counter()
+            try:
+                return await method(self, items)
+            finally:
+                elapsed = time.perf_counter() - start
+                setattr(self, conn_attr, conn)
+                instrument.add("delete", len(items), instrument.delete_time)
+                instrument.add("write", len(items), elapsed - instrument.delete_time)
+
+        return wrapper
+
+    def _fetch_all(self, method):
+        instrument = self
+
+        @functools.wraps(method)
+        async def wrapper(self, txn, category):
+            async for row in method(self, txn, category):
+                instrument._askar_rows += 1
+                yield row
+
+        return wrapper
+
+    def _step(self, stage: str, method):
+        instrument = self
+
+        @functools.wraps(method)
+        async def wrapper(self, store, *args, **kwargs):
+            instrument._askar_rows = 0
+            start = time.perf_counter()
+            result = await method(self, store, *args, **kwargs)
+            instrument.add(stage, instrument._askar_rows, time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    @contextlib.contextmanager
+    def install(self):
+        """Wrap the migration's building blocks for the duration."""
+        patches = [
+            (
+                IndyCipher,
+                "decrypt_rows",
+                self._timed("decrypt", IndyCipher.decrypt_rows),
+            ),
+            (
+                AskarCipher,
+                "encrypt_items",
+                self._timed("encrypt", AskarCipher.encrypt_items),
+            ),
+            (
+                SqliteWallet,
+                "fetch_pending_items",
+                self._fetch(SqliteWallet.fetch_pending_items),
+            ),
+            (
+                PgWallet,
+                "fetch_pending_items",
+                self._fetch(PgWallet.fetch_pending_items),
+            ),
+            (
+                SqliteWallet,
+                "update_items",
+                self._write(SqliteWallet.update_items, "_conn"),
+            ),
+            (PgWallet, "update_items", self._write(PgWallet.update_items, "_old_conn")),
+            (
+                Strategy,
+                "batched_fetch_all",
+                self._fetch_all(Strategy.batched_fetch_all),
+            ),
+        ]
+        for step in ASKAR_STEPS:
+            patches.append(
+                (
+                    Strategy,
+                    step,
+                    self._step(step.replace("update_", "", 1), getattr(Strategy, step)),
+                )
+            )
+        with contextlib.ExitStack() as stack:
+            for cls, name, wrapper in patches:
+                stack.enter_context(mock.patch.object(cls, name, wrapper))
+            yield self
+
+
+async def _drop_databases(server: str, *names: str):
+    parts = urlparse(server)
+    conn = await asyncpg.connect(
+        host=parts.hostname,
+        port=parts.port or 5432,
+        user=parts.username,
+        password=parts.password,
+        database="template1",
+    )
+    try:
+        for name in names:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{name}"')
+    finally:
+        await conn.close()
+
+
+class Benchmark:
+    """Runs one strategy against freshly generated wallets."""
+
+    def __init__(self, args: argparse.Namespace):
+        """Initialize a Benchmark instance."""
+        self.args = args
+        self.server = None
+        if args.postgres:
+            parsed = urlparse(args.postgres)
+            self.server = f"{parsed.scheme}://{parsed.netloc}"
+
+    def shape(self, items: int) -> WalletShape:
+        return WalletShape(
+            items=items,
+            tags=self.args.tags,
+            min_value_size=self.args.min_value_size,
+            max_value_size=self.args.max_value_size,
+            seed=self.args.seed,
+        )
+
+    def strategy_kwargs(self) -> dict:
+        return dict(
+            max_batch_bytes=self.args.max_batch_bytes,
+            cursor_prefetch=self.args.cursor_prefetch,
+        )
+
+    async def dbpw_sqlite(self, items: int) -> Strategy:
+        path = os.path.join(self.tmpdir, f"dbpw-{items}.db")
+        await generate_sqlite(path, WALLET_KEY, self.shape(items))
+        return DbpwStrategy(
+            SqliteConnection(f"sqlite://{path}"),
+            "wallet",
+            WALLET_KEY,
+            self.args.batch_size,
+            **self.strategy_kwargs(),
+        )
+
+    async def dbpw_postgres(self, items: int) -> Strategy:
+        await _drop_databases(self.server, "bench_dbpw")
+        uri = f"{self.server}/bench_dbpw"
+        await generate_postgres(uri, WALLET_KEY, self.shape(items))
+        self.cleanup = ("bench_dbpw",)
+        return DbpwStrategy(
+            PgConnection(uri),
+            "bench_dbpw",
+            WALLET_KEY,
+            self.args.batch_size,
+            **self.strategy_kwargs(),
+        )
+
+    def _wallet_keys(self) -> Dict[str, str]:
+        return {f"bench_wallet_{n}": WALLET_KEY for n in range(self.args.wallets)}
+
+    async def mwst_as_stores(self, items: int) -> Strategy:
+        wallet_keys = self._wallet_keys()
+        self.cleanup = ("bench_mwst", *wallet_keys)
+        await _drop_databases(self.server, *self.cleanup)
+        uri = f"{self.server}/bench_mwst"
+        await generate_postgres_mwst(
+            uri, wallet_keys, self.shape(items // len(wallet_keys))
+        )
+        return MwstAsStoresStrategy(
+            uri, wallet_keys, self.args.batch_size, **self.strategy_kwargs()
+        )
+
+    async def mwst_as_profiles(self, items: int) -> Strategy:
+        wallet_keys = self._wallet_keys()
+        self.cleanup = ("bench_mwst", "bench_base", "multitenant_sub_wallet")
+        await _drop_databases(self.server, *self.cleanup)
+        uri = f"{self.server}/bench_mwst"
+        await generate_postgres_mwst(
+            uri,
+            wallet_keys,
+            self.shape(items // (len(wallet_keys) + 1)),
+            ("bench_base", WALLET_KEY),
+        )
+        return MwstAsProfilesStrategy(
+            uri,
+            "bench_base",
+            WALLET_KEY,
+            self.args.batch_size,
+            **self.strategy_kwargs(),
+        )
+
+    async def run(self, case: str, items: int) -> Dict[str, float]:
+        """Generate wallets for a case, migrate them and return the rates."""
+        self.cleanup = ()
+        strategy = await getattr(self, case.replace("-", "_"))(items)
+        instrument = Instrument()
+        output = open(os.devnull, "w") if not self.args.verbose else sys.stdout
+        try:
+            with instrument.install(), contextlib.redirect_stdout(output):
+                start = time.perf_counter()
+                await strategy.run()
+                elapsed = time.perf_counter() - start
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            if self.cleanup:
+                await _drop_databases(self.server, *self.cleanup)
+        return {"total": items / elapsed, **instrument.rates()}
+
+    async def run_all(self) -> Dict[str, Dict[str, float]]:
+        cases = ["dbpw-sqlite"]
+        if self.server:
+            cases += ["dbpw-postgres", "mwst-as-stores", "mwst-as-profiles"]
+        if self.args.strategy:
+            cases = [case for case in cases if case.startswith(self.args.strategy)]
+        results = {}
+        with tempfile.TemporaryDirectory() as self.tmpdir:
+            for case in cases:
+                for items in self.args.sizes:
+                    name = f"{case}-{items}"
+                    print(f"Running {name}...", file=sys.stderr)
+                    results[name] = await self.run(case, items)
+        return results
+
+
+def config():
+    parser = argparse.ArgumentParser("benchmarks.throughput")
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1000, 10000],
+        help=("Comma-separated numbers of items to migrate per case."),
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=["dbpw", "mwst-as-stores", "mwst-as-profiles"],
+        help=("Only run the cases of one strategy."),
+    )
+    parser.add_argument(
+        "--postgres",
+        type=str,
+        help=("URI of a Postgres server for the Postgres cases."),
+    )
+    parser.add_argument("--wallets", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--max-batch-bytes", type=int)
+    parser.add_argument("--cursor-prefetch", type=int)
+    parser.add_argument("--tags", type=int, default=5)
+    parser.add_argument("--min-value-size", type=int, default=100)
+    parser.add_argument("--max-value-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--save-baseline",
+        metavar="NAME",
+        help=("Store the results as benchmarks/baselines/NAME.json."),
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="NAME",
+        help=("Compare the results with a stored baseline."),
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help=("Fraction below the baseline rate reported as a regression."),
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help=("Show migration output.")
+    )
+    return parser.parse_args(sys.argv[1:])
+
+
+def main(args: argparse.Namespace) -> Optional[int]:
+    results = asyncio.run(Benchmark(args).run_all())
+    report(results)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return None
+
+
+if __name__ == "__main__":
+    sys.exit(main(config()))
@@ -0,0 +1,46 @@
+import sys
+
+import pytest
+
+from acapy_wallet_upgrade.strategies import AskarCipher
+from benchmarks.baseline import compare
+from benchmarks.micro import Fixture, run_checks
+from benchmarks.throughput import Benchmark, config
+
+
+def test_compare_reports_regressions_beyond_tolerance():
+    baseline = {"case": {"fetch": 1000.0, "write": 1000.0, "delete": 1000.0}}
+    results = {
+        "case": {"fetch": 850.0, "write": 700.0, "new": 1.0},
+        "other": {"fetch": 1.0},
+    }
+    regressions = compare(results, baseline, 0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("case write: 700/s, baseline 1000/s")
+
+
+def test_micro_differential_check():
+    assert run_checks(rows=5) == []
+
+
+def test_micro_differential_check_detects_mismatch(monkeypatch):
+    encrypt_items = AskarCipher.encrypt_items
+
+    def broken(self, items):
+        return [
+            row._replace(tag_values=row.tag_values[:-1])
+            for row in encrypt_items(self, items)
+        ]
+
+    monkeypatch.setattr(AskarCipher, "encrypt_items", broken)
+    assert Fixture(5, 100, 5).check() == [
+        "update_item batch: output differs from reference"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_throughput_sqlite(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["benchmarks.throughput", "--sizes", "30"])
+    results = await Benchmark(config()).run_all()
+    assert list(results) == ["dbpw-sqlite-30"]
+    assert results["dbpw-sqlite-30"]["total"] > 0
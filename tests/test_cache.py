@@ -0,0 +1,83 @@
+import os
+
+from acapy_wallet_upgrade.cache import LRUCache
+from acapy_wallet_upgrade.records import DecryptedItem
+from acapy_wallet_upgrade.strategies import AskarCipher, DbpwStrategy, IndyCipher
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert len(cache) == 2
+    assert cache.hits == 3
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.75
+
+
+def test_askar_cipher_caches_category_and_tags():
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    key = {name: os.urandom(32) for name in ("ick", "ink", "ihk", "tnk", "tvk", "thk")}
+    cipher = AskarCipher(key)
+    items = [
+        DecryptedItem(
+            i,
+            b"connection",
+            f"name-{i}".encode(),
+            b"value",
+            [0, 1],
+            [b"state", b"role"],
+            [b"active", b"inviter"],
+        )
+        for i in range(3)
+    ]
+    for item, result in zip(items, cipher.encrypt_items(items)):
+        expected = strategy.update_item(item, key)
+        assert result.category == expected.category
+        assert result.name == expected.name
+        assert result.tag_names == expected.tag_names
+        assert result.tag_values == expected.tag_values
+    assert cipher.cache.hits == 8
+    assert cipher.cache.misses == 4
+
+
+def test_indy_cipher_caches_type_and_tags():
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    keys = {
+        name: os.urandom(32)
+        for name in (
+            "type",
+            "name",
+            "value",
+            "item_hmac",
+            "tag_name",
+            "tag_value",
+            "tag_hmac",
+        )
+    }
+
+    def encrypt(value, key, hmac_key):
+        return strategy.encrypt_merged(value, keys[key], keys[hmac_key])
+
+    item_key = os.urandom(32)
+    tag_name = encrypt(b"state", "tag_name", "tag_hmac").hex()
+    tag_value = encrypt(b"active", "tag_value", "tag_hmac").hex()
+    row = (
+        1,
+        encrypt(b"connection", "type", "item_hmac"),
+        encrypt(b"name", "name", "item_hmac"),
+        strategy.encrypt_merged(b"value", item_key),
+        strategy.encrypt_merged(item_key, keys["value"]),
+        f"{tag_name}:{tag_value}",
+        f"{tag_name}:{b'plain'.hex()}",
+    )
+    cipher = IndyCipher(keys)
+    expected = strategy.decrypt_item(row, keys)
+    assert cipher.decrypt_rows([row, row]) == [expected, expected]
+    assert cipher.cache.misses == 3
+    assert cipher.cache.hits == 5
@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import os
+
+import pytest
+
+from acapy_wallet_upgrade import strategies
+from acapy_wallet_upgrade.error import UpgradeError
+from acapy_wallet_upgrade.records import DecryptedItem
+from acapy_wallet_upgrade.strategies import (
+    INDY_KEY_NAMES,
+    AskarCipher,
+    DbpwStrategy,
+    IndyCipher,
+)
+
+
+@pytest.fixture(params=["cffi", "bindings"])
+def sodium(request, monkeypatch):
+    # The public PyNaCl bindings stand in if the cffi module is unavailable
+    if request.param == "bindings":
+        monkeypatch.setattr(strategies, "ffi", None)
+
+
+def make_row(strategy, keys, row_id, b64=False):
+    def encrypt(value, key, hmac_key):
+        enc = strategy.encrypt_merged(value, keys[key], keys[hmac_key])
+        return base64.b64encode(enc) if b64 else enc
+
+    item_key = os.urandom(32)
+    tag_name = strategy.encrypt_merged(b"state", keys["tag_name"], keys["tag_hmac"])
+    tag_value = strategy.encrypt_merged(b"active", keys["tag_value"], keys["tag_hmac"])
+    return (
+        row_id,
+        encrypt(b"connection", "type", "item_hmac"),
+        encrypt(f"name-{row_id}".encode(), "name", "item_hmac"),
+        strategy.encrypt_merged(b"value" * row_id, item_key),
+        strategy.encrypt_merged(item_key, keys["value"]),
+        f"{tag_name.hex()}:{tag_value.hex()}",
+        f"{tag_name.hex()}:{b'plain'.hex()}",
+    )
+
+
+def test_indy_cipher_matches_reference(sodium):
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    keys = {name: os.urandom(32) for name in INDY_KEY_NAMES}
+    for b64 in (False, True):
+        rows = [make_row(strategy, keys, row_id, b64) for row_id in range(1, 5)]
+        cipher = IndyCipher(keys, b64=b64)
+        for row, result in zip(rows, cipher.decrypt_rows(rows)):
+            assert result == strategy.decrypt_item(row, keys, b64)
+
+
+def test_decrypt_truncated(sodium):
+    key = strategies._cipher_key(os.urandom(32))
+    enc = strategies._encrypt_view(b"value", os.urandom(12), key)
+    for length in (0, 12, 20, 27, len(enc) - 1):
+        with pytest.raises(UpgradeError):
+            strategies._decrypt_view(bytes(enc[:length]), key)
+    assert strategies._decrypt_view(bytes(enc), key) == b"value"
+
+
+def test_askar_cipher_matches_reference(sodium):
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    key = {name: os.urandom(32) for name in ("ick", "ink", "ihk", "tnk", "tvk", "thk")}
+    items = [
+        DecryptedItem(
+            i,
+            b"connection",
+            f"name-{i}".encode(),
+            b"value",
+            [0, 1],
+            [b"a", b"c"],
+            [b"b", b"d"],
+        )
+        for i in range(5)
+    ]
+    cipher = AskarCipher(key)
+    for item, row in zip(items, cipher.encrypt_items(items)):
+        expected = strategy.update_item(item, key)
+        assert row[:3] == expected[:3]
+        assert row[4:] == expected[4:]
+        hasher = hmac.HMAC(key["ihk"], digestmod=hashlib.sha256)
+        for part in (item.type, item.name):
+            hasher.update(len(part).to_bytes(4, "big"))
+            hasher.update(part)
+        assert strategy.decrypt_merged(bytes(row.value), hasher.digest()) == item.value
+
+
+def test_cipher_keys_match_reference(sodium):
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    keys = {name: os.urandom(32) for name in INDY_KEY_NAMES}
+    profile_key = strategy.profile_key(keys)
+    row = make_row(strategy, keys, 3, b64=True)
+    item_type, item_name = IndyCipher(keys, b64=True).decrypt_key(row[1], row[2])
+    assert (item_type, item_name) == (b"connection", b"name-3")
+    category, name = AskarCipher(profile_key).encrypt_key(item_type, item_name)
+    expected = AskarCipher(profile_key).encrypt_items(
+        [DecryptedItem(3, item_type, item_name, b"", [], [], [])]
+    )[0]
+    assert (category, name) == (expected.category, expected.name)
@@ -0,0 +1,42 @@
+import hashlib
+import os
+
+import pytest
+
+from acapy_wallet_upgrade.estimate import Estimator
+from acapy_wallet_upgrade.generate import WalletShape, generate_sqlite
+from acapy_wallet_upgrade.sqlite_connection import SqliteConnection
+from acapy_wallet_upgrade.strategies import ASKAR_CATEGORIES, DbpwStrategy
+
+
+@pytest.mark.asyncio
+async def test_dry_run_sqlite(tmp_path):
+    path = str(tmp_path / "wallet.db")
+    shape = WalletShape(items=120, tags=3, plaintext_tags=1, seed=5)
+    await generate_sqlite(path, "insecure", shape)
+    with open(path, "rb") as wallet:
+        digest = hashlib.sha256(wallet.read()).digest()
+
+    strategy = DbpwStrategy(
+        SqliteConnection(f"sqlite://{path}"), "wallet", "insecure", 20
+    )
+    timings, (estimate,) = await Estimator(strategy, sample_size=50).run()
+
+    items = list(shape.generate())
+    (wallet,) = estimate.wallets
+    assert estimate.strategy == "dbpw"
+    assert wallet.wallet == "wallet"
+    assert wallet.items == len(items)
+    assert wallet.tags == sum(len(item.tag_names) for item in items)
+    assert wallet.askar_items == sum(
+        item.type.decode() in ASKAR_CATEGORIES for item in items
+    )
+    assert timings.indy_kdf > 0 and timings.askar_kdf > 0
+    assert timings.crypto > 0 and timings.write > 0
+    assert estimate.seconds > timings.indy_kdf + timings.askar_kdf
+    assert estimate.target_bytes > 0
+    assert estimate.peak_memory_bytes > 0
+
+    with open(path, "rb") as wallet:
+        assert hashlib.sha256(wallet.read()).digest() == digest
+    assert os.listdir(tmp_path) == ["wallet.db"]
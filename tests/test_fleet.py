@@ -0,0 +1,67 @@
+import os
+
+from aries_askar import Store
+import pytest
+
+from acapy_wallet_upgrade.error import MissingWalletError, UpgradeError
+from acapy_wallet_upgrade.fleet import DbpwFleetStrategy
+from acapy_wallet_upgrade.generate import WalletShape, generate_sqlite
+
+
+async def make_fleet(directory, names):
+    for index, name in enumerate(names):
+        os.makedirs(directory / name)
+        await generate_sqlite(
+            str(directory / name / "sqlite.db"),
+            f"{name}_key",
+            WalletShape(items=20 + 10 * index, seed=index),
+        )
+
+
+def test_find_wallets(tmp_path):
+    for name in ("alice", "bob"):
+        os.makedirs(tmp_path / name)
+        (tmp_path / name / "sqlite.db").touch()
+    os.makedirs(tmp_path / "empty")
+    elsewhere = str(tmp_path / "carol.db")
+    uri = f"sqlite://{tmp_path}"
+
+    fleet = DbpwFleetStrategy(
+        uri, {"alice": "a", "bob": "b", "carol": {"key": "c", "path": elsewhere}}, 50
+    )
+    assert fleet.find_wallets() == {
+        "alice": str(tmp_path / "alice" / "sqlite.db"),
+        "bob": str(tmp_path / "bob" / "sqlite.db"),
+        "carol": elsewhere,
+    }
+    assert fleet.wallet_key("carol") == "c"
+
+    with pytest.raises(MissingWalletError):
+        DbpwFleetStrategy(uri, {"alice": "a"}, 50).find_wallets()
+    assert DbpwFleetStrategy(
+        uri, {"alice": "a"}, 50, allow_missing_wallet=True
+    ).find_wallets() == {"alice": str(tmp_path / "alice" / "sqlite.db")}
+    with pytest.raises(UpgradeError):
+        DbpwFleetStrategy(uri, {"dave": "d"}, 50).find_wallets()
+
+
+@pytest.mark.asyncio
+async def test_failed_wallet_does_not_stop_fleet(tmp_path, capsys):
+    await make_fleet(tmp_path, ("alice", "bob", "carol"))
+    fleet = DbpwFleetStrategy(
+        f"sqlite://{tmp_path}",
+        {"alice": "alice_key", "bob": "wrong", "carol": "carol_key"},
+        20,
+        fleet_workers=2,
+    )
+    with pytest.raises(UpgradeError, match="bob"):
+        await fleet.run()
+    assert "2 of 3 wallet(s) migrated, 1 failed" in capsys.readouterr().out
+
+    for name in ("alice", "carol"):
+        store = await Store.open(
+            f"sqlite://{tmp_path / name / 'sqlite.db'}", pass_key=f"{name}_key"
+        )
+        async with store.session() as session:
+            assert await session.count("master_secret") == 1
+        await store.close()
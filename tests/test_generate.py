@@ -0,0 +1,70 @@
+from collections import Counter
+import os
+
+from aries_askar import Store
+import pytest
+
+from acapy_wallet_upgrade.__main__ import main
+from acapy_wallet_upgrade.generate import IndyEncryptor, WalletShape, generate_sqlite
+from acapy_wallet_upgrade.strategies import INDY_KEY_NAMES, DbpwStrategy
+
+
+def as_fetched(row):
+    """Format encrypt_items output like a fetched Indy row."""
+
+    def tags(pairs):
+        return ",".join(f"{name.hex()}:{value.hex()}" for name, value in pairs) or None
+
+    return (
+        (row[0],) + tuple(bytes(col) for col in row[1:5]) + (tags(row[5]), tags(row[6]))
+    )
+
+
+def test_encrypt_items_round_trip():
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    keys = {name: os.urandom(32) for name in INDY_KEY_NAMES}
+    items = list(WalletShape(items=50, tags=3, plaintext_tags=2, seed=1).generate())
+    for b64 in (False, True):
+        cipher = IndyEncryptor(keys, b64=b64)
+        rows = [as_fetched(row) for row in cipher.encrypt_items(items)]
+        for item, row in zip(items, rows):
+            assert strategy.decrypt_item(row, keys, b64) == item
+
+
+def test_shape():
+    shape = WalletShape(items=200, min_value_size=500, max_value_size=500, seed=7)
+    items = list(shape.generate(start_id=11))
+    assert len(items) == 200
+    assert [item.id for item in items] == list(range(11, 211))
+    assert len({(item.type, item.name) for item in items}) == 200
+    assert items == list(shape.generate(start_id=11))
+
+    categories = Counter(item.type for item in items)
+    assert categories[b"Indy::MasterSecret"] == 1
+    assert categories[b"Indy::Key"] == categories[b"Indy::Did"]
+    assert categories[b"Indy::CredentialDefinition"] == categories[b"Indy::SchemaId"]
+    for item in items:
+        if item.type in (b"connection", b"Indy::Credential"):
+            assert len(item.value) == 500
+            assert item.tag_plaintext == [0] * 5 + [1]
+
+
+@pytest.mark.asyncio
+async def test_generated_sqlite_wallet_migrates(tmp_path):
+    path = str(tmp_path / "wallet.db")
+    shape = WalletShape(items=100, seed=3)
+    await generate_sqlite(path, "insecure", shape)
+    expected = Counter(item.type for item in shape.generate())
+
+    await main("dbpw", f"sqlite://{path}", "wallet", "insecure", batch_size=20)
+
+    store = await Store.open(f"sqlite://{path}", pass_key="insecure")
+    async with store.session() as session:
+        assert await session.count("connection") == expected[b"connection"]
+        assert await session.count("credential") == expected[b"Indy::Credential"]
+        assert await session.count("did") == expected[b"Indy::Did"]
+        assert await session.count("master_secret") == 1
+        connection = (await session.fetch_all("connection", limit=1))[0]
+        assert connection.tags["~plain_0"].isdigit()
+        assert not await session.count("Indy::Credential")
+    await store.close()
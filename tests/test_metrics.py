@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from acapy_wallet_upgrade.metrics import Metrics
+
+
+def test_counters_and_histograms_by_label():
+    metrics = Metrics()
+    metrics.inc("rows_total", 10, stage="items")
+    with metrics.wallet("alice"):
+        metrics.inc("rows_total", 5, stage="items")
+        metrics.inc("rows_total", 2, stage="items")
+        metrics.observe("batch_seconds", 0.002, stage="fetch")
+        metrics.observe("batch_seconds", 3.0, stage="fetch")
+    metrics.observe("batch_seconds", 100.0, stage="fetch")
+
+    report = metrics.report()
+    assert report["counters"]["rows_total"] == [
+        {"labels": {"stage": "items"}, "value": 10},
+        {"labels": {"stage": "items", "wallet": "alice"}, "value": 7},
+    ]
+    alice, other = report["histograms"]["batch_seconds"]
+    assert alice["labels"] == {"stage": "fetch", "wallet": "alice"}
+    assert alice["count"] == 2
+    assert alice["buckets"][0.005] == 1
+    assert alice["buckets"][5.0] == 1
+    assert other["count"] == 1
+    assert sum(other["buckets"].values()) == 0
+
+
+def test_prometheus_format():
+    metrics = Metrics()
+    metrics.inc("rows_total", 3, stage="askar", category='Indy::"Key"')
+    metrics.observe("kdf_seconds", 0.3, stage="indy")
+    lines = metrics.prometheus().splitlines()
+    assert "# TYPE askar_upgrade_rows_total counter" in lines
+    assert (
+        'askar_upgrade_rows_total{category="Indy::\\"Key\\"",stage="askar"} 3' in lines
+    )
+    assert 'askar_upgrade_kdf_seconds_bucket{stage="indy",le="0.25"} 0' in lines
+    assert 'askar_upgrade_kdf_seconds_bucket{stage="indy",le="0.5"} 1' in lines
+    assert 'askar_upgrade_kdf_seconds_bucket{stage="indy",le="+Inf"} 1' in lines
+    assert 'askar_upgrade_kdf_seconds_count{stage="indy"} 1' in lines
+
+
+@pytest.mark.asyncio
+async def test_serve():
+    metrics = Metrics()
+    metrics.inc("rows_total", stage="items")
+    async with metrics.serve(0) as server:
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+    assert response.startswith(b"HTTP/1.0 200 OK")
+    assert b'askar_upgrade_rows_total{stage="items"} 1' in response
@@ -0,0 +1,63 @@
+import hashlib
+
+import pytest
+
+from acapy_wallet_upgrade.__main__ import main
+from acapy_wallet_upgrade.error import UpgradeError
+from acapy_wallet_upgrade.generate import WalletShape, generate_sqlite, new_indy_keys
+from acapy_wallet_upgrade.strategies import DbpwStrategy
+
+
+class MetadataWallet:
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    async def get_metadata(self):
+        return self.metadata
+
+
+@pytest.mark.asyncio
+async def test_verify_keys_reports_every_bad_key():
+    alice, _ = new_indy_keys("alice key")
+    bob, _ = new_indy_keys("bob key")
+    carol, _ = new_indy_keys("carol key")
+    strategy = DbpwStrategy(None, "test", "test", 10, preflight_workers=2)
+
+    with pytest.raises(UpgradeError) as error:
+        await strategy.verify_keys(
+            {"alice": alice, "bob": bob, "carol": carol},
+            {"alice": "alice key", "bob": "wrong", "carol": None, "dave": "key"},
+        )
+    assert str(error.value).splitlines()[1:] == [
+        "  bob: incorrect wallet key",
+        "  carol: no wallet key",
+        "  dave: wallet not found in database",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_verified_keys_are_reused():
+    alice, keys = new_indy_keys("alice key")
+    strategy = DbpwStrategy(None, "test", "test", 10)
+    await strategy.verify_keys({"alice": alice}, {"alice": "alice key"})
+
+    def derive(*args):
+        raise AssertionError("Key derived twice")
+
+    strategy.unlock_indy_key = derive
+    indy_key = await strategy.fetch_indy_key(MetadataWallet(alice), "alice key")
+    assert {name: indy_key[name] for name in keys} == keys
+
+
+@pytest.mark.asyncio
+async def test_incorrect_key_fails_before_modifying_wallet(tmp_path):
+    path = str(tmp_path / "wallet.db")
+    await generate_sqlite(path, "insecure", WalletShape(items=10, seed=1))
+    with open(path, "rb") as wallet:
+        digest = hashlib.sha256(wallet.read()).digest()
+
+    with pytest.raises(UpgradeError, match="wallet: incorrect wallet key"):
+        await main("dbpw", f"sqlite://{path}", "wallet", "wrong")
+
+    with open(path, "rb") as wallet:
+        assert hashlib.sha256(wallet.read()).digest() == digest
@@ -1,4 +1,11 @@
-from acapy_wallet_upgrade.strategies import Progress
+import io
+import json
+import queue
+import time
+
+from acapy_wallet_upgrade.metrics import wallet_scope
+from acapy_wallet_upgrade.progress import ProgressTracker, worker_pool, worker_progress
+from acapy_wallet_upgrade.strategies import DbpwStrategy, Progress
 
 
 def test_progress(capsys):
@@ -11,6 +18,17 @@ def test_progress(capsys):
     assert "test 300" in captured.out
 
 
+def test_progress_quiet_with_tracker(capsys):
+    tracker = ProgressTracker("ndjson", stream=io.StringIO())
+    strategy = DbpwStrategy(None, "test", "test", 3, progress=tracker)
+    progress = strategy.progress_printer("test")
+    for _ in range(10):
+        progress.update(1)
+    progress.report()
+    assert progress.count == 10
+    assert capsys.readouterr().out == ""
+
+
 def test_progress_small(capsys):
     progress = Progress("test", interval=50)
     progress.update()
@@ -18,3 +36,65 @@ def test_progress_small(capsys):
     progress.report()
     captured = capsys.readouterr()
     assert "test 2" in captured.out
+
+
+def test_progress_tracker_text(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    stream = io.StringIO()
+    tracker = ProgressTracker("text", interval=5, stream=stream)
+    tracker.set_total("items", 1000, "alice")
+    tracker.set_total("items", 3000, "bob")
+    for _ in range(10):
+        clock[0] += 1
+        tracker.update("items", 100, "alice")
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[-1] == (
+        "Progress: alice items 600/1000 (60%) 100 items/s ETA 0:00:04"
+        " | overall 600/4000 (15%) 100 items/s ETA 0:00:34"
+    )
+
+
+def test_progress_tracker_ndjson_with_remote_updates():
+    stream = io.StringIO()
+    tracker = ProgressTracker("ndjson", interval=0, stream=stream)
+    updates = queue.Queue()
+    listener = tracker.listen(updates)
+    remote = tracker.remote(updates)
+    with wallet_scope("alice"):
+        remote.set_total("items", 10)
+        for _ in range(5):
+            remote.update("items", 2)
+    remote.finish()
+    updates.put(None)
+    listener.join()
+    tracker.finish()
+
+    record = json.loads(stream.getvalue().splitlines()[-1])
+    assert record["final"]
+    assert record["wallets"] == [
+        {
+            "wallet": "alice",
+            "stage": "items",
+            "done": 10,
+            "total": 10,
+            "rate": record["wallets"][0]["rate"],
+            "eta": record["wallets"][0]["eta"],
+        }
+    ]
+    assert record["overall"]["done"] == 10
+
+
+def report_items(amount):
+    progress = worker_progress()
+    progress.update("items", amount, "alice")
+    progress.flush()
+    return amount
+
+
+def test_worker_pool_relays_progress():
+    tracker = ProgressTracker("ndjson", stream=io.StringIO())
+    with worker_pool(2, tracker) as pool:
+        assert list(pool.map(report_items, [1, 2, 3])) == [1, 2, 3]
+    assert tracker._entry(("alice", "items")).done == 6
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+from datetime import datetime, timezone
+import time
+
+import pytest
+
+from acapy_wallet_upgrade.scheduling import CostModel, WalletScheduler, parse_deadline
+
+MODEL = CostModel(wallet=0, item=1, byte=0)
+
+
+def test_largest_first_makespan():
+    sizes = {"a": (2, 0), "b": (3, 0), "c": (2, 0), "d": (3, 0), "e": (10, 0)}
+    scheduler = WalletScheduler(sizes, workers=2, model=MODEL)
+    assert scheduler.order(list(sizes)) == ["e", "b", "d", "a", "c"]
+    # e runs alone on one worker while the others share the second
+    assert scheduler.makespan(list(sizes)) == 10
+    assert WalletScheduler(sizes, workers=1, model=MODEL).makespan(list(sizes)) == 20
+    assert WalletScheduler(sizes, workers=9, model=MODEL).makespan(list(sizes)) == 10
+
+
+@pytest.mark.asyncio
+async def test_run_on_workers():
+    sizes = {"small": (1, 0), "large": (5, 0), "medium": (3, 0)}
+    scheduler = WalletScheduler(sizes, workers=2, model=MODEL)
+    started = []
+    workers = []
+
+    @contextlib.asynccontextmanager
+    async def worker():
+        workers.append(len(workers))
+        yield workers[-1]
+
+    async def migrate(resource, wallet):
+        started.append((wallet, resource))
+        await asyncio.sleep(sizes[wallet][0] / 1000)
+
+    await scheduler.run(list(sizes), migrate, worker)
+    assert started == [("large", 0), ("medium", 1), ("small", 1)]
+
+
+@pytest.mark.asyncio
+async def test_failure_cancels_workers():
+    sizes = {"slow": (5, 0), "bad": (1, 0)}
+    scheduler = WalletScheduler(sizes, workers=2, model=MODEL)
+    finished = []
+
+    async def migrate(_, wallet):
+        if wallet == "bad":
+            raise ValueError(wallet)
+        await asyncio.sleep(1)
+        finished.append(wallet)
+
+    with pytest.raises(ValueError):
+        await scheduler.run(list(sizes), migrate)
+    assert not finished
+
+
+@pytest.mark.asyncio
+async def test_deadline_defers_wallets():
+    sizes = {"huge": (100, 0), "large": (5, 0), "small": (1, 0)}
+    # One modelled unit is a second: only wallets up to 10 fit
+    scheduler = WalletScheduler(
+        sizes, workers=1, model=MODEL, deadline=time.time() + 10
+    )
+    started = []
+
+    async def migrate(_, wallet):
+        started.append(wallet)
+
+    await scheduler.run(list(sizes), migrate)
+    assert started == ["large", "small"]
+    assert scheduler.deferred == ["huge"]
+
+
+@pytest.mark.asyncio
+async def test_deadline_calibrates_on_finished_wallets():
+    sizes = {"first": (4, 0), "second": (3, 0)}
+    scheduler = WalletScheduler(sizes, workers=1, model=MODEL, deadline=time.time())
+    assert not scheduler.fits("second")
+    scheduler.deadline = time.time() + 5
+    started = []
+
+    async def migrate(_, wallet):
+        started.append(wallet)
+
+    # Wallets take far less time than modelled, so the second one fits
+    await scheduler.run(list(sizes), migrate)
+    assert started == ["first", "second"]
+    assert scheduler.expected("second") < 1
+
+
+def test_parse_deadline():
+    now = datetime(2024, 5, 1, 22, 30, tzinfo=timezone.utc)
+    assert (
+        parse_deadline("04:00", now)
+        == datetime(2024, 5, 2, 4, 0, tzinfo=timezone.utc).timestamp()
+    )
+    assert (
+        parse_deadline("23:00", now)
+        == datetime(2024, 5, 1, 23, 0, tzinfo=timezone.utc).timestamp()
+    )
+    assert (
+        parse_deadline("2024-05-02T04:00:00+00:00", now)
+        == datetime(2024, 5, 2, 4, 0, tzinfo=timezone.utc).timestamp()
+    )
+    with pytest.raises(ValueError):
+        parse_deadline("tomorrow", now)
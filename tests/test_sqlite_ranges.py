@@ -0,0 +1,42 @@
+import os
+
+from aries_askar import Store
+import pytest
+
+from acapy_wallet_upgrade.generate import WalletShape, generate_sqlite
+from acapy_wallet_upgrade.sqlite_connection import SqliteConnection
+from acapy_wallet_upgrade.sqlite_ranges import DbpwRangesStrategy
+from acapy_wallet_upgrade.strategies import DbpwStrategy
+
+CATEGORIES = ("connection", "credential", "did", "master_secret", "oob_record")
+
+
+async def migrated_entries(path: str) -> dict:
+    store = await Store.open(f"sqlite://{path}", pass_key="insecure")
+    entries = {}
+    async with store.session() as session:
+        for category in CATEGORIES:
+            for entry in await session.fetch_all(category):
+                entries[(category, entry.name)] = (entry.value, entry.tags)
+    await store.close()
+    return entries
+
+
+@pytest.mark.asyncio
+async def test_migrate_ranges_matches_serial(tmp_path):
+    serial = str(tmp_path / "serial.db")
+    ranges = str(tmp_path / "ranges.db")
+    for path in (serial, ranges):
+        await generate_sqlite(path, "insecure", WalletShape(items=60, seed=1))
+
+    await DbpwStrategy(
+        SqliteConnection(f"sqlite://{serial}"), "alice", "insecure", 10
+    ).run()
+    await DbpwRangesStrategy(
+        SqliteConnection(f"sqlite://{ranges}"), "alice", "insecure", 10, readers=3
+    ).run()
+
+    assert not [name for name in os.listdir(tmp_path) if ".range" in name]
+    expected = await migrated_entries(serial)
+    assert expected
+    assert await migrated_entries(ranges) == expected
@@ -0,0 +1,87 @@
+import os
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+
+from acapy_wallet_upgrade.sqlite_connection import SqliteConnection, SqliteWallet
+
+
+@pytest_asyncio.fixture
+async def wallet():
+    conn = await aiosqlite.connect(":memory:")
+    await conn.executescript(
+        """
+        CREATE TABLE items_old (
+            id INTEGER NOT NULL, type, name, value, key, PRIMARY KEY (id)
+        );
+        CREATE TABLE tags_encrypted (name, value, item_id INTEGER);
+        CREATE TABLE tags_plaintext (name, value, item_id INTEGER);
+        """
+    )
+    await conn.executemany(
+        "INSERT INTO items_old (id, type, name, value, key) VALUES (?1, '', '', ?2, '')",
+        ((i, b"x" * size) for i, size in enumerate((10, 10, 50, 10, 10, 10), 1)),
+    )
+    yield SqliteWallet(conn)
+    await conn.close()
+
+
+async def fetch_batches(wallet: SqliteWallet, batch_size: int, max_bytes: int):
+    batches = []
+    async for rows in wallet.fetch_pending_items(batch_size, max_bytes):
+        batches.append([row[0] for row in rows])
+        await wallet._conn.execute(
+            "DELETE FROM items_old WHERE id IN ({})".format(
+                ",".join(str(row[0]) for row in rows)
+            )
+        )
+    return batches
+
+
+@pytest.mark.asyncio
+async def test_fetch_pending_items_max_bytes(wallet: SqliteWallet):
+    assert await fetch_batches(wallet, 4, 25) == [[1, 2], [3], [4, 5], [6]]
+
+
+@pytest.mark.asyncio
+async def test_fetch_pending_items_max_bytes_empty_first(wallet: SqliteWallet):
+    await wallet._conn.execute("UPDATE items_old SET value = '' WHERE id = 2")
+    await wallet._conn.execute("DELETE FROM items_old WHERE id = 1")
+    assert await fetch_batches(wallet, 4, 25) == [[2], [3], [4, 5], [6]]
+
+
+@pytest.mark.asyncio
+async def test_fetch_pending_items_row_limit(wallet: SqliteWallet):
+    assert await fetch_batches(wallet, 2, 1000) == [[1, 2], [3, 4], [5, 6]]
+
+
+@pytest.mark.asyncio
+async def test_fetch_pending_items_id_range(wallet: SqliteWallet):
+    wallet._id_range = (2, 6)
+    assert await wallet.count_pending_items() == 4
+    batches = []
+    async for rows in wallet.fetch_pending_items(4, 25):
+        batches.append([row[0] for row in rows])
+    assert batches == [[2], [3], [4, 5]]
+
+
+@pytest.mark.asyncio
+async def test_compact(tmp_path):
+    path = str(tmp_path / "sqlite.db")
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value)")
+        await conn.executemany(
+            "INSERT INTO items (value) VALUES (?1)",
+            ((bytes(4000),) for _ in range(200)),
+        )
+        await conn.execute("DELETE FROM items WHERE id > 10")
+        await conn.commit()
+
+    before, after = await SqliteConnection(f"sqlite://{path}").compact()
+    assert after < before / 4
+    assert sorted(os.listdir(tmp_path)) == ["sqlite.db"]
+    async with aiosqlite.connect(path) as conn:
+        stmt = await conn.execute("SELECT COUNT(*) FROM items")
+        assert (await stmt.fetchone())[0] == 10
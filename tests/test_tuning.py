@@ -0,0 +1,41 @@
+from acapy_wallet_upgrade.tuning import AutoTuner
+
+
+def test_batch_size_grows_while_fast():
+    tuner = AutoTuner(batch_size=50, min_batch_size=10, max_batch_size=80)
+    for _ in range(10):
+        tuner.record(tuner.batch_size, 1000, 0.1, 0.1)
+    assert tuner.batch_size == 80
+
+
+def test_batch_size_shrinks_when_slow():
+    tuner = AutoTuner(batch_size=100, min_batch_size=10, target_latency=0.5)
+    tuner.record(100, 1000, 2.0, 2.0)
+    assert tuner.batch_size == 50
+    for _ in range(10):
+        tuner.record(tuner.batch_size, 1000, 2.0, 2.0)
+    assert tuner.batch_size == 10
+
+
+def test_concurrency_follows_cpu_share():
+    tuner = AutoTuner(batch_size=50, max_concurrency=3)
+    tuner.record(50, 1000, 0.1, 0.01)
+    tuner.record(50, 1000, 0.1, 0.01)
+    assert tuner.concurrency == 3
+    # Throughput collapses after the last increase
+    tuner.record(50, 1000, 0.4, 0.01)
+    assert tuner.concurrency == 1
+
+
+def test_stages_are_independent():
+    tuner = AutoTuner(batch_size=50)
+    tuner.stage("items").record(50, 1000, 5.0, 5.0)
+    assert tuner.stage("items").batch_size == 25
+    assert tuner.stage("Indy::Credential").batch_size == 50
+
+
+def test_stage_shares_concurrency():
+    tuner = AutoTuner(max_concurrency=8)
+    assert tuner.stage("a/items", 3).max_concurrency == 2
+    assert tuner.stage("b/items", 16).max_concurrency == 1
+    assert tuner.stage("items").max_concurrency == 8